@@ -0,0 +1,98 @@
+"""
+Cost of screening feedback comments (comment_screen.py) as the word list grows.
+
+For each --patterns size, builds a CommentScreen from the shipped word list
+plus that many generated words and phrases, screens --comments comments
+(feedback-like text, some with an email address, phone number or listed
+word in them) and reports
+
+    build ms        time to build the automaton, paid once per container
+    states          automaton states
+    mean/p50/p99 us time to screen one comment
+    naive us        for contrast, the mean time of checking each pattern in
+                    turn with a substring search (over --naive-comments comments)
+
+    python benchmarks/bench_comment_screen.py
+    python benchmarks/bench_comment_screen.py --patterns 0,10000,50000,100000
+
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import comment_screen  # noqa: E402
+
+WORDS = ('great', 'talk', 'demo', 'useful', 'slides', 'too', 'fast', 'clear', 'examples', 'serverless', 'speaker',
+         'the', 'was', 'really', 'and', 'but', 'a', 'bit', 'long', 'loved', 'q&a', 'lambda', 'kinesis', 'more')
+EXTRAS = ('mail me at jane.doe@example.com', 'call 07700 900123', 'that was crap', 'see www.example.com/slides',
+          'buy now', 'my number is +1 415 555 0100')
+
+
+def generate_patterns(count, seed=0):
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    patterns = []
+    for _ in range(count):
+        words = [''.join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(rng.choice((1, 1, 2)))]
+        patterns.append((' '.join(words), 'profanity'))
+    return patterns
+
+
+def generate_comments(count, seed=0):
+    rng = random.Random(seed)
+    comments = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(3, 40))]
+        if rng.random() < 0.2:
+            words.insert(rng.randint(0, len(words)), rng.choice(EXTRAS))
+        comments.append(' '.join(words).capitalize())
+    return comments
+
+
+def naive(patterns, comments):
+    phrases = [phrase for phrase, _ in patterns]
+    start = time.perf_counter()
+    for comment in comments:
+        lowered = comment.lower()
+        [phrase for phrase in phrases if phrase in lowered]
+    return (time.perf_counter() - start) / len(comments) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark comment screening against word list size.')
+    parser.add_argument('--patterns', default='0,10000,50000', help='comma separated generated pattern counts')
+    parser.add_argument('--comments', type=int, default=20000)
+    parser.add_argument('--naive-comments', type=int, default=200)
+    args = parser.parse_args()
+
+    listed = comment_screen.load_words(comment_screen.DEFAULT_WORDS)
+    comments = generate_comments(args.comments)
+    print('{:>9} {:>10} {:>9} {:>9} {:>9} {:>9} {:>10}'.format(
+        'patterns', 'build ms', 'states', 'mean us', 'p50 us', 'p99 us', 'naive us'))
+    for extra in (int(n) for n in args.patterns.split(',')):
+        patterns = listed + generate_patterns(extra)
+        start = time.perf_counter()
+        screen = comment_screen.CommentScreen(patterns)
+        build = (time.perf_counter() - start) * 1000
+
+        timings = []
+        for comment in comments:
+            start = time.perf_counter()
+            screen.screen(comment)
+            timings.append((time.perf_counter() - start) * 1e6)
+        timings.sort()
+        print('{:>9,} {:>10.1f} {:>9,} {:>9.1f} {:>9.1f} {:>9.1f} {:>10.1f}'.format(
+            screen.automaton.patterns, build, len(screen.automaton), sum(timings) / len(timings),
+            timings[len(timings) // 2], timings[int(len(timings) * 0.99)],
+            naive(patterns, comments[:args.naive_comments])))
+    print('\nscreened {:,} comments: {masked:,} masked, {rejected:,} rejected'.format(
+        len(comments), **screen.stats))
+
+
+if __name__ == '__main__':
+    main()
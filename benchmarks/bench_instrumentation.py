@@ -0,0 +1,64 @@
+"""
+Per-invocation cost of the instrumentation layer in lambda_handler.
+
+Runs the logging benchmark's Lex events through the handler with metrics
+off (span() is a no-op), with 1% of requests emitting an EMF line, and with
+every request emitting one, and reports microseconds per invocation.
+
+    python benchmarks/bench_instrumentation.py --iterations 2000
+
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_logging import run, sample_events  # noqa: E402
+from tools.handler import install_stubs, load_handler  # noqa: E402
+
+import instrumentation  # noqa: E402
+import structured_logging  # noqa: E402
+
+SCENARIOS = [
+    ('off', 'off', 0.0),
+    ('emf-1%', 'emf', 0.01),
+    ('emf-all', 'emf', 1.0)
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure per-invocation instrumentation overhead.')
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    handler = load_handler()
+    install_stubs()
+    sample = sample_events()
+
+    devnull = open(os.devnull, 'w')
+    logging.getLogger().handlers = [logging.StreamHandler(devnull)]
+    structured_logging.configure('WARNING', 0.0)
+
+    results = {}
+    stdout = sys.stdout
+    for name, mode, sample_rate in SCENARIOS:
+        instrumentation.configure(mode, sample_rate)
+        # EMF lines go to stdout; discard them while timing
+        sys.stdout = devnull
+        try:
+            run(handler, sample, min(200, args.iterations))  # warm up
+            results[name] = run(handler, sample, args.iterations)
+        finally:
+            sys.stdout = stdout
+
+    baseline = results['off']
+    print('{:<10} {:>12} {:>12}'.format('scenario', 'us/invoke', 'overhead us'))
+    for name, _, _ in SCENARIOS:
+        print('{:<10} {:>12.1f} {:>12.1f}'.format(name, results[name], results[name] - baseline))
+
+
+if __name__ == '__main__':
+    main()
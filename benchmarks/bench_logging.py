@@ -0,0 +1,77 @@
+"""
+Per-invocation logging overhead of lambda_handler.
+
+Runs the same mix of Lex events through the handler (with in-process AWS
+stand-ins and log output discarded) under three logging setups:
+
+    off           nothing emitted - the baseline
+    debug         LOG_LEVEL=DEBUG, every payload logged (how the bot used to run)
+    info-sampled  LOG_LEVEL=INFO with 1% of requests logged at DEBUG
+
+and reports microseconds per invocation and the overhead against the baseline.
+
+    python benchmarks/bench_logging.py --iterations 2000
+
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import events  # noqa: E402
+from tools.handler import install_stubs, load_handler  # noqa: E402
+
+import structured_logging  # noqa: E402
+
+SCENARIOS = [
+    ('off', 'CRITICAL', 0.0),
+    ('debug', 'DEBUG', 0.0),
+    ('info-sampled', 'INFO', 0.01)
+]
+
+
+def sample_events():
+    return [events.lex_event(intent, source, slots)
+            for intent, slots in (('RateSession', events.RATING_SLOTS), ('ProvideFeedback', events.FEEDBACK_SLOTS))
+            for source in events.SOURCES]
+
+
+def run(handler, sample, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        # the handler mutates slots and session attributes, so give it fresh copies
+        handler.lambda_handler(events.fresh(sample[i % len(sample)]), None)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure per-invocation logging overhead.')
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    handler = load_handler()
+    install_stubs()
+    sample = sample_events()
+
+    root = logging.getLogger()
+    devnull = open(os.devnull, 'w')
+    root.handlers = [logging.StreamHandler(devnull)]
+
+    results = {}
+    for name, level, sample_rate in SCENARIOS:
+        structured_logging.configure(level, sample_rate)
+        run(handler, sample, min(200, args.iterations))  # warm up
+        results[name] = run(handler, sample, args.iterations)
+
+    baseline = results['off']
+    print('{:<14} {:>12} {:>12}'.format('scenario', 'us/invoke', 'overhead us'))
+    for name, _, _ in SCENARIOS:
+        print('{:<14} {:>12.1f} {:>12.1f}'.format(name, results[name], results[name] - baseline))
+
+
+if __name__ == '__main__':
+    main()
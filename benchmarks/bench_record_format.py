@@ -0,0 +1,77 @@
+"""
+Size and throughput of the Kinesis record formats in record_format.py.
+
+Generates a mix of SessionRating and SessionFeedback records (comments of
+varied length, most feedback with a sentiment result) and reports for JSON
+and the binary format: average bytes per record, the records one shard's
+1 MB/s write limit could carry at that size, and encode/decode time.
+
+    python benchmarks/bench_record_format.py --records 20000
+
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import record_format  # noqa: E402
+
+SHARD_BYTES_PER_SECOND = 1024 * 1024
+SHARD_RECORDS_PER_SECOND = 1000
+
+WORDS = ('great', 'talk', 'demo', 'useful', 'slides', 'too', 'fast', 'clear', 'examples', 'serverless', 'speaker')
+
+
+def generate(count, seed=0):
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        record = {
+            'UserId': 'amzn1.lex.user.{:032x}'.format(rng.getrandbits(128)),
+            'Location': rng.choice(['London', 'New York', 'Berlin', 'Sydney']),
+            'Date': '2026-10-{:02d}'.format(rng.randint(1, 28)),
+            'ID': rng.choice(['Dev405 Serverless Patterns', 'Key101 Opening Keynote', 'Arc301 Multi-Region'])
+        }
+        if rng.random() < 0.7:
+            record.update(RecordType='SessionRating', Score=rng.randint(1, 5))
+        else:
+            record.update(RecordType='SessionFeedback',
+                          SessionComments=' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 60))))
+            if rng.random() < 0.8:
+                record['ComprehendSentimentResult'] = {
+                    'Sentiment': rng.choice(record_format.SENTIMENTS), 'Confidence': rng.random()}
+        records.append(record)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare Kinesis record formats.')
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    records = generate(args.records)
+    print('{:<8} {:>12} {:>16} {:>11} {:>11}'.format('format', 'bytes/rec', 'shard rec/s', 'encode us', 'decode us'))
+    for record_encoding in record_format.FORMATS:
+        start = time.perf_counter()
+        payloads = [record_format.encode(record, record_encoding) for record in records]
+        encode_us = (time.perf_counter() - start) / len(records) * 1e6
+
+        start = time.perf_counter()
+        decoded = [record_format.decode(data) for data in payloads]
+        decode_us = (time.perf_counter() - start) / len(records) * 1e6
+
+        for original, roundtrip in zip(records, decoded):
+            assert all(roundtrip.get(key) == value for key, value in original.items()), (original, roundtrip)
+
+        average = sum(len(data) for data in payloads) / float(len(payloads))
+        per_shard = min(SHARD_RECORDS_PER_SECOND, SHARD_BYTES_PER_SECOND / average)
+        print('{:<8} {:>12.1f} {:>16.0f} {:>11.2f} {:>11.2f}'.format(
+            record_encoding, average, per_shard, encode_us, decode_us))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Throughput and accuracy of the local lexicon sentiment scorer (sentiment_lexicon.py).
+
+Scores a labelled set of feedback comments (JSON lines with SessionComments
+and Sentiment, by default benchmarks/data/feedback_labels.jsonl, a small
+hand-labelled sample) and reports
+
+    comments/s        score() one comment at a time, and score_batch()
+                      BATCH comments at a time, over --comments comments
+    agreement         share of comments where the scorer's Sentiment matches
+                      the label, overall and per label, with a confusion table
+    refined           for local-first, the share of comments Comprehend would
+                      be asked to refine at --refine-below
+
+    python benchmarks/bench_sentiment.py --comments 50000
+    python benchmarks/bench_sentiment.py --labels recorded.jsonl
+
+--record relabels the comments in --labels with Amazon Comprehend
+(batch_detect_sentiment, so it needs credentials) and writes them to the
+given file, for measuring agreement against Comprehend rather than by hand.
+
+"""
+
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sentiment  # noqa: E402
+import sentiment_lexicon  # noqa: E402
+
+DEFAULT_LABELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'feedback_labels.jsonl')
+SENTIMENTS = ('POSITIVE', 'NEGATIVE', 'MIXED', 'NEUTRAL')
+BATCH = 500
+
+
+def load_labels(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record(labelled, path):
+    """
+    Label each comment with Comprehend's Sentiment and write them to path.
+    """
+    texts = [row['SessionComments'] for row in labelled]
+    results = sentiment.ComprehendBackend().batch_detect(texts)
+    with open(path, 'w') as f:
+        for text, result in zip(texts, results):
+            if result is not None:
+                f.write(json.dumps({'SessionComments': text, 'Sentiment': result['Sentiment'],
+                                    'Confidence': result['Confidence']}) + '\n')
+    print('recorded {} of {} comments to {}'.format(sum(r is not None for r in results), len(texts), path))
+
+
+def throughput(scorer, texts, count):
+    rng = random.Random(0)
+    comments = [rng.choice(texts) for _ in range(count)]
+
+    start = time.perf_counter()
+    for text in comments:
+        scorer.score(text)
+    single = count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(0, count, BATCH):
+        scorer.score_batch(comments[i:i + BATCH])
+    batched = count / (time.perf_counter() - start)
+    return single, batched
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the local lexicon sentiment scorer.')
+    parser.add_argument('--labels', default=DEFAULT_LABELS, help='JSON lines of SessionComments and Sentiment')
+    parser.add_argument('--comments', type=int, default=20000, help='comments to score for throughput')
+    parser.add_argument('--refine-below', type=float, default=0.75)
+    parser.add_argument('--record', metavar='PATH', help='label --labels with Comprehend and write them to PATH')
+    args = parser.parse_args()
+
+    labelled = load_labels(args.labels)
+    if args.record:
+        record(labelled, args.record)
+        return
+
+    scorer = sentiment_lexicon.LexiconScorer()
+    texts = [row['SessionComments'] for row in labelled]
+    single, batched = throughput(scorer, texts, args.comments)
+    print('throughput: {:,.0f} comments/s one at a time, {:,.0f} comments/s in batches of {}'.format(
+        single, batched, BATCH))
+
+    results = scorer.score_batch(texts)
+    confusion = collections.Counter((row['Sentiment'], result['Sentiment']) for row, result in zip(labelled, results))
+    agreed = sum(confusion[label, label] for label in SENTIMENTS)
+    print('agreement:  {:.1%} of {} comments ({})'.format(agreed / len(labelled), len(labelled), args.labels))
+    refined = sum(result['Confidence'] < args.refine_below for result in results)
+    print('refined:    {:.1%} below confidence {}'.format(refined / len(labelled), args.refine_below))
+    print()
+    print('{:<10}'.format('label') + ''.join('{:>10}'.format(s) for s in SENTIMENTS) + '{:>10}'.format('agree'))
+    for label in SENTIMENTS:
+        total = sum(confusion[label, s] for s in SENTIMENTS)
+        if not total:
+            continue
+        print('{:<10}'.format(label) + ''.join('{:>10}'.format(confusion[label, s]) for s in SENTIMENTS) +
+              '{:>10.0%}'.format(confusion[label, label] / total))
+
+
+if __name__ == '__main__':
+    main()
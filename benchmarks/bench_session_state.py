@@ -0,0 +1,75 @@
+"""
+Session attribute size and encoding cost, before and after session_state.py.
+
+For feedback comments of several lengths, compares how the bot used to keep
+records in session attributes (the whole record as JSON, and the confirmed
+feedback as a raw dict including the comment and sentiment scores) with
+SessionStateCodec, reporting the bytes of session attributes sent with each
+turn and the microseconds to encode and decode them.
+
+    python benchmarks/bench_session_state.py --iterations 20000
+
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import session_state  # noqa: E402
+
+COMMENT_LENGTHS = (20, 200, 2000)
+
+
+def feedback_record(comment_length):
+    return {
+        'RecordType': 'SessionFeedback',
+        'UserId': 'amzn1.lex.user.0123456789abcdef0123456789abcdef',
+        'Location': 'London',
+        'Date': '2026-10-17',
+        'SessionComments': ('Lots of great details, thanks. ' * (comment_length // 30 + 1))[:comment_length],
+        'ID': 'Dev405 Serverless Patterns',
+        'ComprehendSentimentResult': {'Sentiment': 'POSITIVE', 'Confidence': 0.92}
+    }
+
+
+def legacy_encode(record):
+    # currentFeedback was the full record as JSON; lastConfirmedFeedback the raw dict, serialized by Lex
+    current = dict(record)
+    current.pop('ComprehendSentimentResult')
+    return {'current': json.dumps(current), 'confirmed': json.dumps({'lastConfirmedFeedback': record})}
+
+
+def codec_encode(codec, record):
+    return {'current': codec.encode(dict(record, ComprehendSentimentResult=None)), 'confirmed': codec.encode(record)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare session attribute encodings.')
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    codec = session_state.SessionStateCodec()
+    print('{:>8} {:<8} {:>14} {:>16} {:>10} {:>10}'.format(
+        'comment', 'encoding', 'current bytes', 'confirmed bytes', 'encode us', 'decode us'))
+    for length in COMMENT_LENGTHS:
+        record = feedback_record(length)
+
+        legacy = legacy_encode(record)
+        encode_us = timeit.timeit(lambda: legacy_encode(record), number=args.iterations) / args.iterations * 1e6
+        decode_us = timeit.timeit(lambda: json.loads(legacy['confirmed']), number=args.iterations) / args.iterations * 1e6
+        print('{:>8} {:<8} {:>14} {:>16} {:>10.2f} {:>10.2f}'.format(
+            length, 'legacy', len(legacy['current']), len(legacy['confirmed']), encode_us, decode_us))
+
+        compact = codec_encode(codec, record)
+        encode_us = timeit.timeit(lambda: codec_encode(codec, record), number=args.iterations) / args.iterations * 1e6
+        decode_us = timeit.timeit(lambda: codec.decode(compact['confirmed']), number=args.iterations) / args.iterations * 1e6
+        print('{:>8} {:<8} {:>14} {:>16} {:>10.2f} {:>10.2f}'.format(
+            length, 'codec', len(compact['current']), len(compact['confirmed']), encode_us, decode_us))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Synthetic Lex V1 code hook events for the benchmarks.
+"""
+
+import datetime
+
+TODAY = datetime.date.today().isoformat()
+
+RATING_SLOTS = {'SessionID': 'DEV405', 'SessionDate': TODAY, 'SessionLocation': 'London', 'SessionScore': '5'}
+FEEDBACK_SLOTS = {'SessionID': 'DEV405', 'SessionDate': TODAY, 'SessionLocation': 'London',
+                  'SessionComments': 'Lots of great details, thanks'}
+
+# (intent, slots) for every intent the bot handles
+INTENTS = [
+    ('RateSession', RATING_SLOTS),
+    ('ProvideFeedback', FEEDBACK_SLOTS),
+    ('Testing', {'TestTarget': 'A'}),
+    ('Thanks', {}),
+    ('CancelRequest', {}),
+    ('HelpMe', {}),
+    ('GithubInfo', {})
+]
+
+SOURCES = ('DialogCodeHook', 'FulfillmentCodeHook')
+
+# sessions seeded into the stand-in table so catalog lookups find a match
+CATALOG = [
+    ('DEV405 Serverless patterns', 'London'),
+    ('DEV406 Event driven design', 'London'),
+    ('ARC301 Multi-region architectures', 'London')
+]
+
+
+def lex_event(intent, source, slots, session_attributes=None):
+    return {
+        'bot': {'name': 'SessionFeedbackBot', 'alias': '$LATEST', 'version': '$LATEST'},
+        'userId': 'bench-user',
+        'inputTranscript': 'benchmark',
+        'invocationSource': source,
+        'outputDialogMode': 'Text',
+        'messageVersion': '1.0',
+        'sessionAttributes': dict(session_attributes or {}),
+        'currentIntent': {'name': intent, 'slots': dict(slots), 'confirmationStatus': 'None'}
+    }
+
+
+def fresh(event):
+    """
+    Copy the parts of event the handler mutates (slots and session attributes).
+    """
+    return dict(event, sessionAttributes=dict(event['sessionAttributes']),
+                currentIntent=dict(event['currentIntent'], slots=dict(event['currentIntent']['slots'])))
+
+
+def all_events():
+    """
+    Return {(intent, source): event} for every intent and code hook.
+    """
+    return dict(((intent, source), lex_event(intent, source, slots)) for intent, slots in INTENTS for source in SOURCES)
+
+
+def seed_catalog(dynamodb, table_name, day=TODAY, catalog=CATALOG):
+    """
+    Put catalog (CATALOG unless given) into a FakeDynamoDB table as the sessions scheduled on day.
+    """
+    for title, city in catalog:
+        dynamodb.put_item(TableName=table_name, Item={
+            'FullDate': {'S': day}, 'Title': {'S': title}, 'LocationCity': {'S': city}
+        })
@@ -0,0 +1,209 @@
+"""
+Offline micro-benchmark suite for the rating-bot handler and its helpers.
+
+Every case runs in-process against the AWS stand-ins in tools/stubs.py (with
+a few catalogued sessions seeded for today), so results only reflect the
+function's own code. For each case the suite reports
+
+    ops_per_sec       calls per second over the timed run
+    p50_us, p99_us    per-call latency percentiles in microseconds
+    alloc_peak_bytes  median peak of memory traced by tracemalloc during one call
+    alloc_net_blocks  memory blocks still allocated per call after the run
+
+Cases cover lambda_handler and dispatch for every intent and code hook, the
+validate_* functions, build_response_card and the date helpers.
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --filter validate --iterations 5000
+    python benchmarks/suite.py --baseline results.json --tolerance 0.25
+
+With --baseline the results are compared with an earlier run and the suite
+exits with status 1 if any case's p50 latency or peak allocation grew by
+more than the tolerance, so it can gate a build. Compare runs from the same
+machine: absolute timings don't transfer between hosts.
+
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import events  # noqa: E402
+from tools.handler import install_stubs, load_handler  # noqa: E402
+
+import structured_logging  # noqa: E402
+
+ALLOCATION_SAMPLES = 50
+
+# latency changes smaller than this are noise whatever the tolerance
+MIN_LATENCY_DELTA_US = 1.0
+MIN_ALLOCATION_DELTA_BYTES = 256
+
+
+def build_cases(handler):
+    """
+    Return [(name, func)] where func() runs the case once.
+    """
+    cases = []
+    for (intent, source), event in sorted(events.all_events().items()):
+        cases.append(('lambda_handler.{}.{}'.format(intent, source),
+                      lambda event=event: handler.lambda_handler(events.fresh(event), None)))
+        cases.append(('dispatch.{}.{}'.format(intent, source),
+                      lambda event=event: handler.dispatch(events.fresh(event))))
+
+    rating_slots = events.RATING_SLOTS
+    feedback_slots = events.FEEDBACK_SLOTS
+    cases += [
+        ('validate_rating.valid', lambda: handler.validate_rating(dict(rating_slots))),
+        ('validate_rating.bad_score', lambda: handler.validate_rating(dict(rating_slots, SessionScore='9'))),
+        ('validate_rating.bad_date', lambda: handler.validate_rating(dict(rating_slots, SessionDate='not a date'))),
+        ('validate_rating.unknown_session',
+         lambda: handler.validate_rating(dict(rating_slots, SessionID='Something else entirely'))),
+        ('validate_feedback.valid', lambda: handler.validate_feedback(dict(feedback_slots))),
+        ('validate_feedback.no_comments',
+         lambda: handler.validate_feedback(dict(feedback_slots, SessionComments=None))),
+        ('validate_testing.valid', lambda: handler.validate_testing({'test_target': 'A'})),
+        ('build_response_card', lambda: handler.build_response_card(
+            'Which session?', events.TODAY, [title for title, _ in events.CATALOG])),
+    ]
+
+    today = events.TODAY
+    last_week = (datetime.date.today() - datetime.timedelta(days=7)).isoformat()
+    cases += [
+        ('dates.isvalid_date.iso', lambda: handler.isvalid_date(today)),
+        ('dates.isvalid_date.text', lambda: handler.isvalid_date('3rd of October 2026')),
+        ('dates.isfuture_date', lambda: handler.isfuture_date(today)),
+        ('dates.within_30_days', lambda: handler.within_30_days(last_week)),
+        ('dates.get_day_difference', lambda: handler.get_day_difference(today, last_week)),
+        ('dates.add_days', lambda: handler.add_days(today, 7)),
+    ]
+    return cases
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(func, iterations, warmup):
+    for _ in range(warmup):
+        func()
+
+    timer = time.perf_counter
+    samples = []
+    for _ in range(iterations):
+        start = timer()
+        func()
+        samples.append(timer() - start)
+    samples.sort()
+    total = sum(samples)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for _ in range(ALLOCATION_SAMPLES):
+            tracemalloc.clear_traces()
+            func()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        # clear_traces() forgets earlier blocks, so count what one more batch leaves behind
+        tracemalloc.clear_traces()
+        before = tracemalloc.take_snapshot()
+        for _ in range(ALLOCATION_SAMPLES):
+            func()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    net_blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    peaks.sort()
+
+    return {
+        'ops_per_sec': iterations / total if total else float('inf'),
+        'mean_us': total / iterations * 1e6,
+        'p50_us': percentile(samples, 0.5) * 1e6,
+        'p99_us': percentile(samples, 0.99) * 1e6,
+        'alloc_peak_bytes': percentile(peaks, 0.5),
+        'alloc_net_blocks': net_blocks / float(ALLOCATION_SAMPLES)
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return [(case, metric, baseline value, current value)] for every regression.
+    """
+    regressions = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if (current['p50_us'] > previous['p50_us'] * (1 + tolerance)
+                and current['p50_us'] - previous['p50_us'] > MIN_LATENCY_DELTA_US):
+            regressions.append((name, 'p50_us', previous['p50_us'], current['p50_us']))
+        if (current['alloc_peak_bytes'] > previous['alloc_peak_bytes'] * (1 + tolerance)
+                and current['alloc_peak_bytes'] - previous['alloc_peak_bytes'] > MIN_ALLOCATION_DELTA_BYTES):
+            regressions.append((name, 'alloc_peak_bytes', previous['alloc_peak_bytes'], current['alloc_peak_bytes']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the rating-bot micro-benchmarks.')
+    parser.add_argument('--iterations', type=int, default=2000, help='timed calls per case')
+    parser.add_argument('--warmup', type=int, default=200)
+    parser.add_argument('--filter', help='only run cases whose name contains this')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative growth in p50 latency or peak allocation (default 0.25)')
+    args = parser.parse_args()
+
+    handler = load_handler()
+    stubs = install_stubs()
+    events.seed_catalog(stubs['dynamodb'], os.environ['TABLE_NAME'])
+    logging.getLogger().handlers = [logging.StreamHandler(open(os.devnull, 'w'))]
+    structured_logging.configure('WARNING', 0.0)
+
+    results = {}
+    print('{:<52} {:>12} {:>9} {:>9} {:>10} {:>8}'.format('case', 'ops/s', 'p50 us', 'p99 us', 'peak B', 'blocks'))
+    for name, func in build_cases(handler):
+        if args.filter and args.filter not in name:
+            continue
+        result = results[name] = measure(func, args.iterations, args.warmup)
+        # the Kinesis stand-in keeps every record; don't let that skew later cases
+        del stubs['kinesis'].records[:]
+        print('{:<52} {:>12.0f} {:>9.1f} {:>9.1f} {:>10.0f} {:>8.1f}'.format(
+            name, result['ops_per_sec'], result['p50_us'], result['p99_us'],
+            result['alloc_peak_bytes'], result['alloc_net_blocks']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'time': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                    'iterations': args.iterations
+                },
+                'results': results
+            }, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for name, metric, previous, current in regressions:
+            print('REGRESSION {} {}: {:.1f} -> {:.1f}'.format(name, metric, previous, current))
+        if regressions:
+            sys.exit(1)
+        print('no regressions against {} (tolerance {:.0%})'.format(args.baseline, args.tolerance))
+
+
+if __name__ == '__main__':
+    main()
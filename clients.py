@@ -0,0 +1,128 @@
+"""
+Shared boto3 client registry for the rating-bot Lambda functions.
+
+Creating a boto3 client re-resolves credentials and endpoints and opens a new
+connection pool, so doing it inside every fulfillment adds latency to each
+turn. Clients handed out here are created lazily, once per service per
+container, and reused across warm invocations.
+
+The botocore Config used for every client can be tuned with environment
+variables:
+
+    BOTO_CONNECT_TIMEOUT       connect timeout in seconds (default 2)
+    BOTO_READ_TIMEOUT          read timeout in seconds (default 5)
+    BOTO_RETRY_MODE            legacy, standard or adaptive (default standard)
+    BOTO_MAX_ATTEMPTS          total attempts including the first (default 3)
+    BOTO_MAX_POOL_CONNECTIONS  connections kept per client (default 10)
+    BOTO_TCP_KEEPALIVE         'true' or 'false' (default true)
+
+boto3 and botocore are imported on first use rather than when this module is
+imported, so code paths that never touch AWS don't pay for them.
+
+For local testing, set_client() swaps in a stub for a service and reset()
+drops everything so the next get_client() builds a fresh client.
+
+"""
+
+import os
+import threading
+
+
+_clients = {}
+_overrides = {}
+_config = None
+_lock = threading.Lock()
+
+# creation/reuse counters, keyed by service name
+_created = {}
+_reused = {}
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def build_config():
+    """
+    Build the botocore Config shared by every client from the environment.
+    """
+    from botocore.config import Config
+
+    return Config(
+        connect_timeout=float(os.environ.get('BOTO_CONNECT_TIMEOUT', 2)),
+        read_timeout=float(os.environ.get('BOTO_READ_TIMEOUT', 5)),
+        retries={
+            'mode': os.environ.get('BOTO_RETRY_MODE', 'standard'),
+            'total_max_attempts': int(os.environ.get('BOTO_MAX_ATTEMPTS', 3))
+        },
+        max_pool_connections=int(os.environ.get('BOTO_MAX_POOL_CONNECTIONS', 10)),
+        tcp_keepalive=_env_bool('BOTO_TCP_KEEPALIVE', True)
+    )
+
+
+def get_config():
+    global _config
+    if _config is None:
+        _config = build_config()
+    return _config
+
+
+def get_client(service_name):
+    """
+    Return the container-wide client for service_name, creating it on first use.
+    """
+    client = _overrides.get(service_name) or _clients.get(service_name)
+    if client is not None:
+        _reused[service_name] = _reused.get(service_name, 0) + 1
+        return client
+
+    with _lock:
+        # another thread may have created the client while we waited
+        client = _clients.get(service_name)
+        if client is None:
+            import boto3
+
+            client = boto3.client(service_name, config=get_config())
+            _clients[service_name] = client
+            _created[service_name] = _created.get(service_name, 0) + 1
+        else:
+            _reused[service_name] = _reused.get(service_name, 0) + 1
+    return client
+
+
+def set_client(service_name, client):
+    """
+    Test hook: make get_client(service_name) return client (a stub or fake).
+    Passing None removes the override again.
+    """
+    if client is None:
+        _overrides.pop(service_name, None)
+    else:
+        _overrides[service_name] = client
+
+
+def reset():
+    """
+    Drop all cached clients, overrides, counters and the shared Config.
+    """
+    global _config
+    with _lock:
+        _clients.clear()
+        _overrides.clear()
+        _created.clear()
+        _reused.clear()
+        _config = None
+
+
+def client_stats():
+    """
+    Return {service: {'created': n, 'reused': n}} for every service seen so far.
+    """
+    services = set(_created) | set(_reused)
+    return {
+        service: {'created': _created.get(service, 0), 'reused': _reused.get(service, 0)}
+        for service in sorted(services)
+    }
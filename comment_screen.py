@@ -0,0 +1,253 @@
+"""
+Screening of feedback comments for PII, profanity and spam.
+
+Comments are screened before they reach Comprehend, Kinesis or
+Elasticsearch: validate_feedback() rejects or masks them on the dialog turn,
+and provide_feedback() masks them again before scoring and writing the
+record. CommentScreen.screen(text) makes two passes over the text, however
+many patterns there are:
+
+  * a keyword automaton (Aho-Corasick), built once per container from the
+    word list, that finds every listed word or phrase in one scan. Matching
+    ignores case and only counts whole words, so 'class' doesn't match 'ass'.
+  * one precompiled regex covering the PII patterns: email addresses, URLs
+    and runs of digits, which count as a card number (13-19 digits passing
+    the Luhn check) or a phone number (9-15 digits).
+
+Each match belongs to a category whose action is 'mask' (the match is
+replaced, e.g. by [email] or by asterisks) or 'reject' (the comment is
+refused and the user asked again). Masking applies to every match, so the
+screened text never contains one; rejected says whether any match's
+category rejects.
+
+The word list is a file of 'category<TAB>word or phrase' lines ('#' starts a
+comment), by default comment_screen_words.tsv beside this module.
+
+    COMMENT_SCREEN          'true' or 'false' (default true)
+    COMMENT_SCREEN_WORDS    path of the word list
+    COMMENT_SCREEN_ACTIONS  actions overriding ACTIONS, e.g. 'profanity=reject,url=mask'
+
+"""
+
+import collections
+import logging
+import os
+import re
+
+logger = logging.getLogger()
+
+DEFAULT_WORDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'comment_screen_words.tsv')
+
+# category -> action; categories not listed are masked
+ACTIONS = {
+    'spam': 'reject',
+    'profanity': 'mask',
+    'email': 'mask',
+    'url': 'mask',
+    'phone': 'mask',
+    'card': 'mask'
+}
+
+PII_LABELS = {'email': '[email]', 'url': '[link]', 'phone': '[phone]', 'card': '[card]'}
+
+_pii = re.compile(
+    r'(?P<email>[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,})'
+    r'|(?P<url>\b(?:https?://|www\.)[^\s<>"]+)'
+    r'|(?P<number>(?<![\w+])\+?\d[\d ().-]{7,}\d(?!\w))'
+)
+_digit = re.compile(r'\d')
+_whitespace = {ord(c): ' ' for c in '\t\n\r\f\v '}
+
+ScreenResult = collections.namedtuple('ScreenResult', 'text rejected categories')
+
+
+def luhn(digits):
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        n = int(d)
+        if i % 2:
+            n = n * 2 - 9 if n > 4 else n * 2
+        total += n
+    return total % 10 == 0
+
+
+def classify_number(match):
+    """
+    Return 'card', 'phone' or None for a run of digits.
+    """
+    digits = ''.join(_digit.findall(match))
+    if 13 <= len(digits) <= 19 and luhn(digits):
+        return 'card'
+    if 9 <= len(digits) <= 15:
+        return 'phone'
+    return None
+
+
+def mask(word):
+    # keep the first letter and the spacing of a phrase: 'f***', 'c**** h***'
+    return ''.join(char if i == 0 or char == ' ' or word[i - 1] == ' ' else '*' for i, char in enumerate(word))
+
+
+class KeywordAutomaton(object):
+    """
+    Aho-Corasick automaton over lower-cased words and phrases.
+    """
+
+    def __init__(self, patterns):
+        # state -> {char: next state}; fail links; (pattern length, category) matches ending at each state
+        goto = [{}]
+        fail = [0]
+        output = [()]
+        count = 0
+        for phrase, category in patterns:
+            phrase = ' '.join(phrase.lower().split())
+            if not phrase:
+                continue
+            state = 0
+            for char in phrase:
+                following = goto[state].get(char)
+                if following is None:
+                    following = len(goto)
+                    goto[state][char] = following
+                    goto.append({})
+                    fail.append(0)
+                    output.append(())
+                state = following
+            if (len(phrase), category) not in output[state]:
+                output[state] += ((len(phrase), category),)
+                count += 1
+
+        # breadth first, so each state's fail link is set before its children's
+        queue = collections.deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in goto[state].items():
+                queue.append(following)
+                target = fail[state]
+                while target and char not in goto[target]:
+                    target = fail[target]
+                fail[following] = goto[target].get(char, 0)
+                output[following] += output[fail[following]]
+
+        self.goto = goto
+        self.fail = fail
+        self.output = output
+        self.patterns = count
+
+    def __len__(self):
+        return len(self.goto)
+
+    def find(self, text):
+        """
+        Yield (start, end, category) for each whole-word match in lower-cased text.
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                end = i + 1
+                after = text[end] if end < len(text) else ' '
+                if after.isalnum():
+                    continue
+                for length, category in output[state]:
+                    start = end - length
+                    if start == 0 or not text[start - 1].isalnum():
+                        yield start, end, category
+
+
+def load_words(path):
+    """
+    Return (phrase, category) pairs from a word list file.
+    """
+    patterns = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            category, _, phrase = line.partition('\t')
+            if phrase.strip():
+                patterns.append((phrase.strip(), category.strip()))
+    return patterns
+
+
+class CommentScreen(object):
+
+    def __init__(self, patterns=(), actions=None, enabled=True):
+        self.automaton = KeywordAutomaton(patterns)
+        self.actions = dict(ACTIONS, **(actions or {}))
+        self.enabled = enabled
+        self.stats = {'screened': 0, 'masked': 0, 'rejected': 0}
+
+    def screen(self, text):
+        """
+        Return ScreenResult(text with every match masked, rejected, categories matched).
+        """
+        if not self.enabled or not text:
+            return ScreenResult(text, False, ())
+        self.stats['screened'] += 1
+
+        lowered = text.lower().translate(_whitespace)
+        if len(lowered) != len(text):
+            # a few characters lower-case to more than one; keep offsets aligned with text
+            lowered = ''.join(char.lower()[0] for char in text).translate(_whitespace)
+        matches = [(start, end, category, None) for start, end, category in self.automaton.find(lowered)]
+        for match in _pii.finditer(text):
+            category = match.lastgroup
+            if category == 'number':
+                category = classify_number(match.group())
+                if category is None:
+                    continue
+            matches.append((match.start(), match.end(), category, PII_LABELS[category]))
+        if not matches:
+            return ScreenResult(text, False, ())
+
+        # replace from the end so earlier offsets stay valid; overlapping matches merge
+        matches.sort()
+        spans = []
+        for start, end, category, label in matches:
+            if spans and start < spans[-1][1]:
+                last = spans[-1]
+                spans[-1] = (last[0], max(last[1], end), last[2], last[3] or label)
+            else:
+                spans.append((start, end, category, label))
+        pieces = []
+        position = len(text)
+        for start, end, category, label in reversed(spans):
+            pieces.append(text[end:position])
+            pieces.append(label or mask(text[start:end]))
+            position = start
+        pieces.append(text[:position])
+
+        categories = tuple(sorted(set(match[2] for match in matches)))
+        rejected = any(self.actions.get(category, 'mask') == 'reject' for category in categories)
+        self.stats['rejected' if rejected else 'masked'] += 1
+        return ScreenResult(''.join(reversed(pieces)), rejected, categories)
+
+
+def parse_actions(value):
+    actions = {}
+    for item in (value or '').split(','):
+        if item.strip():
+            category, _, action = item.partition('=')
+            action = action.strip().lower()
+            if action not in ('mask', 'reject'):
+                raise ValueError('COMMENT_SCREEN_ACTIONS: {} must be mask or reject'.format(category.strip()))
+            actions[category.strip()] = action
+    return actions
+
+
+def from_environment():
+    """
+    Build a CommentScreen configured from the COMMENT_SCREEN_* variables.
+    """
+    enabled = os.environ.get('COMMENT_SCREEN', 'true').lower() == 'true'
+    path = os.environ.get('COMMENT_SCREEN_WORDS', DEFAULT_WORDS)
+    patterns = load_words(path) if enabled else []
+    screen = CommentScreen(patterns, parse_actions(os.environ.get('COMMENT_SCREEN_ACTIONS')), enabled)
+    logger.debug('Comment screen built from %s: %d patterns, %d states', path, screen.automaton.patterns,
+                 len(screen.automaton))
+    return screen
@@ -0,0 +1,184 @@
+"""
+Suppression of duplicate ratings and feedback.
+
+Lex retries a fulfillment that timed out, and impatient users send "rate
+session X 5" twice, so the same SessionRating or SessionFeedback can reach
+fulfillment more than once. record_key() gives each record a content key, a
+hash of its type, UserId, session ID, date and the score or the normalized
+comments. Deduplicator.claim(key) returns False when the key was already
+submitted within DEDUPE_WINDOW seconds; fulfillment then thanks the user as
+usual without writing the record (or scoring the comments) again.
+
+  * Keys claimed by this container are kept in a bounded LRU with their
+    expiry, so a repeat that lands on the same container is recognised
+    without any call.
+  * With DEDUPE_MODE=table, a key the LRU doesn't know is claimed with a
+    conditional PutItem of FullDate='DEDUPE#<key>', Title='dedupe' in the
+    bot's table, which fails if the item exists and hasn't expired. A repeat
+    that lands on another container is caught there. The table's TTL deletes
+    the items using their ExpiresAt attribute. This costs a synchronous
+    write (and a delete, if the turn fails) on the Lex path for every new
+    submission; the sessions table is provisioned at 1 WCU, which a burst of
+    ratings throttles, so give it capacity (or on-demand billing) before
+    turning table mode on.
+
+A claim only sticks if the turn succeeds: when the invocation fails, or
+fulfillment answers Failed, lambda_handler calls release() and the turn's
+keys are forgotten, so Lex's retry is processed rather than suppressed.
+Errors talking to DynamoDB are logged and the key treated as new;
+deduplication never fails a request or drops a record that wasn't sent.
+
+    DEDUPE_MODE     'off', 'local' (the LRU only, no extra calls) or 'table' (default local)
+    DEDUPE_WINDOW   seconds a submission suppresses its repeats (default 600)
+    DEDUPE_SIZE     keys kept in memory (default 4096)
+
+"""
+
+import collections
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import clients
+import instrumentation
+from sentiment_cache import normalize
+
+logger = logging.getLogger()
+
+MODES = ('off', 'local', 'table')
+
+TABLE_KEY_PREFIX = 'DEDUPE#'
+TABLE_SORT_KEY = 'dedupe'
+
+
+def record_key(record):
+    """
+    Return the content key of a SessionRating or SessionFeedback record.
+    """
+    if record['RecordType'] == 'SessionFeedback':
+        content = hashlib.sha1(normalize(record.get('SessionComments') or '').encode('utf-8')).hexdigest()
+    else:
+        content = str(record.get('Score'))
+    parts = (record['RecordType'], record.get('UserId'), (record.get('ID') or '').lower(), record.get('Date'), content)
+    return hashlib.sha1('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+class Deduplicator(object):
+
+    def __init__(self, mode='local', window=600, max_entries=4096, table_name=None):
+        if mode not in MODES:
+            raise ValueError('DEDUPE_MODE must be one of {}, not {}'.format(', '.join(MODES), mode))
+        if mode == 'table' and not table_name:
+            raise ValueError('DEDUPE_MODE=table needs a table name')
+        self.mode = mode
+        self.window = window
+        self.max_entries = max_entries
+        self.table_name = table_name
+        # key -> time its claim expires, oldest first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # keys claimed by the current turn, per thread for concurrent requests (http_server.py)
+        self._turn = threading.local()
+        self.stats = {
+            'claimed': 0,
+            'local_duplicates': 0,
+            'table_duplicates': 0,
+            'released': 0,
+            'table_errors': 0
+        }
+
+    def start_turn(self):
+        self._turn.claimed = []
+
+    def claim(self, key):
+        """
+        Claim key for the current turn. Returns False if it is a duplicate.
+        """
+        if self.mode == 'off':
+            return True
+        now = time.time()
+        with self._lock:
+            expires = self._entries.get(key)
+            duplicate = expires is not None and expires > now
+            if not duplicate:
+                self._entries[key] = now + self.window
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        if duplicate:
+            self.stats['local_duplicates'] += 1
+        elif self.mode == 'table' and not self._claim_table(key, now):
+            # keep the key in the LRU, so the next repeat here needs no call
+            self.stats['table_duplicates'] += 1
+            duplicate = True
+        if duplicate:
+            instrumentation.count('DuplicateSuppressed')
+            return False
+
+        claimed = getattr(self._turn, 'claimed', None)
+        if claimed is None:
+            claimed = self._turn.claimed = []
+        claimed.append(key)
+        self.stats['claimed'] += 1
+        return True
+
+    def release(self):
+        """
+        Forget the keys claimed by the current turn, which didn't succeed.
+        """
+        claimed = getattr(self._turn, 'claimed', None) or []
+        self._turn.claimed = []
+        for key in claimed:
+            with self._lock:
+                self._entries.pop(key, None)
+            if self.mode == 'table':
+                self._release_table(key)
+            self.stats['released'] += 1
+
+    # --- DynamoDB claims ---
+
+    def _table_key(self, key):
+        return {'FullDate': {'S': TABLE_KEY_PREFIX + key}, 'Title': {'S': TABLE_SORT_KEY}}
+
+    def _claim_table(self, key, now):
+        """
+        Put the key's item unless an unexpired one exists. Returns False if one does.
+        """
+        item = self._table_key(key)
+        item['ExpiresAt'] = {'N': str(int(now + self.window))}
+        dynamodb = clients.get_client('dynamodb')
+        try:
+            dynamodb.put_item(
+                TableName=self.table_name,
+                Item=item,
+                # DynamoDB TTL deletes lazily, so an expired item may still be there
+                ConditionExpression='attribute_not_exists(FullDate) OR ExpiresAt < :now',
+                ExpressionAttributeValues={':now': {'N': str(int(now))}}
+            )
+        except dynamodb.exceptions.ConditionalCheckFailedException:
+            return False
+        except Exception:
+            logger.exception('Claiming a dedupe key in %s failed', self.table_name)
+            self.stats['table_errors'] += 1
+        return True
+
+    def _release_table(self, key):
+        try:
+            clients.get_client('dynamodb').delete_item(TableName=self.table_name, Key=self._table_key(key))
+        except Exception:
+            logger.exception('Releasing a dedupe key in %s failed', self.table_name)
+            self.stats['table_errors'] += 1
+
+
+def from_environment(table_name):
+    """
+    Build a Deduplicator configured from the DEDUPE_* variables.
+    """
+    return Deduplicator(
+        mode=os.environ.get('DEDUPE_MODE', 'local').strip().lower(),
+        window=int(os.environ.get('DEDUPE_WINDOW', 600)),
+        max_entries=int(os.environ.get('DEDUPE_SIZE', 4096)),
+        table_name=table_name
+    )
@@ -0,0 +1,48 @@
+"""
+Kinesis Data Firehose transformation for the ratings stream.
+
+Elasticsearch indexes JSON documents, but records on the ratings stream may
+be in the compact binary format (RECORD_FORMAT=binary, see
+record_format.py). Firehose passes each batch of records through this
+function on the way to Elasticsearch (and the S3 backup), and it returns
+every record as a JSON document. JSON records pass through unchanged.
+Records that can't be decoded are marked ProcessingFailed, which Firehose
+writes to the processing-failed prefix in S3 instead of Elasticsearch.
+
+Firehose de-aggregates KPL records from a Kinesis stream source before
+invoking the transformation, so each record holds one logical record.
+
+"""
+
+import base64
+
+import record_format
+import structured_logging
+
+logger = structured_logging.configure()
+
+
+def transform(data):
+    """
+    Return data (a record payload in either format) as a JSON document.
+    """
+    document = record_format.to_json(data)
+    if document is data:
+        # check JSON passed through, so Elasticsearch never sees a broken document
+        record_format.decode(data)
+    return document
+
+
+def lambda_handler(event, context):
+    structured_logging.start_request()
+    output = []
+    for record in event['records']:
+        try:
+            data = transform(base64.b64decode(record['data']))
+        except ValueError:
+            logger.exception('Could not decode record %s', record['recordId'])
+            output.append({'recordId': record['recordId'], 'result': 'ProcessingFailed', 'data': record['data']})
+            continue
+        output.append({'recordId': record['recordId'], 'result': 'Ok', 'data': base64.b64encode(data).decode('ascii')})
+    logger.debug('firehose_transform processed %d records', len(output))
+    return {'records': output}
@@ -0,0 +1,390 @@
+"""
+Standalone HTTP server for the rating-bot fulfillment function.
+
+Runs the same lambda_handler in our own containers (behind a load balancer,
+for events on private networks) instead of on Lambda. An asyncio server
+handles the connections; each Lex event is handed to a bounded thread pool,
+where lambda_handler makes its blocking boto3 calls. All requests share the
+one loaded rating-bot module, so its boto3 clients, sentiment cache, session
+catalog and Kinesis writers are shared across conversations, and one
+process serves hundreds of them at once.
+
+    python http_server.py --port 8080 --workers 64
+
+Endpoints:
+
+    POST /          a Lex V1 event as JSON; returns lambda_handler's response
+                    (also at /invoke and at the Lambda runtime interface
+                    emulator's /2015-03-31/functions/function/invocations)
+    GET /health     200, or 503 once shutdown has started
+    GET /metrics    JSON: requests in flight (running on a worker or queued
+                    for one), totals, rejections and latency percentiles over
+                    the last LATENCY_WINDOW requests
+
+Connections are kept alive (HTTP/1.1 by default, HTTP/1.0 on request) until
+they have been idle for --keep-alive seconds. At most --workers events run
+at once and --max-pending more wait for a worker; beyond that the server
+answers 503 with Retry-After rather than queueing without limit.
+
+On SIGTERM or SIGINT the server stops accepting connections, closes idle
+ones, answers requests already read, and flushes the Kinesis writers, all
+within --shutdown-timeout seconds. Spilled records (see spill.py) are
+replayed every --drain-interval seconds, as the Lambda schedule does.
+
+Each event gets a context whose get_remaining_time_in_millis() counts down
+from --timeout milliseconds after the request arrived. X-Ray patching is off
+unless XRAY_PATCH is set, as there is no Lambda trace header to join. The
+DEBUG log sampling in structured_logging.py sets the level process-wide, so
+a sampled request also logs DEBUG for requests running alongside it.
+
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import importlib.util
+import json
+import logging
+import os
+import signal
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+INVOKE_PATHS = ('/', '/invoke', '/2015-03-31/functions/function/invocations')
+LATENCY_WINDOW = 2048
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADERS = 100
+
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+    500: 'Internal Server Error', 501: 'Not Implemented', 503: 'Service Unavailable'
+}
+
+logger = logging.getLogger()
+
+
+class BadRequest(Exception):
+
+    def __init__(self, status, message):
+        super(BadRequest, self).__init__(message)
+        self.status = status
+
+
+def load_handler():
+    """
+    Import rating-bot.py (whose name isn't a valid module name) as rating_bot.
+    """
+    os.environ.setdefault('XRAY_PATCH', 'none')
+    os.environ.setdefault('AWS_XRAY_SDK_ENABLED', 'false')
+    spec = importlib.util.spec_from_file_location('rating_bot', os.path.join(ROOT, 'rating-bot.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class RequestContext(object):
+    """
+    The parts of the Lambda context object the handler uses.
+    """
+
+    def __init__(self, timeout, function_name):
+        self.aws_request_id = str(uuid.uuid4())
+        self.function_name = function_name
+        self._deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(int((self._deadline - time.monotonic()) * 1000), 0)
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self.started = time.time()
+        self.in_flight = 0
+        self.running = 0
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        # running is updated from the worker threads
+        self._lock = threading.Lock()
+
+    def started_running(self):
+        with self._lock:
+            self.running += 1
+
+    def stopped_running(self):
+        with self._lock:
+            self.running -= 1
+
+    def snapshot(self, workers, max_pending, draining):
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            return round(latencies[min(int(len(latencies) * fraction), len(latencies) - 1)], 3) if latencies else None
+
+        return {
+            'uptime_s': round(time.time() - self.started, 3),
+            'draining': draining,
+            'workers': workers,
+            'max_pending': max_pending,
+            'in_flight': self.in_flight,
+            'running': self.running,
+            'queued': max(self.in_flight - self.running, 0),
+            'connections': self.connections,
+            'requests': self.requests,
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'latency_ms': {
+                'window': len(latencies),
+                'p50': percentile(0.5),
+                'p90': percentile(0.9),
+                'p99': percentile(0.99),
+                'max': round(latencies[-1], 3) if latencies else None
+            }
+        }
+
+
+class Server(object):
+
+    def __init__(self, handler, workers=32, max_pending=256, timeout=3.0, keep_alive=75.0,
+                 shutdown_timeout=30.0, drain_interval=60.0, loop=None):
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.shutdown_timeout = shutdown_timeout
+        self.drain_interval = drain_interval
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+        self.loop = loop
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.metrics = Metrics()
+        self.draining = False
+        self.function_name = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'rating-bot')
+        self._server = None
+        self._drainer = None
+        # connections waiting for their next request, closed at shutdown
+        self._idle = set()
+
+    def start(self, host, port):
+        self._server = self.loop.run_until_complete(asyncio.start_server(self._serve, host, port))
+        if self.drain_interval and any(writer.spill for writer in self.handler.writers):
+            self._drainer = self.loop.create_task(self._drain_spill())
+        return self._server.sockets[0].getsockname()
+
+    # --- Connections ---
+
+    async def _serve(self, reader, writer):
+        self.metrics.connections += 1
+        try:
+            while not self.draining:
+                self._idle.add(writer)
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.keep_alive)
+                except asyncio.TimeoutError:
+                    break
+                except BadRequest as e:
+                    self._write(writer, e.status, {'errorMessage': str(e)}, False)
+                    break
+                finally:
+                    self._idle.discard(writer)
+                if request is None:
+                    break
+                method, path, headers, body, keep_alive = request
+                status, response = await self._respond(method, path, body)
+                keep_alive = keep_alive and not self.draining
+                self._write(writer, status, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.metrics.connections -= 1
+            writer.close()
+
+    async def _read_request(self, reader):
+        """
+        Return (method, path, headers, body, keep_alive), or None at end of stream.
+        """
+        try:
+            line = await reader.readline()
+        except ValueError:
+            raise BadRequest(400, 'Request line too long')
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        except ValueError:
+            raise BadRequest(400, 'Malformed request line')
+
+        headers = {}
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                raise BadRequest(400, 'Header line too long')
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise BadRequest(400, 'Too many headers')
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'transfer-encoding' in headers:
+            raise BadRequest(501, 'Chunked request bodies are not supported')
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise BadRequest(400, 'Malformed Content-Length')
+        if length > MAX_BODY_BYTES:
+            raise BadRequest(413, 'Request body over {} bytes'.format(MAX_BODY_BYTES))
+        body = await reader.readexactly(length) if length else b''
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        return method.upper(), target.split('?', 1)[0], headers, body, keep_alive
+
+    def _write(self, writer, status, response, keep_alive):
+        body = json.dumps(response, separators=(',', ':')).encode('utf-8')
+        head = ['HTTP/1.1 {} {}'.format(status, REASONS.get(status, '')),
+                'Content-Type: application/json',
+                'Content-Length: {}'.format(len(body)),
+                'Connection: {}'.format('keep-alive' if keep_alive else 'close')]
+        if keep_alive:
+            head.append('Keep-Alive: timeout={}'.format(int(self.keep_alive)))
+        if status == 503:
+            head.append('Retry-After: 1')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+
+    # --- Requests ---
+
+    async def _respond(self, method, path, body):
+        """
+        Return (status, response) for one request.
+        """
+        if path == '/health':
+            return (503, {'status': 'draining'}) if self.draining else (200, {'status': 'ok'})
+        if path == '/metrics':
+            return 200, self.metrics.snapshot(self.workers, self.max_pending, self.draining)
+        if path not in INVOKE_PATHS:
+            return 404, {'errorMessage': 'No route for {}'.format(path)}
+        if method != 'POST':
+            return 405, {'errorMessage': 'Events must be POSTed'}
+        try:
+            event = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return 400, {'errorMessage': 'Request body is not a JSON event'}
+        if not isinstance(event, dict):
+            return 400, {'errorMessage': 'Request body is not a JSON event'}
+
+        metrics = self.metrics
+        if metrics.in_flight >= self.workers + self.max_pending:
+            metrics.rejected += 1
+            return 503, {'errorMessage': 'Too many requests in flight'}
+        context = RequestContext(self.timeout, self.function_name)
+        started = time.perf_counter()
+        metrics.in_flight += 1
+        try:
+            return 200, await self.loop.run_in_executor(self.executor, self._invoke, event, context)
+        except Exception as e:
+            metrics.errors += 1
+            logger.exception('lambda_handler failed for request %s', context.aws_request_id)
+            return 500, {'errorMessage': str(e), 'errorType': type(e).__name__}
+        finally:
+            metrics.in_flight -= 1
+            metrics.requests += 1
+            metrics.latencies.append((time.perf_counter() - started) * 1000)
+
+    def _invoke(self, event, context):
+        self.metrics.started_running()
+        try:
+            return self.handler.lambda_handler(event, context)
+        finally:
+            self.metrics.stopped_running()
+
+    async def _drain_spill(self):
+        while not self.draining:
+            await asyncio.sleep(self.drain_interval)
+            if any(writer.spill.size() for writer in self.handler.writers):
+                await self.loop.run_in_executor(self.executor, self.handler.drain_spill, {'source': 'http_server'}, None)
+
+    # --- Shutdown ---
+
+    async def shutdown(self):
+        """
+        Stop accepting, finish the requests in flight and flush the writers.
+        """
+        self.draining = True
+        deadline = time.monotonic() + self.shutdown_timeout
+        self._server.close()
+        if self._drainer is not None:
+            self._drainer.cancel()
+        for writer in list(self._idle):
+            writer.close()
+        while self.metrics.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.metrics.in_flight:
+            logger.warning('Shutting down with %d requests still in flight', self.metrics.in_flight)
+        try:
+            await asyncio.wait_for(self.loop.run_in_executor(self.executor, self._flush),
+                                   max(deadline - time.monotonic(), 1))
+        except asyncio.TimeoutError:
+            logger.error('Timed out flushing the Kinesis writers')
+        self.executor.shutdown(wait=False)
+
+    def _flush(self):
+        for writer in self.handler.writers:
+            try:
+                writer.flush()
+            except Exception:
+                logger.exception('Flushing %s at shutdown failed', writer.stream_name)
+
+    def run(self, host, port):
+        """
+        Serve until SIGTERM or SIGINT, then shut down gracefully.
+        """
+        address = self.start(host, port)
+        logger.info('Serving rating-bot on %s:%s with %d workers', address[0], address[1], self.workers)
+        stopped = self.loop.create_future()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self.loop.add_signal_handler(signum, lambda: stopped.done() or stopped.set_result(None))
+        self.loop.run_until_complete(stopped)
+        logger.info('Shutting down')
+        self.loop.run_until_complete(self.shutdown())
+        self.loop.run_until_complete(self._server.wait_closed())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the rating-bot fulfillment function over HTTP.')
+    parser.add_argument('--host', default=os.environ.get('HTTP_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('HTTP_PORT', 8080)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('HTTP_WORKERS', 32)),
+                        help='events handled at once')
+    parser.add_argument('--max-pending', type=int, default=int(os.environ.get('HTTP_MAX_PENDING', 256)),
+                        help='events waiting for a worker before the server answers 503')
+    parser.add_argument('--timeout', type=float, default=float(os.environ.get('HTTP_TIMEOUT_MS', 3000)) / 1000,
+                        help='seconds each event has, as a Lambda timeout')
+    parser.add_argument('--keep-alive', type=float, default=75.0, help='idle seconds before closing a connection')
+    parser.add_argument('--shutdown-timeout', type=float, default=30.0)
+    parser.add_argument('--drain-interval', type=float, default=60.0,
+                        help='seconds between replays of spilled records (0 to disable)')
+    args = parser.parse_args()
+
+    handler = load_handler()
+    server = Server(handler, workers=args.workers, max_pending=args.max_pending, timeout=args.timeout,
+                    keep_alive=args.keep_alive, shutdown_timeout=args.shutdown_timeout,
+                    drain_interval=args.drain_interval)
+    server.run(args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
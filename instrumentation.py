@@ -0,0 +1,224 @@
+"""
+Request timing for the rating-bot Lambda functions.
+
+Botocore patching only shows AWS calls in X-Ray. This module times the rest
+of a request too: wrap each phase in span(name) (or decorate a function with
+traced(name)) and, between start_request() and finish_request(), the phase is
+
+  * recorded as an X-Ray subsegment called name, when the function is traced
+    (the X-Ray SDK is enabled and Lambda passed a trace header), and
+  * added to the request's timings, which finish_request() writes to stdout
+    as one CloudWatch Embedded Metric Format (EMF) line. CloudWatch turns the
+    line into metrics without any PutMetricData calls.
+
+Every EMF line carries Latency (the whole request), ColdStart (1 for the
+first request in a container) and one metric per phase, all in
+milliseconds, with the dimensions given to start_request() (Intent and
+InvocationSource for the bot), so SLOs and alarms can be set per intent and
+per code hook. count(name, n) adds a Count metric, e.g. records spilled.
+
+Configuration:
+
+    METRICS_MODE         'emf' (default) or 'off'; with 'off' and no tracing, span() is a no-op
+    METRICS_SAMPLE_RATE  fraction of requests that emit an EMF line (default 1.0)
+    METRICS_NAMESPACE    CloudWatch namespace (default RatingBot)
+
+Cold starts are always reported, whatever the sample rate. Sampled lines
+record the rate in their SampleRate property so counts can be scaled back up.
+count() metrics are always reported too: a request that isn't sampled but
+counts something emits a line with just its counts.
+
+"""
+
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+_mode = 'emf'
+_sample_rate = 1.0
+_namespace = 'RatingBot'
+_xray_enabled = False
+_xray_recorder = None
+
+_cold_start = True
+# the request being timed, per thread, so concurrent requests (http_server.py) don't mix
+_local = threading.local()
+_local.request = None
+
+
+class _Request(object):
+    __slots__ = ('dimensions', 'timings', 'counts', 'started', 'sampled', 'trace', 'active')
+
+    def __init__(self, dimensions, sampled, trace):
+        self.dimensions = dimensions
+        self.timings = {}
+        self.counts = {}
+        self.started = time.perf_counter()
+        self.sampled = sampled
+        self.trace = trace
+        # spans are only timed for sampled or traced requests
+        self.active = sampled or trace
+
+
+class _Span(object):
+    __slots__ = ('name', 'request', 'annotations', 'started')
+
+    def __init__(self, name, request, annotations):
+        self.name = name
+        self.request = request
+        self.annotations = annotations
+
+    def __enter__(self):
+        if self.request.trace:
+            subsegment = _xray_recorder.begin_subsegment(self.name)
+            if subsegment is not None:
+                for key, value in self.annotations.items():
+                    subsegment.put_annotation(key, value)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = (time.perf_counter() - self.started) * 1000
+        timings = self.request.timings
+        # a phase that runs more than once in a request (e.g. two lookups) is reported as the total
+        timings[self.name] = timings.get(self.name, 0.0) + elapsed
+        if self.request.trace:
+            _xray_recorder.end_subsegment()
+        return False
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def configure(mode=None, sample_rate=None, namespace=None):
+    """
+    Read the metrics settings (arguments override the environment). Safe to call more than once.
+    """
+    global _mode, _sample_rate, _namespace, _xray_enabled, _xray_recorder
+    _mode = (mode or os.environ.get('METRICS_MODE', 'emf')).strip().lower()
+    if _mode not in ('emf', 'off'):
+        raise ValueError('METRICS_MODE must be emf or off, not {}'.format(_mode))
+    _sample_rate = float(sample_rate if sample_rate is not None else os.environ.get('METRICS_SAMPLE_RATE', 1.0))
+    _namespace = namespace or os.environ.get('METRICS_NAMESPACE', 'RatingBot')
+
+    _xray_enabled = (os.environ.get('XRAY_PATCH', 'botocore').strip().lower() != 'none'
+                     and os.environ.get('AWS_XRAY_SDK_ENABLED', 'true').lower() != 'false')
+    if _xray_enabled:
+        from aws_xray_sdk.core import xray_recorder
+        _xray_recorder = xray_recorder
+
+
+def start_request(**dimensions):
+    """
+    Start timing a request. dimensions (e.g. Intent, InvocationSource) are
+    attached to the EMF line; more can be added with set_dimension().
+    """
+    sampled = _mode == 'emf' and (_cold_start or random.random() < _sample_rate)
+    # Lambda sets the trace header for each invocation when active tracing is on
+    trace = _xray_enabled and '_X_AMZN_TRACE_ID' in os.environ
+    _local.request = _Request(dimensions, sampled, trace) if _mode == 'emf' or trace else None
+    return sampled
+
+
+def _current():
+    return getattr(_local, 'request', None)
+
+
+def set_dimension(name, value):
+    request = _current()
+    if request is not None:
+        request.dimensions[name] = value
+
+
+def count(name, value=1):
+    """
+    Add value to the Count metric name for the current request.
+    """
+    request = _current()
+    if request is not None:
+        request.counts[name] = request.counts.get(name, 0) + value
+
+
+def span(name, **annotations):
+    """
+    Context manager timing the phase name (and tracing it as an X-Ray
+    subsegment with the given annotations) within the current request.
+    """
+    request = _current()
+    if request is None or not request.active:
+        return _NULL_SPAN
+    return _Span(name, request, annotations)
+
+
+def traced(name):
+    """
+    Decorator: run the function inside span(name).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def build_emf(request, latency, cold_start):
+    """
+    Return the EMF document for a finished request.
+    """
+    dimension_names = sorted(name for name, value in request.dimensions.items() if value is not None)
+    metric_names = (['Latency', 'ColdStart'] + sorted(request.timings) if request.sampled else []) + sorted(request.counts)
+    document = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': _namespace,
+                # per dimension combination, plus each dimension alone, e.g. latency of all DialogCodeHook calls
+                'Dimensions': [dimension_names] + ([[name] for name in dimension_names] if len(dimension_names) > 1 else []),
+                'Metrics': [
+                    {'Name': name, 'Unit': 'Count' if name == 'ColdStart' or name in request.counts else 'Milliseconds'}
+                    for name in metric_names
+                ]
+            }]
+        }
+    }
+    if request.sampled:
+        document['SampleRate'] = 1.0 if cold_start else _sample_rate
+        document['Latency'] = round(latency, 3)
+        document['ColdStart'] = 1 if cold_start else 0
+    for name in dimension_names:
+        document[name] = str(request.dimensions[name])
+    for name, elapsed in request.timings.items():
+        document[name] = round(elapsed, 3)
+    document.update(request.counts)
+    return document
+
+
+def finish_request():
+    """
+    Finish the current request and write its EMF line (if it was sampled).
+    Returns the EMF document, or None.
+    """
+    global _cold_start
+    request, _local.request = _current(), None
+    cold_start, _cold_start = _cold_start, False
+    if request is None or _mode != 'emf' or not (request.sampled or request.counts):
+        return None
+    document = build_emf(request, (time.perf_counter() - request.started) * 1000, cold_start)
+    sys.stdout.write(json.dumps(document, separators=(',', ':')) + '\n')
+    return document
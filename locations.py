@@ -0,0 +1,174 @@
+"""
+Location registry for the SessionLocation slot.
+
+Valid cities are read from the LocationCity attribute of RatingBotSessionsTable
+through its 'Cities' GSI, so a city becomes valid as soon as a session there is
+added to the table - no redeploy. The cities seen are held per container in a
+frozenset index together with aliases ("NYC", "SF") and resolved with exact,
+alias and then fuzzy matching.
+
+The index is loaded once per container and then refreshed in the background
+every LOCATION_CACHE_TTL seconds (default 900): lookups keep using the stale
+index while the refresh runs, so validation never waits on DynamoDB after the
+first load. The original hard-coded cities are always valid, which also keeps
+the bot working if the table can't be read.
+
+"""
+
+import difflib
+import logging
+import os
+import threading
+import time
+
+import clients
+
+logger = logging.getLogger()
+
+CITIES_INDEX = 'Cities'
+
+SEED_LOCATIONS = ('london', 'leeds', 'manchester', 'tel aviv', 'new york', 'san francisco', 'seattle',
+                  'stockholm', 'dublin', 'helsinki', 'singapore', 'dummy')
+
+DEFAULT_ALIASES = {
+    'nyc': 'new york',
+    'ny': 'new york',
+    'new york city': 'new york',
+    'sf': 'san francisco',
+    'san fran': 'san francisco',
+    'tlv': 'tel aviv',
+    'tel-aviv': 'tel aviv',
+    'telaviv': 'tel aviv'
+}
+
+# how similar a misspelt name must be to a known city to be accepted
+FUZZY_CUTOFF = 0.85
+
+
+def normalize_location(location):
+    return ' '.join(location.lower().split())
+
+
+def parse_aliases(value):
+    """
+    Parse 'nyc=new york,sf=san francisco' into an alias dict.
+    """
+    aliases = {}
+    for pair in (value or '').split(','):
+        if '=' in pair:
+            alias, city = pair.split('=', 1)
+            aliases[normalize_location(alias)] = normalize_location(city)
+    return aliases
+
+
+class LocationIndex(object):
+    """
+    Immutable snapshot of the known cities and aliases.
+    """
+
+    def __init__(self, cities, aliases):
+        self.cities = frozenset(cities)
+        self.aliases = dict((alias, city) for alias, city in aliases.items() if city in self.cities)
+        self._names = sorted(self.cities)
+
+    def resolve(self, location):
+        name = normalize_location(location)
+        if name in self.cities:
+            return name
+        if name in self.aliases:
+            return self.aliases[name]
+        matches = difflib.get_close_matches(name, self._names, n=1, cutoff=FUZZY_CUTOFF)
+        return matches[0] if matches else None
+
+
+class LocationRegistry(object):
+
+    def __init__(self, table_name, ttl=900, aliases=None, seed=SEED_LOCATIONS):
+        self.table_name = table_name
+        self.ttl = ttl
+        self.seed = tuple(normalize_location(city) for city in seed)
+        self.aliases = dict(DEFAULT_ALIASES, **(aliases or {}))
+        self._index = None
+        self._loaded_at = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self.stats = {'loads': 0, 'load_errors': 0, 'background_refreshes': 0}
+
+    def load_cities(self):
+        """
+        Scan the Cities GSI and return the set of normalized city names.
+        """
+        dynamodb = clients.get_client('dynamodb')
+        cities = set()
+        kwargs = {
+            'TableName': self.table_name,
+            'IndexName': CITIES_INDEX,
+            'ProjectionExpression': 'LocationCity'
+        }
+        while True:
+            resp = dynamodb.scan(**kwargs)
+            for item in resp.get('Items', []):
+                city = item.get('LocationCity', {}).get('S')
+                if city:
+                    cities.add(normalize_location(city))
+            if 'LastEvaluatedKey' not in resp:
+                return cities
+            kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    def refresh(self):
+        """
+        Reload the index from DynamoDB, keeping the current one if that fails.
+        """
+        try:
+            cities = self.load_cities()
+        except Exception:
+            logger.exception('Could not load locations from %s', self.table_name)
+            self.stats['load_errors'] += 1
+            cities = set()
+        index = LocationIndex(cities.union(self.seed), self.aliases)
+        with self._lock:
+            if cities or self._index is None:
+                self._index = index
+            self._loaded_at = time.time()
+            self._refreshing = False
+        self.stats['loads'] += 1
+
+    def _background_refresh(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        self.stats['background_refreshes'] += 1
+        thread = threading.Thread(target=self.refresh, name='location-refresh')
+        thread.daemon = True
+        thread.start()
+
+    def index(self):
+        """
+        Return the current index, loading it on first use and refreshing it in
+        the background once it is older than the TTL.
+        """
+        if self._index is None:
+            self.refresh()
+        elif time.time() - self._loaded_at > self.ttl:
+            self._background_refresh()
+        return self._index
+
+    def resolve(self, location):
+        """
+        Return the canonical (lower case) city for location, or None.
+        """
+        if not location:
+            return None
+        return self.index().resolve(location)
+
+
+def from_environment(table_name):
+    """
+    Build a LocationRegistry configured from LOCATION_CACHE_TTL and LOCATION_ALIASES.
+    """
+    return LocationRegistry(
+        table_name,
+        ttl=int(os.environ.get('LOCATION_CACHE_TTL', 900)),
+        aliases=parse_aliases(os.environ.get('LOCATION_ALIASES'))
+    )
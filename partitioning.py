@@ -0,0 +1,198 @@
+"""
+Partition key strategies for records written to the rating-bot Kinesis stream.
+
+Kinesis maps each record to a shard by taking the MD5 of its partition key as
+a 128-bit integer (or using ExplicitHashKey if one is given) and finding the
+shard whose hash key range contains it. Writing every rating with the key
+'rating' and every feedback with 'feedback' sends all traffic to at most two
+shards whatever the shard count. The strategies here spread it out:
+
+    session   key on SessionID + Date - all records for one talk stay on one
+              shard, in order (default)
+    user      key on UserId - one attendee's records stay in order
+    random    random key - best spread, no ordering guarantee
+    explicit  SessionID + Date hashed onto an explicit hash key in the middle
+              of one of SHARD_COUNT evenly split shards, in order
+    static    the original 'rating'/'feedback' keys
+
+Run this module to simulate the per-shard load of a strategy, for example:
+
+    python partitioning.py --strategy session --shards 4 --records 10000
+
+"""
+
+import argparse
+import hashlib
+import random
+import uuid
+
+HASH_KEY_SPACE = 2 ** 128
+
+STATIC_KEYS = {
+    'SessionRating': 'rating',
+    'SessionFeedback': 'feedback'
+}
+
+
+def md5_hash_key(key):
+    """
+    Return the 128-bit hash Kinesis computes for a partition key.
+    """
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16)
+
+
+def shard_ranges(shard_count):
+    """
+    Return the (start, end) hash key ranges of shard_count evenly split shards,
+    which is how Kinesis lays out a newly created stream.
+    """
+    step = HASH_KEY_SPACE // shard_count
+    ranges = []
+    for i in range(shard_count):
+        start = i * step
+        end = HASH_KEY_SPACE - 1 if i == shard_count - 1 else (i + 1) * step - 1
+        ranges.append((start, end))
+    return ranges
+
+
+def shard_for_hash(hash_key, shard_count):
+    return min(hash_key // (HASH_KEY_SPACE // shard_count), shard_count - 1)
+
+
+def _session_key(record):
+    return '{}|{}'.format(record.get('ID'), record.get('Date'))
+
+
+class Partitioner(object):
+    """
+    Base class. key_for(record) returns (partition_key, explicit_hash_key),
+    where explicit_hash_key is None unless the strategy sets one.
+    """
+
+    name = None
+    # True if all records of one session are guaranteed to land on the same shard
+    preserves_session_order = False
+
+    def key_for(self, record):
+        raise NotImplementedError
+
+
+class StaticPartitioner(Partitioner):
+    name = 'static'
+    preserves_session_order = True
+
+    def key_for(self, record):
+        return STATIC_KEYS.get(record.get('RecordType'), 'other'), None
+
+
+class SessionPartitioner(Partitioner):
+    name = 'session'
+    preserves_session_order = True
+
+    def key_for(self, record):
+        return _session_key(record), None
+
+
+class UserPartitioner(Partitioner):
+    name = 'user'
+
+    def key_for(self, record):
+        # fall back to the session key for records without a user
+        return record.get('UserId') or _session_key(record), None
+
+
+class RandomPartitioner(Partitioner):
+    name = 'random'
+
+    def key_for(self, record):
+        return uuid.uuid4().hex, None
+
+
+class ExplicitHashPartitioner(Partitioner):
+    name = 'explicit'
+    preserves_session_order = True
+
+    def __init__(self, shard_count):
+        self.shard_count = shard_count
+        self._targets = [str((start + end) // 2) for start, end in shard_ranges(shard_count)]
+
+    def key_for(self, record):
+        key = _session_key(record)
+        return key, self._targets[md5_hash_key(key) % self.shard_count]
+
+
+PARTITIONERS = {
+    'static': StaticPartitioner,
+    'session': SessionPartitioner,
+    'user': UserPartitioner,
+    'random': RandomPartitioner,
+    'explicit': ExplicitHashPartitioner
+}
+
+
+def get_partitioner(strategy, shard_count=1):
+    """
+    Return a Partitioner for the named strategy.
+    """
+    try:
+        partitioner_class = PARTITIONERS[strategy]
+    except KeyError:
+        raise ValueError('Unknown partition strategy {}, expected one of {}'.format(
+            strategy, ', '.join(sorted(PARTITIONERS))))
+    if partitioner_class is ExplicitHashPartitioner:
+        return partitioner_class(shard_count)
+    return partitioner_class()
+
+
+def shard_for(partitioner, record, shard_count):
+    partition_key, explicit_hash_key = partitioner.key_for(record)
+    hash_key = int(explicit_hash_key) if explicit_hash_key is not None else md5_hash_key(partition_key)
+    return shard_for_hash(hash_key, shard_count)
+
+
+# --- Local load simulation ---
+
+def simulate(strategy, shard_count, records, sessions, users, seed=0):
+    """
+    Generate records for `sessions` talks rated by `users` attendees (talk
+    popularity is skewed, as at a real event) and count records per shard.
+    """
+    rng = random.Random(seed)
+    partitioner = get_partitioner(strategy, shard_count)
+    # the first talk (the keynote) is by far the most popular
+    weights = [1.0 / (rank + 1) for rank in range(sessions)]
+    counts = [0] * shard_count
+    for _ in range(records):
+        session = rng.choices(range(sessions), weights)[0]
+        record = {
+            'RecordType': rng.choice(('SessionRating', 'SessionFeedback')),
+            'UserId': 'user-{}'.format(rng.randrange(users)),
+            'Date': '2018-06-{:02d}'.format(1 + session % 3),
+            'ID': 'Session {}'.format(session)
+        }
+        counts[shard_for(partitioner, record, shard_count)] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate per-shard load for a partition key strategy.')
+    parser.add_argument('--strategy', choices=sorted(PARTITIONERS), default=None,
+                        help='strategy to simulate (default: all of them)')
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--users', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    strategies = [args.strategy] if args.strategy else sorted(PARTITIONERS)
+    print('{} records, {} sessions, {} users, {} shards'.format(args.records, args.sessions, args.users, args.shards))
+    for strategy in strategies:
+        counts = simulate(strategy, args.shards, args.records, args.sessions, args.users, args.seed)
+        mean = float(args.records) / args.shards
+        print('{:<9} ordered={!s:<5} max/mean={:5.2f} per shard={}'.format(
+            strategy, get_partitioner(strategy, args.shards).preserves_session_order, max(counts) / mean, counts))
+
+
+if __name__ == '__main__':
+    main()
@@ -14,29 +14,113 @@ http://docs.aws.amazon.com/lex/latest/dg/getting-started.html.
 
 import json
 import datetime
-import time
+import functools
 import os
-import dateutil.parser
-import logging
-import boto3
 import random
+import time
 
-from aws_xray_sdk.core import patch_all
-
-# patch boto3 for instrumentation and tracing via xray
-patch_all()
-
-# set up logging
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
+import clients
+import comment_screen
+import dedupe
+import instrumentation
+import startup
+import structured_logging
+import locations
+import record_format
+import session_catalog
+import sentiment
+import sentiment_cache
+import sentiment_speculation
+import session_state
+from partitioning import get_partitioner
+from record_writer import RecordWriter
+from spill import SpillFile
+from slot_parsing import BotCalendar, ParsedSlots, parse_date, require_date
+
+# patch botocore (or XRAY_PATCH) for instrumentation and tracing via xray
+startup.patch_xray()
+
+# set up logging; LOG_LEVEL and LOG_DEBUG_SAMPLE_RATE control what is emitted
+logger = structured_logging.configure()
+payload = structured_logging.payload
+
+# per-phase timings as X-Ray subsegments and EMF metrics; METRICS_MODE and METRICS_SAMPLE_RATE control them
+instrumentation.configure()
 
 # collect environment variables
 kinesis_stream_name = os.environ['STREAM_NAME']
 ddb_table_name = os.environ['TABLE_NAME']
 
+# 'inline' scores feedback with Comprehend during fulfillment; 'async' writes raw feedback
+# to FEEDBACK_STREAM_NAME and leaves scoring to sentiment_enricher.py
+sentiment_mode = os.environ.get('SENTIMENT_MODE', 'inline')
+feedback_stream_name = os.environ.get('FEEDBACK_STREAM_NAME')
+if sentiment_mode == 'async' and not feedback_stream_name:
+    raise ValueError('SENTIMENT_MODE=async requires FEEDBACK_STREAM_NAME')
+
+# treat the user request as coming from the Europe/London time zone unless told otherwise
+calendar = BotCalendar(os.environ.get('BOT_TIMEZONE', 'Europe/London'), int(os.environ.get('RATING_WINDOW_DAYS', 30)))
+
+# valid session locations come from the Cities index of the sessions table, cached per container
+location_registry = locations.from_environment(ddb_table_name)
+
+# sessions scheduled each day, used to resolve the free text SessionID to a catalogued title
+catalog = session_catalog.from_environment(ddb_table_name)
+
+# comments repeat a lot, so Comprehend results are cached per container (and optionally in DynamoDB)
+sentiment_results = sentiment_cache.from_environment(ddb_table_name)
+
+# score comments in the background once they are valid, ahead of fulfillment (see sentiment_speculation.py)
+speculator = sentiment_speculation.from_environment(sentiment_results, sentiment.detect_sentiment, sentiment_mode)
+
+# comments are screened for PII, profanity and spam before any call that sends them on; see comment_screen.py
+screener = comment_screen.from_environment()
+
+# repeats of a rating or feedback already submitted (Lex retries, users sending twice) aren't written again
+deduplicator = dedupe.from_environment(ddb_table_name)
+
+# payload format of the records written to Kinesis: 'json', or 'binary' (see record_format.py)
+record_encoding = os.environ.get('RECORD_FORMAT', 'json')
+if record_encoding not in record_format.FORMATS:
+    raise ValueError('RECORD_FORMAT must be one of {}'.format(', '.join(record_format.FORMATS)))
+
+# ratings and feedback are kept in session attributes in a compact form; see session_state.py
+session_codec = session_state.from_environment()
+
+# spread records across shards; see partitioning.py for the available strategies
+partitioner = get_partitioner(os.environ.get('PARTITION_STRATEGY', 'session'), int(os.environ.get('SHARD_COUNT', 1)))
+
+# records that can't be delivered within KINESIS_DELIVERY_BUDGET_MS (throttling) are spilled to
+# KINESIS_SPILL_DIR and replayed by later invocations; an empty KINESIS_SPILL_DIR turns spilling off
+spill_directory = os.environ.get('KINESIS_SPILL_DIR', '/tmp')
+spill_max_bytes = int(os.environ.get('KINESIS_SPILL_MAX_BYTES', 64 * 1024 * 1024))
+replay_batch = int(os.environ.get('KINESIS_REPLAY_BATCH', 500))
+drain_budget = float(os.environ.get('KINESIS_DRAIN_BUDGET_MS', 20000)) / 1000
+
+
+def build_writer(stream_name):
+    return RecordWriter(
+        stream_name,
+        max_buffer_time=float(os.environ.get('KINESIS_MAX_BUFFER_TIME', 1.0)),
+        aggregate_records=os.environ.get('KINESIS_AGGREGATE', 'false').lower() == 'true',
+        max_attempts=int(os.environ.get('KINESIS_MAX_ATTEMPTS', 8)),
+        delivery_budget=float(os.environ.get('KINESIS_DELIVERY_BUDGET_MS', 300)) / 1000,
+        spill=SpillFile(spill_directory, stream_name, spill_max_bytes) if spill_directory else None
+    )
+
+
+# records are buffered and sent with put_records; lambda_handler flushes before returning
+stream_writer = build_writer(kinesis_stream_name)
+feedback_writer = build_writer(feedback_stream_name) if sentiment_mode == 'async' else stream_writer
+writers = [stream_writer] if feedback_writer is stream_writer else [stream_writer, feedback_writer]
+
+# create the clients this function uses while the container initialises
+startup.prewarm_clients(['kinesis', 'dynamodb'] + (['comprehend'] if sentiment_mode == 'inline' else []))
+
 
 # --- Helper functions that build all of the responses ---
 
+@instrumentation.traced('build_response')
 def elicit_slot(session_attributes, intent_name, slots, slot_to_elicit, message):
     return {
         'sessionAttributes': session_attributes,
@@ -50,6 +134,7 @@ def elicit_slot(session_attributes, intent_name, slots, slot_to_elicit, message)
     }
 
 
+@instrumentation.traced('build_response')
 def elicit_slot_with_card(session_attributes, intent_name, slots, slot_to_elicit, message, response_card):
     return {
         'sessionAttributes': session_attributes,
@@ -70,7 +155,8 @@ def elicit_slot_with_card(session_attributes, intent_name, slots, slot_to_elicit
 def build_options(sessions, start_from=0):
     options = []
     for i in range(start_from, len(sessions)):
-        options.append({'text': sessions[i], 'value': sessions[i]})
+        # Lex limits button text to 15 characters; the value carries the full option
+        options.append({'text': sessions[i][:15], 'value': sessions[i]})
     return options
 
 
@@ -101,6 +187,7 @@ def confirm_intent(session_attributes, intent_name, slots, message):
     }
 
 
+@instrumentation.traced('build_response')
 def close(session_attributes, fulfillment_state, message):
     response = {
         'sessionAttributes': session_attributes,
@@ -114,8 +201,9 @@ def close(session_attributes, fulfillment_state, message):
     return response
 
 
+@instrumentation.traced('build_response')
 def delegate(session_attributes, slots):
-    logger.debug('delegate session_attributes={} slots={}'.format(session_attributes, slots))
+    logger.debug('delegate session_attributes=%s slots=%s', payload(session_attributes), payload(slots))
     return {
         'sessionAttributes': session_attributes,
         'dialogAction': {
@@ -137,35 +225,57 @@ def safe_int(n):
 
 
 def get_day_difference(later_date, earlier_date):
-    later_datetime = dateutil.parser.parse(later_date).date()
-    earlier_datetime = dateutil.parser.parse(earlier_date).date()
+    later_datetime = require_date(later_date, calendar.today())
+    earlier_datetime = require_date(earlier_date, calendar.today())
     return abs(later_datetime - earlier_datetime).days
 
 
 def add_days(date, number_of_days):
-    new_date = dateutil.parser.parse(date).date()
+    new_date = require_date(date, calendar.today())
     new_date += datetime.timedelta(days=number_of_days)
     return new_date.strftime('%Y-%m-%d')
 
 
-def build_validation_result(isvalid, violated_slot, message_content):
-    return {
+def build_validation_result(isvalid, violated_slot, message_content, response_card=None):
+    result = {
         'isValid': isvalid,
         'violatedSlot': violated_slot,
         'message': {'contentType': 'PlainText', 'content': message_content}
     }
+    if response_card:
+        result['responseCard'] = response_card
+    return result
+
+
+def elicit_from_validation(session_attributes, intent_request, validation_result):
+    """
+    Clear the violated slot and re-elicit it, with a response card if validation offered one.
+    """
+    slots = intent_request['currentIntent']['slots']
+    slots[validation_result['violatedSlot']] = None
+    if 'responseCard' in validation_result:
+        return elicit_slot_with_card(
+            session_attributes,
+            intent_request['currentIntent']['name'],
+            slots,
+            validation_result['violatedSlot'],
+            validation_result['message']['content'],
+            validation_result['responseCard']
+        )
+    return elicit_slot(
+        session_attributes,
+        intent_request['currentIntent']['name'],
+        slots,
+        validation_result['violatedSlot'],
+        validation_result['message']
+    )
 
 
 # rating-bot specific validation and helper functions
 
 
 def isfuture_date(datetotest):
-    today = datetime.date.today()
-    datetotest = dateutil.parser.parse(datetotest).date()
-    if datetotest > today:
-        return True
-    else:
-        return False
+    return calendar.is_future(require_date(datetotest, calendar.today()))
 
 
 def isvalid_session_score(scoretotest):
@@ -176,27 +286,58 @@ def isvalid_session_score(scoretotest):
 
 
 def isvalid_location(location):
-    # TODO: move these external to the function and store them in a DynamoDB table
-    valid_locations = ['london', 'leeds', 'manchester', 'tel aviv', 'new york', 'san francisco', 'seattle', 'stockholm',
-                       'dublin', 'helsinki', 'singapore', 'dummy']
-    return location.lower() in valid_locations
+    with instrumentation.span('locations'):
+        return location_registry.resolve(location) is not None
+
+
+def canonical_location(location):
+    """
+    Return the registry's name for location (so 'NYC' is recorded as 'New York'), title cased.
+    """
+    if not location:
+        return None
+    return (location_registry.resolve(location) or location).title()
 
 
 def isvalid_date(date):
-    try:
-        dateutil.parser.parse(date)
-        return True
-    except ValueError:
-        return False
+    return parse_date(date, calendar.today()) is not None
 
 
+# the window is RATING_WINDOW_DAYS long, 30 days unless configured otherwise
 def within_30_days(datetotest):
-    datetotest = dateutil.parser.parse(datetotest).date()
-    thirtydaysago = datetime.date.today() - datetime.timedelta(days=30)
-    if datetotest > thirtydaysago:
-        return True
-    else:
-        return False
+    return calendar.within_window(require_date(datetotest, calendar.today()))
+
+
+# Lex response cards hold at most 5 buttons
+MAX_CARD_OPTIONS = 5
+
+
+def validate_session_id(session_id, session_date, session_day, session_location):
+    """
+    Resolve session_id against the catalog for session_day. Returns a failed
+    validation result, or the catalog's title for the session (None if the
+    day isn't catalogued).
+    """
+    with instrumentation.span('session_catalog'):
+        outcome, titles = catalog.resolve(session_id, session_day, location_registry.resolve(session_location))
+    if outcome == 'match':
+        return None, titles
+    if outcome == 'ambiguous':
+        return build_validation_result(
+            False,
+            'SessionID',
+            'I found more than one session like {}. Which one did you mean?'.format(session_id),
+            build_response_card('Which session?', session_date, titles[:MAX_CARD_OPTIONS])
+        ), None
+    if outcome == 'unknown':
+        return build_validation_result(
+            False,
+            'SessionID',
+            'I couldn\'t find a session called {} on {}. Which session was it?'.format(session_id, session_date),
+            build_response_card('Sessions on {}'.format(session_date), 'Select a session or type its title',
+                                titles[:MAX_CARD_OPTIONS])
+        ), None
+    return None, None
 
 
 def isvalid_session_comments(session_comments):
@@ -206,23 +347,26 @@ def isvalid_session_comments(session_comments):
         return False
 
 
-# Collect sentiment score (Amazon Comprehend implementation)
+# Collect sentiment score (Amazon Comprehend implementation, behind the sentiment cache)
+def detect_sentiment(text):
+    with instrumentation.span('comprehend'):
+        return sentiment.detect_sentiment(text)
+
+
 def get_sentiment(text):
-    comprehend = boto3.client('comprehend')
-    resp = comprehend.detect_sentiment(
-        Text=text,
-        LanguageCode='en')
-    del resp['ResponseMetadata']
-    print(resp['SentimentScore'][resp['Sentiment'].title()])
-    resp['Confidence'] = resp['SentimentScore'][resp['Sentiment'].title()]
-    del resp['SentimentScore']
+    resp = sentiment_results.get_or_compute(text, detect_sentiment)
+    logger.debug('get_sentiment result=%s cache stats=%s', resp, sentiment_results.stats)
     return resp
 
 
+@instrumentation.traced('validate')
 def validate_rating(slots):
     logger.debug('Initating validation of rating')
+    parsed_slots = ParsedSlots(slots, calendar.today())
     session_id = slots.get('SessionID')
     session_date = slots.get('SessionDate')
+    with instrumentation.span('parse_dates'):
+        session_day = parsed_slots.date('SessionDate')
     session_location = slots.get('SessionLocation')
     session_score = safe_int(slots.get('SessionScore'))
 
@@ -234,7 +378,7 @@ def validate_rating(slots):
                 session_location)
         )
 
-    if session_date and not isvalid_date(session_date):
+    if session_date and session_day is None:
         return build_validation_result(
             False,
             'SessionDate',
@@ -249,28 +393,40 @@ def validate_rating(slots):
             '{} is not a valid session score. Please enter a score between 1 and 5'.format(session_score)
         )
 
-    if session_date and isfuture_date(session_date):
+    if session_date and calendar.is_future(session_day):
         return build_validation_result(
             False,
             'SessionDate',
             '{} is in the future. Please enter a date in the past, or today\'s date'.format(session_date)
         )
 
-    if session_date and not within_30_days(session_date):
+    if session_date and not calendar.within_window(session_day):
         return build_validation_result(
             False,
             'SessionDate',
-            '{} is more than 30 days ago and I only record for sessions in the last 30 days. Please enter a more recent date or leave a rating more promptly next time.'.format(
-                session_date)
+            '{} is more than {} days ago and I only record for sessions in the last {} days. Please enter a more recent date or leave a rating more promptly next time.'.format(
+                session_date, calendar.window_days, calendar.window_days)
         )
 
-    return {'isValid': True}
+    resolved_slots = {}
+    if session_id and session_day:
+        failed_validation, title = validate_session_id(session_id, session_date, session_day, session_location)
+        if failed_validation:
+            return failed_validation
+        if title:
+            resolved_slots['SessionID'] = title
 
+    return {'isValid': True, 'resolvedSlots': resolved_slots}
 
+
+@instrumentation.traced('validate')
 def validate_feedback(slots):
     logger.debug('Initating validation of feedback')
+    parsed_slots = ParsedSlots(slots, calendar.today())
     session_id = slots.get('SessionID')
     session_date = slots.get('SessionDate')
+    with instrumentation.span('parse_dates'):
+        session_day = parsed_slots.date('SessionDate')
     session_location = slots.get('SessionLocation')
     session_comments = slots.get('SessionComments')
 
@@ -282,7 +438,7 @@ def validate_feedback(slots):
                 session_location)
         )
 
-    if session_date and not isvalid_date(session_date):
+    if session_date and session_day is None:
         return build_validation_result(
             False,
             'SessionDate',
@@ -290,21 +446,29 @@ def validate_feedback(slots):
                 session_date)
         )
 
-    if session_date and isfuture_date(session_date):
+    if session_date and calendar.is_future(session_day):
         return build_validation_result(
             False,
             'SessionDate',
             '{} is in the future. Please enter a date in the past, or today\'s date'.format(session_date)
         )
 
-    if session_date and not within_30_days(session_date):
+    if session_date and not calendar.within_window(session_day):
         return build_validation_result(
             False,
             'SessionDate',
-            '{} is more than 30 days ago and I only record feedback for sessions in the last 30 days. Please enter a more recent date or leave your feedback more promptly next time.'.format(
-                session_date)
+            '{} is more than {} days ago and I only record feedback for sessions in the last {} days. Please enter a more recent date or leave your feedback more promptly next time.'.format(
+                session_date, calendar.window_days, calendar.window_days)
         )
 
+    resolved_slots = {}
+    if session_id and session_day:
+        failed_validation, title = validate_session_id(session_id, session_date, session_day, session_location)
+        if failed_validation:
+            return failed_validation
+        if title:
+            resolved_slots['SessionID'] = title
+
     # once we have everything else, prompt for feedback
 
     if (session_id and session_location and session_date) and not isvalid_session_comments(session_comments):
@@ -314,11 +478,24 @@ def validate_feedback(slots):
             'I didn\'t get your feedback. What did you think of the session?'
         )
 
-    return {'isValid': True}
+    if session_comments:
+        with instrumentation.span('screen_comments'):
+            screened = screener.screen(session_comments)
+        if screened.rejected:
+            return build_validation_result(
+                False,
+                'SessionComments',
+                'Sorry, I can\'t accept feedback that looks like advertising. What did you think of the session?'
+            )
+        if screened.text != session_comments:
+            # keep only the masked comments from here on
+            resolved_slots['SessionComments'] = screened.text
+
+    return {'isValid': True, 'resolvedSlots': resolved_slots}
 
 
 def validate_testing(slots):
-    logger.debug('Initiating validation of testing with slots{}'.format(slots))
+    logger.debug('Initiating validation of testing with slots=%s', payload(slots))
     test_target = slots.get('test_target')
     if test_target and test_target not in ["A", "B", "C"]:
         return build_validation_result(
@@ -329,6 +506,31 @@ def validate_testing(slots):
     return {'isValid': True}
 
 
+# Records written to the streams (also built by tools/backfill.py)
+
+
+def build_rating_record(slots, user_id):
+    return {
+        'RecordType': 'SessionRating',
+        'UserId': user_id,
+        'Location': canonical_location(slots.get('SessionLocation')),
+        'Date': slots.get('SessionDate'),
+        'Score': safe_int(slots['SessionScore']),
+        'ID': slots.get('SessionID').title() if slots.get('SessionID') else None
+    }
+
+
+def build_feedback_record(slots, user_id):
+    return {
+        'RecordType': 'SessionFeedback',
+        'UserId': user_id,
+        'Location': canonical_location(slots.get('SessionLocation')),
+        'Date': slots.get('SessionDate'),
+        'SessionComments': slots.get('SessionComments'),
+        'ID': slots.get('SessionID').title() if slots.get('SessionID') else None
+    }
+
+
 # Functions that control the rating-bot bot's behavior
 
 
@@ -337,7 +539,7 @@ def provide_feedback(intent_request):
     Performs fulfillment for the ProvideFeedback intent.
     """
 
-    logger.debug('provide_feedback intent_request={}'.format(intent_request))
+    logger.debug('provide_feedback intent_request=%s', payload(intent_request))
 
     """
     DESIGN Q
@@ -346,71 +548,73 @@ def provide_feedback(intent_request):
     First is to do that here, within the fulfilment function
     Second is to use another kinesis stream, and write a second lambda function for the sentiment analysis so it's async
 
-    ** for now we're doing it here because Amazon Comprehend doesn't introduce significant latency and it makes for a nice visualisation in Amazon X-Ray
+    ** both are supported: SENTIMENT_MODE=inline scores the comments here, SENTIMENT_MODE=async writes the raw
+    feedback to the feedback stream and sentiment_enricher.py adds the sentiment score in batches
 
     """
     current_intent = intent_request.get('currentIntent', {})
     slots = current_intent.get('slots', {})
-    session_id = slots.get('SessionID').title() if slots.get('SessionID') else None
-    session_date = slots.get('SessionDate')
-    session_location = slots.get('SessionLocation').title() if slots.get('SessionLocation') else None
     session_comments = slots.get('SessionComments')
-    user_id = intent_request.get('user_id')
     confirmation_status = current_intent.get('confirmationStatus')
-    session_attributes = intent_request.get('sessionAttributes', {})
+    session_attributes = intent_request.get('sessionAttributes') or {}
 
-    session_feedback = {
-        'RecordType': 'SessionFeedback',
-        'UserId': user_id,
-        'Location': session_location,
-        'Date': session_date,
-        'SessionComments': session_comments,
-        'ID': session_id
-    }
+    session_feedback = build_feedback_record(slots, intent_request.get('userId'))
 
-    session_attributes['currentFeedback'] = json.dumps(session_feedback)
+    session_codec.store(session_attributes, 'currentFeedback', session_feedback)
 
     if intent_request['invocationSource'] == 'DialogCodeHook':
         # Validate any slots which have been specified.  If any are invalid, re-elicit for their value
         validation_result = validate_feedback(intent_request['currentIntent']['slots'])
         if not validation_result['isValid']:
-            slots = intent_request['currentIntent']['slots']
-            slots[validation_result['violatedSlot']] = None
-            return elicit_slot(
-                session_attributes,
-                intent_request['currentIntent']['name'],
-                slots,
-                validation_result['violatedSlot'],
-                validation_result['message']
-            )
+            return elicit_from_validation(session_attributes, intent_request, validation_result)
+
+        # record the catalogued session title (and the screened comments) rather than what the user typed
+        intent_request['currentIntent']['slots'].update(validation_result['resolvedSlots'])
+
+        # the comments are valid, so start scoring them while Lex asks the user to confirm
+        session_comments = intent_request['currentIntent']['slots'].get('SessionComments')
+        if isvalid_session_comments(session_comments):
+            speculator.start(session_comments)
+
         return delegate(session_attributes, intent_request['currentIntent']['slots'])
 
     # slots are all populated
 
-    # get the sentiment score from Amazon Comprehend
-    comprehend_sentiment_result = get_sentiment(session_comments)
+    # screened on the dialog turn already; this makes sure nothing unscreened is scored or written
+    if session_comments:
+        with instrumentation.span('screen_comments'):
+            session_comments = screener.screen(session_comments).text
+        session_feedback['SessionComments'] = session_comments
 
-    # create a new session_feedback object containing all the slots, plus the sentiment score.
-    # This will be the payload for our Kinesis stream to Elasticsearch
-    session_feedback['ComprehendSentimentResult'] = comprehend_sentiment_result
+    if not deduplicator.claim(dedupe.record_key(session_feedback)):
+        # already submitted; thank the user again without scoring or writing it twice
+        logger.debug('Duplicate feedback suppressed for %s', payload(session_feedback))
+        session_attributes.pop(sentiment_speculation.ATTRIBUTE, None)
+    else:
+        # normally scored on an earlier turn; see sentiment_speculation.py
+        comprehend_sentiment_result = speculator.lookup(session_attributes, session_comments)
+        if comprehend_sentiment_result is None and sentiment_mode == 'inline':
+            # get the sentiment score from Amazon Comprehend
+            comprehend_sentiment_result = get_sentiment(session_comments)
 
-    # Leave feedback on the session.  Write log mesage and rating object to Kinesis stream in this case.
-    # write some debugging to let us know that we're doing this.
+        if comprehend_sentiment_result is not None:
+            # create a new session_feedback object containing all the slots, plus the sentiment score.
+            # This will be the payload for our Kinesis stream to Elasticsearch
+            session_feedback['ComprehendSentimentResult'] = comprehend_sentiment_result
 
-    logger.debug('Attempting to fulfill ProvideFeedback under={}'.format(session_feedback))
+        # Leave feedback on the session.  Write log mesage and rating object to Kinesis stream in this case.
+        # write some debugging to let us know that we're doing this.
 
-    # kinesis_stream_name comes from the global which we populated with the environment variable
-    kinesis = boto3.client('kinesis')
-    put_response = kinesis.put_record(
-        StreamName=kinesis_stream_name,
-        Data=session_feedback,
-        PartitionKey='feedback'
-    )
+        logger.debug('Attempting to fulfill ProvideFeedback under=%s', payload(session_feedback))
 
-    logger.debug('Rating posted to stream response={}'.format(put_response))
+        # feedback_writer buffers the record; it is sent to its stream before lambda_handler returns
+        partition_key, explicit_hash_key = partitioner.key_for(session_feedback)
+        feedback_writer.put(record_format.encode(session_feedback, record_encoding), partition_key, explicit_hash_key)
+
+        logger.debug('Feedback buffered for stream, %d records pending', len(feedback_writer))
 
     session_attributes.pop('currentFeedback', None)
-    session_attributes['lastConfirmedFeedback'] = session_feedback
+    session_codec.store(session_attributes, 'lastConfirmedFeedback', session_feedback)
 
     # return with a confirmation message.
     return close(
@@ -428,63 +632,43 @@ def rate_session(intent_request):
     Performs fulfillment for the RateSession intent.
     """
 
-    logger.debug('rate_session intent_request={}'.format(intent_request))
+    logger.debug('rate_session intent_request=%s', payload(intent_request))
     current_intent = intent_request.get('currentIntent', {})
     slots = current_intent.get('slots', {})
-    session_id = slots.get('SessionID').title() if slots.get('SessionID') else None
-    session_date = slots.get('SessionDate')
-    session_location = slots.get('SessionLocation').title() if slots.get('SessionLocation') else None
-    user_id = intent_request.get('user_id')
     confirmation_status = current_intent.get('confirmationStatus')
-    session_attributes = intent_request.get('sessionAttributes', {})
-    session_score = safe_int(slots['SessionScore'])
-
-    session_rating = json.dumps({
-        'RecordType': 'SessionRating',
-        'UserId': user_id,
-        'Location': session_location,
-        'Date': session_date,
-        'Score': session_score,
-        'ID': session_id
-    })
+    session_attributes = intent_request.get('sessionAttributes') or {}
 
-    session_attributes['currentRating'] = session_rating
+    rating_record = build_rating_record(slots, intent_request.get('userId'))
+    session_codec.store(session_attributes, 'currentRating', rating_record)
 
     if intent_request['invocationSource'] == 'DialogCodeHook':
         # Validate any slots which have been specified.  If any are invalid, re-elicit for their value
         validation_result = validate_rating(intent_request['currentIntent']['slots'])
         if not validation_result['isValid']:
-            slots = intent_request['currentIntent']['slots']
-            slots[validation_result['violatedSlot']] = None
-
-            return elicit_slot(
-                session_attributes,
-                intent_request['currentIntent']['name'],
-                slots,
-                validation_result['violatedSlot'],
-                validation_result['message']
-            )
+            return elicit_from_validation(session_attributes, intent_request, validation_result)
 
+        # record the catalogued session title rather than what the user typed
+        intent_request['currentIntent']['slots'].update(validation_result['resolvedSlots'])
         return delegate(session_attributes, intent_request['currentIntent']['slots'])
 
     # Slots are all populated.
 
-    # Rate the session.  Write log mesage and rating object to Kinesis stream in this case.
-    # first, write some debugging to let us know that we're doing this.
-    logger.debug('Attempting to fulfill RateSession under={}'.format(session_rating))
+    if not deduplicator.claim(dedupe.record_key(rating_record)):
+        # already submitted; thank the user again without writing it twice
+        logger.debug('Duplicate rating suppressed for %s', payload(rating_record))
+    else:
+        # Rate the session.  Write log mesage and rating object to Kinesis stream in this case.
+        # first, write some debugging to let us know that we're doing this.
+        logger.debug('Attempting to fulfill RateSession under=%s', payload(rating_record))
 
-    # kinesis_stream_name comes from the global which we populate from the environment variable
-    kinesis = boto3.client('kinesis')
-    put_response = kinesis.put_record(
-        StreamName=kinesis_stream_name,
-        Data=session_rating,
-        PartitionKey='rating'
-    )
+        # stream_writer buffers the record; it is sent to kinesis_stream_name before lambda_handler returns
+        partition_key, explicit_hash_key = partitioner.key_for(rating_record)
+        stream_writer.put(record_format.encode(rating_record, record_encoding), partition_key, explicit_hash_key)
 
-    logger.debug('Rating posted to stream response={}'.format(put_response))
+        logger.debug('Rating buffered for stream, %d records pending', len(stream_writer))
 
     session_attributes.pop('currentRating', None)
-    session_attributes['lastConfirmedRating'] = session_rating
+    session_codec.store(session_attributes, 'lastConfirmedRating', rating_record)
 
     # return with a confirmation message
     return close(
@@ -497,49 +681,6 @@ def rate_session(intent_request):
     )
 
 
-def thanks(intent_request):
-    """
-    Performs fulfillment for the HelpMe intent.
-    """
-    session_attributes = intent_request['sessionAttributes'] if intent_request['sessionAttributes'] is not None else {}
-
-    # populate a list with a few options for saying thanks!
-    thanks_content_options = ['No problem!', 'You are very welcome.', 'Happy to help.', 'That\'s fine.',
-                              'No. Thank you.', 'Any time.']
-
-    return close(
-        session_attributes,
-        'Fulfilled',
-        {
-            'contentType': 'PlainText',
-            'content': random.choice(thanks_content_options)
-        }
-    )
-
-
-def cancel_request(intent_request):
-    """
-    Performs fulfillment for the HelpMe intent.
-    """
-    session_attributes = intent_request['sessionAttributes'] if intent_request['sessionAttributes'] is not None else {}
-
-    # popluate a list with a few options that we can use to respond to the cancel intent
-    cancel_content_options = [
-        'No problem. Let me know if I can help with anything else.',
-        'Let me know if you need anything else in future.',
-        'OK. Chat to you again soon.'
-    ]
-
-    return close(
-        session_attributes,
-        'Fulfilled',
-        {
-            'contentType': 'PlainText',
-            'content': random.choice(cancel_content_options)
-        }
-    )
-
-
 def testing(intent_request):
     """
     Performs fulfillment for the HelpMe intent.
@@ -570,7 +711,7 @@ def testing(intent_request):
                 build_response_card("title", "subtitle", ["A", "B", "C"])
             )
 
-            logger.debug("elicit_slot_with_card generated : {}".format(json.dumps(response)))
+            logger.debug('elicit_slot_with_card generated : %s', payload(response))
 
             return response
 
@@ -590,32 +731,164 @@ def testing(intent_request):
     )
 
 
+# --- Fixed responses ---
+
+
+def build_static_responses(messages, response_card=None, fulfillment_state='Fulfilled'):
+    """
+    Build one Close response per message, once, for intents whose answer doesn't depend on the request.
+    """
+    responses = []
+    for content in messages:
+        response = close(None, fulfillment_state, {'contentType': 'PlainText', 'content': content})
+        if response_card is not None:
+            response['dialogAction']['responseCard'] = response_card
+        responses.append(response)
+    return tuple(responses)
+
+
+def static_response(responses, intent_request):
+    """
+    Answer with one of responses, prebuilt by build_static_responses. Only the
+    session attributes are the request's own; the dialogAction is shared, so
+    callers must not change it.
+    """
+    session_attributes = intent_request.get('sessionAttributes')
+    return dict(random.choice(responses), sessionAttributes=session_attributes if session_attributes is not None else {})
+
+
+# intent -> (messages, one picked at random per request; response card or None).
+# The informational intents' messages are the conclusion statements in lex-export/.
+STATIC_INTENTS = {
+    'HelpMe': (
+        ["Hi there! Right now I can rate or take feedback on sessions or events where you've seen Ian speak. "
+         "Just say 'I want to rate a session' or 'I want to leave feedback'. I need to know the date, time, "
+         "location and the session title. If you want to know more about how I work, ask for GitHub details "
+         "and check out the code, or ask for Ian's email and drop him an email."],
+        build_response_card('What would you like to do?', 'Pick one, or just ask',
+                            ['Rate a session', 'Leave feedback', 'GitHub details'])
+    ),
+    'TwitterInfo': (
+        ["Sure. I'm on Twitter at https://twitter.com/IanMmmm. Follow me there.",
+         "You can find me on Twitter at https://twitter.com/IanMmmm. Don't forget to click follow :)"],
+        None
+    ),
+    'EmailInfo': (
+        ['You can reach me via email at ianm@amazon.com',
+         'My email address is ianm@amazon.com'],
+        None
+    ),
+    'GithubInfo': (
+        ['You can find my Github account at https://github.com/ianmas-aws',
+         'My Github account is at https://github.com/ianmas-aws',
+         'You can find me on Github at https://github.com/ianmas-aws'],
+        None
+    ),
+    'Thanks': (
+        ['No problem!', 'You are very welcome.', 'Happy to help.', 'That\'s fine.', 'No. Thank you.', 'Any time.'],
+        None
+    ),
+    'CancelRequest': (
+        ['No problem. Let me know if I can help with anything else.',
+         'Let me know if you need anything else in future.',
+         'OK. Chat to you again soon.'],
+        None
+    )
+}
+
+STATIC_RESPONSES = dict((name, build_static_responses(messages, card))
+                        for name, (messages, card) in STATIC_INTENTS.items())
+
+# answers for an intent whose handler raised, rather than an error Lex shows and the user retries
+INTENT_FALLBACKS = {
+    'RateSession': build_static_responses(
+        ["Sorry, I couldn't take your rating just now. Please try again in a minute."], fulfillment_state='Failed'),
+    'ProvideFeedback': build_static_responses(
+        ["Sorry, I couldn't take your feedback just now. Please try again in a minute."], fulfillment_state='Failed')
+}
+
+UNKNOWN_INTENT_RESPONSES = build_static_responses(
+    ["Sorry, I can't help with that yet. Say 'help' to hear what I can do."], fulfillment_state='Failed')
+
+
 # --- Intent router ---
 
+INTENT_HANDLERS = {
+    'RateSession': rate_session,
+    'ProvideFeedback': provide_feedback,
+    'Testing': testing
+}
+INTENT_HANDLERS.update((name, functools.partial(static_response, responses))
+                       for name, responses in STATIC_RESPONSES.items())
+
 
+@instrumentation.traced('dispatch')
 def dispatch(intent_request):
     """
     Called when the user specifies an intent for this bot.
     """
 
-    logger.debug(
-        'dispatch userId={}, intentName={}'.format(intent_request['userId'], intent_request['currentIntent']['name']))
+    logger.debug('dispatch userId=%s, intentName=%s', intent_request['userId'], intent_request['currentIntent']['name'])
 
     intent_name = intent_request['currentIntent']['name']
 
-    # Dispatch to the bot's intent handlers
-    if intent_name == 'Testing':
-        return testing(intent_request)
-    if intent_name == 'CancelRequest':
-        return cancel_request(intent_request)
-    if intent_name == 'Thanks':
-        return thanks(intent_request)
-    if intent_name == 'RateSession':
-        return rate_session(intent_request)
-    elif intent_name == 'ProvideFeedback':
-        return provide_feedback(intent_request)
+    handler = INTENT_HANDLERS.get(intent_name)
+    if handler is None:
+        logger.warning('Intent with name %s not supported', intent_name)
+        instrumentation.count('UnknownIntent')
+        return static_response(UNKNOWN_INTENT_RESPONSES, intent_request)
 
-    raise Exception('Intent with name ' + intent_name + ' not supported')
+    fallback = INTENT_FALLBACKS.get(intent_name)
+    if fallback is None:
+        return handler(intent_request)
+    try:
+        return handler(intent_request)
+    except Exception:
+        logger.exception('%s failed, answering with its fallback', intent_name)
+        instrumentation.count('IntentFallback')
+        return static_response(fallback, intent_request)
+
+
+# --- Spilled record replay ---
+
+
+def replay_spilled(limit, budget=None):
+    """
+    Resend spilled records for every stream. A replay failure is logged, never
+    raised, so it can't fail the request it piggybacks on.
+    """
+    replayed = 0
+    for writer in writers:
+        try:
+            replayed += writer.replay(limit, budget)
+        except Exception:
+            logger.exception('Replaying spilled records for %s failed', writer.stream_name)
+    return replayed
+
+
+def drain_spill(event, context):
+    """
+    Handle a scheduled event: replay this container's spill files until they
+    are empty, or the drain budget (or the invocation's remaining time) runs out.
+    """
+    instrumentation.start_request(Intent='DrainSpill', InvocationSource=event.get('source'))
+    try:
+        budget = drain_budget
+        if context is not None:
+            # leave a second to rewrite the spill file and return
+            budget = min(budget, context.get_remaining_time_in_millis() / 1000.0 - 1)
+        deadline = time.monotonic() + budget
+        replayed = 0
+        while time.monotonic() < deadline and any(writer.spill.size() for writer in writers):
+            batch_replayed = replay_spilled(replay_batch, deadline - time.monotonic())
+            if not batch_replayed:
+                break
+            replayed += batch_replayed
+        remaining = sum(writer.spill.size() for writer in writers)
+        logger.info('drain_spill replayed %d records, %d bytes still spilled', replayed, remaining)
+        return {'replayed': replayed, 'spilledBytes': remaining}
+    finally:
+        instrumentation.finish_request()
 
 
 # --- Main handler ---
@@ -626,14 +899,53 @@ def lambda_handler(event, context):
     Route the incoming request based on intent.
     The JSON body of the request is provided in the event slot.
     """
-    # By default, treat the user request as coming from the Europe/London time zone.
-    os.environ['TZ'] = 'Europe/London'
-    time.tzset()
-
-    logger.debug('event.bot.name={}'.format(event['bot']['name']))
-    logger.debug('event={}'.format(event))
+    # sampled requests log their full (redacted) payloads at DEBUG
+    structured_logging.start_request()
 
-    response = dispatch(event)
-    logger.debug('lambda_handler returning with response={}'.format(json.dumps(response)))
+    # the schedule in template.yml drains spilled records from warm containers
+    if event.get('source') == 'aws.events':
+        return drain_spill(event, context) if stream_writer.spill else {'replayed': 0, 'spilledBytes': 0}
 
-    return response
+    instrumentation.start_request(
+        Intent=event.get('currentIntent', {}).get('name'),
+        InvocationSource=event.get('invocationSource')
+    )
+    speculator.start_turn(context)
+    deduplicator.start_turn()
+    try:
+        logger.debug('event.bot.name=%s', event['bot']['name'])
+        logger.debug('event=%s', payload(event))
+
+        response = dispatch(event)
+
+        # make sure nothing is left in the buffer when the container is frozen
+        spilled = sum(writer.stats['spilled_records'] for writer in writers)
+        with instrumentation.span('kinesis_flush'):
+            stream_writer.flush()
+            feedback_writer.flush()
+        logger.debug('stream writer stats=%s', stream_writer.stats)
+
+        # catch up on records spilled by earlier invocations, unless this one was throttled too
+        if (spilled == sum(writer.stats['spilled_records'] for writer in writers)
+                and any(writer.spill and writer.spill.size() for writer in writers)):
+            with instrumentation.span('kinesis_replay'):
+                replay_spilled(replay_batch)
+
+        # hand a finished speculative sentiment to the next turn
+        with instrumentation.span('sentiment_speculation'):
+            speculator.settle(response.get('sessionAttributes'))
+
+        if response.get('dialogAction', {}).get('fulfillmentState') == 'Failed':
+            # nothing was fulfilled, so a retry isn't a duplicate
+            deduplicator.release()
+
+        logger.debug('lambda_handler returning with response=%s', payload(response))
+        logger.debug('boto3 client stats=%s', clients.client_stats())
+
+        return response
+    except Exception:
+        # the turn failed and Lex will retry it; let the retry through
+        deduplicator.release()
+        raise
+    finally:
+        instrumentation.finish_request()
@@ -0,0 +1,226 @@
+"""
+Kinesis payload formats for SessionRating and SessionFeedback records.
+
+Records used to go on the streams as JSON, repeating every field name in
+every record. The binary format keeps the field names (and their order) in
+a schema registry instead:
+
+    0xC1 | schema id (varint) | presence bitmap (varint) | fields in schema order
+
+Each field is encoded by type: strings as a varint length and UTF-8 bytes,
+unsigned integers as varints, ISO dates as a varint day number, and
+sentiment results as an enum byte plus a little-endian double. 0xC1 can't
+start a UTF-8 (and so a JSON) payload, so decode() tells the formats apart
+by the first byte and consumers read both during a migration.
+
+Schemas are never changed once records have been written with them: adding
+or changing a field means registering a new schema id for the record type
+and pointing CURRENT_SCHEMAS at it, while the old id stays decodable.
+
+encode() falls back to JSON for records the current schema can't represent
+exactly (an unknown field, a non-ISO date, a negative score, a null), so
+nothing is lost. Fields absent from a record are absent from the decoded
+record too, as they are from the JSON document. Elasticsearch needs JSON:
+firehose_transform.py decodes records on their way from the ratings stream
+to Firehose.
+
+"""
+
+import datetime
+import json
+import struct
+
+FORMAT_MARKER = 0xC1
+_marker = bytes([FORMAT_MARKER])
+
+EPOCH = datetime.date(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+SENTIMENTS = ('POSITIVE', 'NEGATIVE', 'NEUTRAL', 'MIXED')
+SENTIMENT_CODES = dict((name, code) for code, name in enumerate(SENTIMENTS))
+
+_double = struct.Struct('<d')
+
+
+def encode_varint(value):
+    out = bytearray()
+    while True:
+        bits = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def decode_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+class Unrepresentable(Exception):
+    """
+    Raised by a field encoder for a value the binary format can't hold exactly.
+    """
+
+
+# --- Field types: (encode(value) -> bytes, decode(buf, pos) -> (value, pos)) ---
+
+def _encode_str(value):
+    if not isinstance(value, str):
+        raise Unrepresentable(value)
+    data = value.encode('utf-8')
+    return encode_varint(len(data)) + data
+
+
+def _decode_str(buf, pos):
+    length, pos = decode_varint(buf, pos)
+    return bytes(buf[pos:pos + length]).decode('utf-8'), pos + length
+
+
+def _encode_uint(value):
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise Unrepresentable(value)
+    return encode_varint(value)
+
+
+def _encode_date(value):
+    # only canonical YYYY-MM-DD strings, so decoding gives back exactly the same text
+    if not isinstance(value, str) or len(value) != 10 or value[4] != '-' or value[7] != '-':
+        raise Unrepresentable(value)
+    try:
+        day = datetime.date(int(value[:4]), int(value[5:7]), int(value[8:]))
+    except ValueError:
+        raise Unrepresentable(value)
+    if day.year < 1970 or day.isoformat() != value:
+        raise Unrepresentable(value)
+    return encode_varint(day.toordinal() - EPOCH_ORDINAL)
+
+
+def _decode_date(buf, pos):
+    days, pos = decode_varint(buf, pos)
+    return datetime.date.fromordinal(days + EPOCH_ORDINAL).isoformat(), pos
+
+
+def _encode_sentiment(value):
+    if (not isinstance(value, dict) or set(value) != {'Sentiment', 'Confidence'}
+            or value['Sentiment'] not in SENTIMENT_CODES or not isinstance(value['Confidence'], float)):
+        raise Unrepresentable(value)
+    return bytes([SENTIMENT_CODES[value['Sentiment']]]) + _double.pack(value['Confidence'])
+
+
+def _decode_sentiment(buf, pos):
+    return {'Sentiment': SENTIMENTS[buf[pos]], 'Confidence': _double.unpack_from(buf, pos + 1)[0]}, pos + 9
+
+
+FIELD_TYPES = {
+    'str': (_encode_str, _decode_str),
+    'uint': (_encode_uint, decode_varint),
+    'date': (_encode_date, _decode_date),
+    'sentiment': (_encode_sentiment, _decode_sentiment)
+}
+
+
+class Schema(object):
+
+    def __init__(self, schema_id, record_type, fields):
+        self.schema_id = schema_id
+        self.record_type = record_type
+        self.fields = fields
+        self.names = frozenset(name for name, _ in fields) | {'RecordType'}
+        self._header = _marker + encode_varint(schema_id)
+        self._encoders = [(name, FIELD_TYPES[field_type][0]) for name, field_type in fields]
+        self._decoders = [(name, FIELD_TYPES[field_type][1]) for name, field_type in fields]
+
+    def encode(self, record):
+        """
+        Return record in the binary format; raises Unrepresentable if it can't be encoded exactly.
+        """
+        if not self.names.issuperset(record):
+            raise Unrepresentable(set(record) - self.names)
+        presence = 0
+        body = []
+        for index, (name, encoder) in enumerate(self._encoders):
+            if name not in record:
+                continue
+            presence |= 1 << index
+            body.append(encoder(record[name]))
+        return self._header + encode_varint(presence) + b''.join(body)
+
+    def decode(self, buf, pos):
+        presence, pos = decode_varint(buf, pos)
+        record = {'RecordType': self.record_type}
+        for index, (name, decoder) in enumerate(self._decoders):
+            if presence & (1 << index):
+                record[name], pos = decoder(buf, pos)
+        return record
+
+
+# the registry: schema id -> Schema. Never edit or remove an entry that has been deployed.
+SCHEMAS = dict((schema.schema_id, schema) for schema in [
+    Schema(1, 'SessionRating', [
+        ('UserId', 'str'), ('Location', 'str'), ('Date', 'date'), ('Score', 'uint'), ('ID', 'str')
+    ]),
+    Schema(2, 'SessionFeedback', [
+        ('UserId', 'str'), ('Location', 'str'), ('Date', 'date'), ('SessionComments', 'str'), ('ID', 'str'),
+        ('ComprehendSentimentResult', 'sentiment')
+    ])
+])
+
+# record type -> schema new records are written with
+CURRENT_SCHEMAS = {
+    'SessionRating': SCHEMAS[1],
+    'SessionFeedback': SCHEMAS[2]
+}
+
+FORMATS = ('json', 'binary')
+
+
+def encode(record, record_format='json'):
+    """
+    Serialize record for a stream in record_format ('json' or 'binary').
+    """
+    if record_format == 'binary':
+        schema = CURRENT_SCHEMAS.get(record.get('RecordType'))
+        if schema is not None:
+            try:
+                return schema.encode(record)
+            except Unrepresentable:
+                pass
+    elif record_format != 'json':
+        raise ValueError('Unknown record format {}'.format(record_format))
+    return json.dumps(record).encode('utf-8')
+
+
+def decode(data):
+    """
+    Return the record in a payload of either format. Raises ValueError if
+    data is neither valid JSON nor a record with a registered schema.
+    """
+    if data[:1] == _marker:
+        try:
+            schema_id, pos = decode_varint(data, 1)
+            schema = SCHEMAS[schema_id]
+            return schema.decode(data, pos)
+        except (KeyError, IndexError, struct.error, UnicodeDecodeError) as e:
+            raise ValueError('Undecodable binary record: {!r}'.format(e))
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def to_json(data):
+    """
+    Return a payload of either format as JSON bytes.
+    """
+    if data[:1] != _marker:
+        return data
+    return json.dumps(decode(data)).encode('utf-8')
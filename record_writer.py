@@ -0,0 +1,375 @@
+"""
+Buffered, batched writer for the rating-bot Kinesis stream.
+
+RecordWriter collects records and sends them with put_records (up to 500
+records / 5 MB per call) instead of one put_record call per record. It
+flushes when the buffer reaches its size threshold, when the oldest buffered
+record is older than max_buffer_time, and whenever flush() is called - the
+Lambda handler calls it before returning so nothing is left behind in a
+frozen container.
+
+With aggregate_records=True, small logical records that share a partition key are
+packed into a single Kinesis record using the KPL aggregated record format
+(magic bytes + protobuf AggregatedRecord + MD5 digest). Kinesis Data Firehose
+and the KCL de-aggregate this format transparently, and deaggregate() below
+does the same for our own consumers.
+
+Records that fail inside a partially successful put_records call
+(FailedRecordCount > 0), typically with ProvisionedThroughputExceededException,
+are retried on their own with jittered exponential backoff. The backoff adapts
+to the stream: each throttled attempt doubles the writer's base delay (up to
+max_retry_delay) and each clean call halves it again, so a writer that keeps
+hitting a hot shard backs off sooner. Retries stop after max_attempts or, if
+delivery_budget (seconds) is set, when the next wait would overrun it. A
+put_records call that raises is retried the same way only for throttling
+(ProvisionedThroughputExceededException, LimitExceededException) and
+connection errors or timeouts; anything else, such as AccessDenied or a
+missing stream, is a misconfiguration and is raised as it is.
+
+Records still failing then are appended to the writer's spill file (see
+spill.py), if it has one, instead of failing the request; replay() sends them
+again later. Without a spill file, or when the spill file is full, flush()
+raises RecordWriterError.
+
+"""
+
+import hashlib
+import logging
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+import clients
+import instrumentation
+from record_format import decode_varint as _read_varint, encode_varint as _varint
+
+logger = logging.getLogger()
+
+# Kinesis service limits
+MAX_RECORDS_PER_CALL = 500
+MAX_BYTES_PER_CALL = 5 * 1024 * 1024
+MAX_BYTES_PER_RECORD = 1024 * 1024
+
+# KPL defaults to 50 KB aggregated records, which keeps consumer batches small
+DEFAULT_AGGREGATION_MAX_BYTES = 51200
+
+# put_records errors worth retrying; any other error is raised
+RETRYABLE_ERROR_CODES = frozenset(['ProvisionedThroughputExceededException', 'LimitExceededException'])
+
+KPL_MAGIC = b'\xf3\x89\x9a\xc2'
+KPL_DIGEST_SIZE = 16
+
+
+class RecordWriterError(Exception):
+    """
+    Raised when records could not be delivered after all retry attempts.
+    """
+
+    def __init__(self, message, failed_records):
+        super(RecordWriterError, self).__init__(message)
+        self.failed_records = failed_records
+
+
+# --- Minimal protobuf encoding for the KPL aggregated record format ---
+
+def _field_bytes(field_number, payload):
+    return _varint((field_number << 3) | 2) + _varint(len(payload)) + payload
+
+
+def _field_varint(field_number, value):
+    return _varint(field_number << 3) + _varint(value)
+
+
+def _iter_fields(buf):
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field_number, wire_type = key >> 3, key & 0x07
+        if wire_type == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        else:
+            raise ValueError('Unsupported protobuf wire type {}'.format(wire_type))
+        yield field_number, value
+
+
+def aggregate(partition_key, payloads):
+    """
+    Pack payloads (bytes) sharing partition_key into one KPL aggregated record.
+    """
+    message = _field_bytes(1, partition_key.encode('utf-8'))
+    for payload in payloads:
+        record = _field_varint(1, 0) + _field_bytes(3, payload)
+        message += _field_bytes(3, record)
+    return KPL_MAGIC + message + hashlib.md5(message).digest()
+
+
+def deaggregate(data):
+    """
+    Return the list of logical payloads in data. Records that are not in the
+    KPL aggregated format are returned unchanged as a single-item list.
+    """
+    if not data.startswith(KPL_MAGIC) or len(data) <= len(KPL_MAGIC) + KPL_DIGEST_SIZE:
+        return [data]
+    message = data[len(KPL_MAGIC):-KPL_DIGEST_SIZE]
+    if hashlib.md5(message).digest() != data[-KPL_DIGEST_SIZE:]:
+        return [data]
+
+    payloads = []
+    for field_number, value in _iter_fields(message):
+        if field_number != 3:
+            continue
+        for record_field, record_value in _iter_fields(value):
+            if record_field == 3:
+                payloads.append(bytes(record_value))
+    return payloads
+
+
+# --- Writer ---
+
+def _retryable(error):
+    if isinstance(error, (BotoConnectionError, HTTPClientError)):
+        return True
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in RETRYABLE_ERROR_CODES
+
+
+def _record_size(entry):
+    return len(entry['Data']) + len(entry['PartitionKey'].encode('utf-8'))
+
+
+class RecordWriter(object):
+
+    def __init__(self, stream_name, max_records=MAX_RECORDS_PER_CALL, max_bytes=MAX_BYTES_PER_CALL,
+                 max_buffer_time=1.0, aggregate_records=False,
+                 aggregation_max_bytes=DEFAULT_AGGREGATION_MAX_BYTES, max_attempts=3, retry_base_delay=0.05,
+                 max_retry_delay=1.0, delivery_budget=None, spill=None):
+        self.stream_name = stream_name
+        self.max_records = min(max_records, MAX_RECORDS_PER_CALL)
+        self.max_bytes = min(max_bytes, MAX_BYTES_PER_CALL)
+        self.max_buffer_time = max_buffer_time
+        self.aggregate_records = aggregate_records
+        self.aggregation_max_bytes = min(aggregation_max_bytes, MAX_BYTES_PER_RECORD)
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.max_retry_delay = max_retry_delay
+        self.delivery_budget = delivery_budget
+        self.spill = spill
+        self._retry_delay = retry_base_delay
+
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._first_buffered_at = None
+        # guards the buffer when requests run concurrently (http_server.py); calls are made outside it
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'logical_records': 0,
+            'kinesis_records': 0,
+            'api_calls': 0,
+            'retried_records': 0,
+            'failed_records': 0,
+            'spilled_records': 0,
+            'replayed_records': 0,
+            'dropped_records': 0
+        }
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def put(self, data, partition_key, explicit_hash_key=None):
+        """
+        Buffer one record, flushing first if it would not fit in the next call.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        entry = {'Data': data, 'PartitionKey': partition_key}
+        if explicit_hash_key is not None:
+            entry['ExplicitHashKey'] = explicit_hash_key
+        size = _record_size(entry)
+        if size > MAX_BYTES_PER_RECORD:
+            raise ValueError('Record of {} bytes exceeds the Kinesis record size limit'.format(size))
+
+        # if this flush fails the record isn't buffered, so a request that fails
+        # (and is retried by Lex) doesn't leave it behind to be sent later
+        if self._buffer and (len(self._buffer) >= self.max_records or self._buffered_bytes + size > self.max_bytes):
+            self.flush()
+        with self._lock:
+            if not self._buffer:
+                self._first_buffered_at = time.monotonic()
+            self._buffer.append(entry)
+            self._buffered_bytes += size
+            self.stats['logical_records'] += 1
+            due = (len(self._buffer) >= self.max_records or self._buffered_bytes >= self.max_bytes
+                   or time.monotonic() - self._first_buffered_at >= self.max_buffer_time)
+
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Send everything buffered. Raises RecordWriterError if any record is
+        still failing after max_attempts.
+        """
+        with self._lock:
+            if not self._buffer:
+                return
+            buffered = self._buffer
+            self._buffer = []
+            self._buffered_bytes = 0
+            self._first_buffered_at = None
+        entries = self._aggregate(buffered) if self.aggregate_records else buffered
+
+        deadline = time.monotonic() + self.delivery_budget if self.delivery_budget is not None else None
+        failed = []
+        for batch in self._batches(entries):
+            failed.extend(self._send(batch, deadline))
+        if not failed:
+            return
+
+        if self.spill is not None:
+            spilled = len(failed)
+            failed = self.spill.append(failed)
+            spilled -= len(failed)
+            if spilled:
+                self.stats['spilled_records'] += spilled
+                instrumentation.count('KinesisSpilled', spilled)
+                logger.warning('Spilled %d records for %s to %s', spilled, self.stream_name, self.spill.path)
+            if failed:
+                self.stats['dropped_records'] += len(failed)
+                instrumentation.count('KinesisDropped', len(failed))
+                logger.error('Spill file %s is full, %d records dropped', self.spill.path, len(failed))
+        if failed:
+            self.stats['failed_records'] += len(failed)
+            raise RecordWriterError(
+                '{} records could not be written to {}'.format(len(failed), self.stream_name), failed)
+
+    def replay(self, limit=MAX_RECORDS_PER_CALL, budget=None):
+        """
+        Resend up to limit spilled records, within budget seconds (the
+        delivery budget unless given). Records that fail again stay spilled.
+        Returns the number of records delivered.
+        """
+        if self.spill is None:
+            return 0
+        budget = self.delivery_budget if budget is None else budget
+        deadline = time.monotonic() + budget if budget is not None else None
+
+        def send(entries):
+            failed = []
+            for batch in self._batches(entries):
+                failed.extend(self._send(batch, deadline))
+            return failed
+
+        replayed, still_failing = self.spill.replay(send, limit)
+        if replayed:
+            self.stats['replayed_records'] += replayed
+            instrumentation.count('KinesisReplayed', replayed)
+            logger.info('Replayed %d spilled records to %s, %d still spilled', replayed, self.stream_name, still_failing)
+        return replayed
+
+    def _aggregate(self, entries):
+        """
+        Group entries by partition key (so per-key ordering is kept) and pack
+        each group into aggregated records of at most aggregation_max_bytes.
+        """
+        groups = {}
+        order = []
+        for entry in entries:
+            key = (entry['PartitionKey'], entry.get('ExplicitHashKey'))
+            if key not in groups:
+                groups[key] = []
+                order.append(key)
+            groups[key].append(entry['Data'])
+
+        aggregated = []
+        for partition_key, explicit_hash_key in order:
+            # leave room for the magic bytes, digest and per-record framing
+            budget = self.aggregation_max_bytes - len(KPL_MAGIC) - KPL_DIGEST_SIZE - len(partition_key) - 16
+            chunk = []
+            chunk_bytes = 0
+            for payload in groups[(partition_key, explicit_hash_key)]:
+                if chunk and chunk_bytes + len(payload) + 16 > budget:
+                    aggregated.append(self._aggregated_entry(partition_key, explicit_hash_key, chunk))
+                    chunk = []
+                    chunk_bytes = 0
+                chunk.append(payload)
+                chunk_bytes += len(payload) + 16
+            aggregated.append(self._aggregated_entry(partition_key, explicit_hash_key, chunk))
+        return aggregated
+
+    @staticmethod
+    def _aggregated_entry(partition_key, explicit_hash_key, payloads):
+        data = payloads[0] if len(payloads) == 1 else aggregate(partition_key, payloads)
+        entry = {'Data': data, 'PartitionKey': partition_key}
+        if explicit_hash_key is not None:
+            entry['ExplicitHashKey'] = explicit_hash_key
+        return entry
+
+    def _batches(self, entries):
+        batch = []
+        batch_bytes = 0
+        for entry in entries:
+            size = _record_size(entry)
+            if batch and (len(batch) >= MAX_RECORDS_PER_CALL or batch_bytes + size > MAX_BYTES_PER_CALL):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append(entry)
+            batch_bytes += size
+        if batch:
+            yield batch
+
+    def _backoff(self, attempt, deadline):
+        """
+        Sleep before retry number attempt, with full jitter. Returns False
+        (without sleeping) if the wait would overrun deadline.
+        """
+        delay = random.uniform(0, min(self.max_retry_delay, self._retry_delay * (2 ** (attempt - 1))))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return False
+        time.sleep(delay)
+        return True
+
+    def _send(self, batch, deadline=None):
+        """
+        put_records one batch, retrying only the records that failed. Returns
+        the entries still failing after max_attempts or at deadline.
+        """
+        kinesis = clients.get_client('kinesis')
+        pending = batch
+        for attempt in range(self.max_attempts):
+            if attempt:
+                if not self._backoff(attempt, deadline):
+                    break
+                self.stats['retried_records'] += len(pending)
+
+            try:
+                response = kinesis.put_records(StreamName=self.stream_name, Records=pending)
+            except Exception as e:
+                if not _retryable(e):
+                    raise
+                # botocore has already retried the call itself; treat every record as failed
+                logger.warning('put_records to %s failed: %s', self.stream_name, e)
+                self._retry_delay = min(self.max_retry_delay, self._retry_delay * 2)
+                continue
+            self.stats['api_calls'] += 1
+
+            failed_count = response.get('FailedRecordCount', 0)
+            self.stats['kinesis_records'] += len(pending) - failed_count
+            if not failed_count:
+                self._retry_delay = max(self.retry_base_delay, self._retry_delay / 2)
+                return []
+
+            self._retry_delay = min(self.max_retry_delay, self._retry_delay * 2)
+            results = response['Records']
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('put_records attempt %d had %d failed records, first error=%s',
+                             attempt + 1, failed_count, next((r for r in results if 'ErrorCode' in r), None))
+            pending = [entry for entry, result in zip(pending, results) if 'ErrorCode' in result]
+        return pending
@@ -0,0 +1,237 @@
+"""
+Sentiment scoring shared by the fulfillment handler and the stream enricher.
+
+Both produce the ComprehendSentimentResult shape stored on SessionFeedback
+records:
+
+    {'Sentiment': 'POSITIVE', 'Confidence': 0.98}
+
+detect_sentiment() and batch_detect_sentiment() score with the backend
+chosen by SENTIMENT_POLICY:
+
+    comprehend           Amazon Comprehend only (default)
+    comprehend-fallback  Comprehend, or the local lexicon scorer when Comprehend
+                         fails (throttling, timeouts) so fulfillment doesn't
+    local                the local lexicon scorer only (sentiment_lexicon.py)
+    local-first          the lexicon scorer, refined by Comprehend when its
+                         confidence is below SENTIMENT_REFINE_BELOW (default 0.75);
+                         the local result stands if Comprehend fails
+
+Results the lexicon scorer gave only because Comprehend failed are
+FallbackResult instances, which the sentiment cache doesn't keep, so the
+comment is scored properly once Comprehend recovers.
+
+"""
+
+import logging
+import os
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+import clients
+import instrumentation
+import sentiment_lexicon
+
+logger = logging.getLogger()
+
+LANGUAGE_CODE = 'en'
+
+# batch_detect_sentiment accepts at most 25 documents of up to 5,000 bytes each
+BATCH_SIZE = 25
+MAX_TEXT_BYTES = 5000
+
+POLICIES = ('comprehend', 'comprehend-fallback', 'local', 'local-first')
+
+# what a failing Comprehend call raises (service errors, throttling, timeouts,
+# credentials); anything else is a bug of ours and isn't papered over
+COMPREHEND_ERRORS = (ClientError, BotoCoreError)
+
+
+class FallbackResult(dict):
+    """
+    A result from the local scorer, standing in for one Comprehend couldn't give.
+    """
+    fallback = True
+
+
+def to_sentiment_result(sentiment, sentiment_score):
+    """
+    Reduce a Comprehend Sentiment/SentimentScore pair to the record shape.
+    """
+    return {
+        'Sentiment': sentiment,
+        'Confidence': sentiment_score[sentiment.title()]
+    }
+
+
+def truncate_text(text):
+    encoded = text.encode('utf-8')
+    if len(encoded) <= MAX_TEXT_BYTES:
+        return text
+    return encoded[:MAX_TEXT_BYTES].decode('utf-8', 'ignore')
+
+
+# --- Backends: detect(text) -> result, batch_detect(texts) -> [result or None] ---
+
+class ComprehendBackend(object):
+
+    def detect(self, text):
+        """
+        Score one text with detect_sentiment.
+        """
+        comprehend = clients.get_client('comprehend')
+        resp = comprehend.detect_sentiment(
+            Text=truncate_text(text),
+            LanguageCode=LANGUAGE_CODE)
+        return to_sentiment_result(resp['Sentiment'], resp['SentimentScore'])
+
+    def batch_detect(self, texts):
+        """
+        Score texts with batch_detect_sentiment, BATCH_SIZE texts per call.
+
+        Returns a list the same length as texts holding a sentiment result for
+        each text, or None where Comprehend reported an error for that text.
+        """
+        comprehend = clients.get_client('comprehend')
+        results = [None] * len(texts)
+        for start in range(0, len(texts), BATCH_SIZE):
+            chunk = [truncate_text(text) for text in texts[start:start + BATCH_SIZE]]
+            resp = comprehend.batch_detect_sentiment(TextList=chunk, LanguageCode=LANGUAGE_CODE)
+            for item in resp['ResultList']:
+                results[start + item['Index']] = to_sentiment_result(item['Sentiment'], item['SentimentScore'])
+        return results
+
+
+class LexiconBackend(object):
+
+    def __init__(self, scorer=None):
+        self.scorer = scorer or sentiment_lexicon.LexiconScorer()
+
+    def detect(self, text):
+        return self.scorer.score(text)
+
+    def batch_detect(self, texts):
+        return self.scorer.score_batch(texts)
+
+
+class ComprehendFallbackBackend(object):
+    """
+    Comprehend, with the lexicon scorer for whatever Comprehend fails to score.
+    """
+
+    def __init__(self, comprehend, local):
+        self.comprehend = comprehend
+        self.local = local
+
+    def detect(self, text):
+        try:
+            return self.comprehend.detect(text)
+        except COMPREHEND_ERRORS:
+            logger.warning('Comprehend detect_sentiment failed, using the local scorer', exc_info=True)
+            instrumentation.count('SentimentFallback')
+            return FallbackResult(self.local.detect(text))
+
+    def batch_detect(self, texts):
+        try:
+            results = self.comprehend.batch_detect(texts)
+        except COMPREHEND_ERRORS:
+            logger.warning('Comprehend batch_detect_sentiment failed, using the local scorer', exc_info=True)
+            results = [None] * len(texts)
+        return _fill_in(texts, results, self.local)
+
+
+class LocalFirstBackend(object):
+    """
+    The lexicon scorer, with Comprehend refining results below refine_below confidence.
+    """
+
+    def __init__(self, comprehend, local, refine_below=0.75):
+        self.comprehend = comprehend
+        self.local = local
+        self.refine_below = refine_below
+
+    def detect(self, text):
+        result = self.local.detect(text)
+        if result['Confidence'] >= self.refine_below:
+            return result
+        instrumentation.count('SentimentRefined')
+        try:
+            return self.comprehend.detect(text)
+        except COMPREHEND_ERRORS:
+            logger.warning('Comprehend detect_sentiment failed, keeping the local result', exc_info=True)
+            instrumentation.count('SentimentFallback')
+            return FallbackResult(result)
+
+    def batch_detect(self, texts):
+        results = self.local.batch_detect(texts)
+        unsure = [i for i, result in enumerate(results) if result['Confidence'] < self.refine_below]
+        if not unsure:
+            return results
+        instrumentation.count('SentimentRefined', len(unsure))
+        try:
+            refined = self.comprehend.batch_detect([texts[i] for i in unsure])
+        except COMPREHEND_ERRORS:
+            logger.warning('Comprehend batch_detect_sentiment failed, keeping the local results', exc_info=True)
+            refined = [None] * len(unsure)
+        for i, result in zip(unsure, refined):
+            if result is None:
+                instrumentation.count('SentimentFallback')
+                results[i] = FallbackResult(results[i])
+            else:
+                results[i] = result
+        return results
+
+
+def _fill_in(texts, results, local):
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        instrumentation.count('SentimentFallback', len(missing))
+        for i, result in zip(missing, local.batch_detect([texts[i] for i in missing])):
+            results[i] = FallbackResult(result)
+    return results
+
+
+def build_backend(policy='comprehend', refine_below=0.75):
+    if policy == 'comprehend':
+        return ComprehendBackend()
+    if policy == 'local':
+        return LexiconBackend()
+    if policy == 'comprehend-fallback':
+        return ComprehendFallbackBackend(ComprehendBackend(), LexiconBackend())
+    if policy == 'local-first':
+        return LocalFirstBackend(ComprehendBackend(), LexiconBackend(), refine_below)
+    raise ValueError('SENTIMENT_POLICY must be one of {}, not {}'.format(', '.join(POLICIES), policy))
+
+
+_backend = None
+
+
+def configure(policy=None, refine_below=None):
+    """
+    Choose the backend (arguments override SENTIMENT_POLICY and SENTIMENT_REFINE_BELOW).
+    """
+    global _backend
+    _backend = build_backend(
+        (policy or os.environ.get('SENTIMENT_POLICY', 'comprehend')).strip().lower(),
+        float(refine_below if refine_below is not None else os.environ.get('SENTIMENT_REFINE_BELOW', 0.75))
+    )
+    return _backend
+
+
+def get_backend():
+    return _backend or configure()
+
+
+def detect_sentiment(text):
+    """
+    Score one text with the configured backend.
+    """
+    return get_backend().detect(text)
+
+
+def batch_detect_sentiment(texts):
+    """
+    Score texts with the configured backend. Returns a list the same length as
+    texts holding a result for each, or None where it couldn't be scored.
+    """
+    return get_backend().batch_detect(texts)
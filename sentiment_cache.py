@@ -0,0 +1,184 @@
+"""
+Cache for Comprehend sentiment results.
+
+Feedback comments repeat a lot ("great talk", "Great talk!", "great  talk"),
+so results are cached under a normalized form of the text: lower-cased, with
+punctuation removed and whitespace collapsed. Comments with no words left
+(':(', ':) :)') keep their punctuation, so different emoticons don't share
+a result.
+
+The first tier is a bounded in-memory LRU held by the warm container. The
+optional second tier stores results in the bot's DynamoDB table under
+FullDate='SENTIMENT#<digest>', Title='sentiment', with an ExpiresAt attribute
+that the table's TTL uses to delete old entries. Errors talking to DynamoDB
+are logged and treated as a cache miss; the cache never fails a request.
+
+    SENTIMENT_CACHE_SIZE       entries kept in memory (default 1024, 0 disables)
+    SENTIMENT_CACHE_TTL        seconds a result stays valid (default 86400)
+    SENTIMENT_CACHE_DYNAMODB   'true' to enable the DynamoDB tier (default false)
+
+"""
+
+import collections
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+import clients
+
+logger = logging.getLogger()
+
+_punctuation = re.compile(r'[^\w\s]+', re.UNICODE)
+_whitespace = re.compile(r'\s+', re.UNICODE)
+
+TABLE_KEY_PREFIX = 'SENTIMENT#'
+TABLE_SORT_KEY = 'sentiment'
+
+
+def normalize(text):
+    """
+    Fold case, punctuation and whitespace so equivalent comments share a key.
+    """
+    normalized = _whitespace.sub(' ', _punctuation.sub(' ', text.lower())).strip()
+    return normalized or _whitespace.sub(' ', text).strip()
+
+
+def cache_key(text):
+    return hashlib.sha1(normalize(text).encode('utf-8')).hexdigest()
+
+
+class SentimentCache(object):
+
+    def __init__(self, max_entries=1024, ttl=86400, table_name=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.table_name = table_name
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'table_hits': 0,
+            'table_misses': 0,
+            'table_errors': 0
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, text):
+        """
+        Return a copy of the cached result for text, or None.
+        """
+        key = cache_key(text)
+        result = self._get_memory(key)
+        if result is None and self.table_name:
+            result = self._get_table(key)
+            if result is not None:
+                self._put_memory(key, result)
+        if result is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return dict(result)
+
+    def put(self, text, result):
+        if getattr(result, 'fallback', False):
+            # a stand-in for a failed Comprehend call; score the text properly next time
+            return
+        key = cache_key(text)
+        self._put_memory(key, dict(result))
+        if self.table_name:
+            self._put_table(key, result)
+
+    def get_or_compute(self, text, compute):
+        """
+        Return the cached result for text, calling compute(text) on a miss.
+        """
+        result = self.get(text)
+        if result is None:
+            result = compute(text)
+            self.put(text, result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # --- in-memory LRU tier ---
+
+    def _get_memory(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, result = item
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.stats['expirations'] += 1
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def _put_memory(self, key, result):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    # --- DynamoDB tier ---
+
+    def _table_key(self, key):
+        return {'FullDate': {'S': TABLE_KEY_PREFIX + key}, 'Title': {'S': TABLE_SORT_KEY}}
+
+    def _get_table(self, key):
+        try:
+            resp = clients.get_client('dynamodb').get_item(
+                TableName=self.table_name,
+                Key=self._table_key(key)
+            )
+        except Exception:
+            logger.exception('Sentiment cache read from %s failed', self.table_name)
+            self.stats['table_errors'] += 1
+            return None
+        item = resp.get('Item')
+        # DynamoDB TTL deletes lazily, so expired items can still be returned
+        if not item or int(item['ExpiresAt']['N']) <= time.time():
+            self.stats['table_misses'] += 1
+            return None
+        self.stats['table_hits'] += 1
+        return {'Sentiment': item['Sentiment']['S'], 'Confidence': float(item['Confidence']['N'])}
+
+    def _put_table(self, key, result):
+        item = self._table_key(key)
+        item.update({
+            'Sentiment': {'S': result['Sentiment']},
+            'Confidence': {'N': repr(float(result['Confidence']))},
+            'ExpiresAt': {'N': str(int(time.time() + self.ttl))}
+        })
+        try:
+            clients.get_client('dynamodb').put_item(TableName=self.table_name, Item=item)
+        except Exception:
+            logger.exception('Sentiment cache write to %s failed', self.table_name)
+            self.stats['table_errors'] += 1
+
+
+def from_environment(table_name):
+    """
+    Build a SentimentCache configured from the SENTIMENT_CACHE_* variables.
+    """
+    use_table = os.environ.get('SENTIMENT_CACHE_DYNAMODB', 'false').lower() == 'true'
+    return SentimentCache(
+        max_entries=int(os.environ.get('SENTIMENT_CACHE_SIZE', 1024)),
+        ttl=int(os.environ.get('SENTIMENT_CACHE_TTL', 86400)),
+        table_name=table_name if use_table else None
+    )
@@ -0,0 +1,195 @@
+"""
+Stream enricher for SessionFeedback records.
+
+When the fulfillment function runs with SENTIMENT_MODE=async it writes raw
+SessionFeedback records (no sentiment) to the raw feedback stream and returns
+to the user straight away. This function consumes that stream, scores the
+comments with Comprehend batch_detect_sentiment (25 texts per call, or the
+local scorer, per SENTIMENT_POLICY in sentiment.py), adds the
+same ComprehendSentimentResult the fulfillment path used to add, and writes
+the enriched records to the ratings stream that Firehose delivers to
+Elasticsearch. Records the bot already scored (SPECULATIVE_SENTIMENT, see
+sentiment_speculation.py) are forwarded as they are.
+
+The event source mapping uses ReportBatchItemFailures: records that could not
+be scored or written are returned in batchItemFailures, and Lambda retries the
+batch from the lowest failed sequence number, so nothing is checkpointed past
+a record that was not delivered. Records after a failure may be delivered
+twice; consumers should tolerate duplicates.
+
+For local runs see tools/enricher_harness.py.
+
+"""
+
+import base64
+import collections
+import os
+
+import instrumentation
+import record_format
+import sentiment
+import startup
+import structured_logging
+import sentiment_cache
+from partitioning import get_partitioner
+from record_writer import RecordWriter, RecordWriterError, deaggregate
+
+# patch botocore (or XRAY_PATCH) for instrumentation and tracing via xray
+startup.patch_xray()
+
+# set up logging; LOG_LEVEL and LOG_DEBUG_SAMPLE_RATE control what is emitted
+logger = structured_logging.configure()
+
+# per-phase timings as X-Ray subsegments and EMF metrics; see instrumentation.py
+instrumentation.configure()
+
+# collect environment variables
+output_stream_name = os.environ['OUTPUT_STREAM_NAME']
+
+# input records may be in either format; output is written in RECORD_FORMAT (see record_format.py)
+record_encoding = os.environ.get('RECORD_FORMAT', 'json')
+
+partitioner = get_partitioner(os.environ.get('PARTITION_STRATEGY', 'session'), int(os.environ.get('SHARD_COUNT', 1)))
+
+sentiment_results = sentiment_cache.from_environment(os.environ.get('TABLE_NAME'))
+
+stream_writer = RecordWriter(
+    output_stream_name,
+    aggregate_records=os.environ.get('KINESIS_AGGREGATE', 'false').lower() == 'true'
+)
+
+# create the clients this function uses while the container initialises
+startup.prewarm_clients(['comprehend', 'kinesis'] + (['dynamodb'] if sentiment_results.table_name else []))
+
+
+def decode_records(event):
+    """
+    Yield (sequence_number, record) for every logical record in a Kinesis
+    event, de-aggregating KPL records. Payloads that are neither binary
+    records nor JSON objects are yielded with record set to None.
+    """
+    for event_record in event.get('Records', []):
+        sequence_number = event_record['kinesis']['sequenceNumber']
+        data = base64.b64decode(event_record['kinesis']['data'])
+        for payload in deaggregate(data):
+            try:
+                record = record_format.decode(payload)
+            except ValueError:
+                record = None
+            yield sequence_number, record if isinstance(record, dict) else None
+
+
+def needs_sentiment(record):
+    return (record.get('RecordType') == 'SessionFeedback'
+            and record.get('SessionComments')
+            and not record.get('ComprehendSentimentResult'))
+
+
+def enrich(records):
+    """
+    Add ComprehendSentimentResult to every record in records that needs it,
+    using cached results where possible and scoring each distinct uncached
+    comment once. Returns the list of records Comprehend could not score.
+    """
+    uncached = collections.OrderedDict()
+    for record in records:
+        if not needs_sentiment(record):
+            continue
+        result = sentiment_results.get(record['SessionComments'])
+        if result is not None:
+            record['ComprehendSentimentResult'] = result
+        else:
+            key = sentiment_cache.cache_key(record['SessionComments'])
+            uncached.setdefault(key, []).append(record)
+    if not uncached:
+        return []
+
+    texts = [pending[0]['SessionComments'] for pending in uncached.values()]
+    with instrumentation.span('comprehend'):
+        results = sentiment.batch_detect_sentiment(texts)
+    failed = []
+    for text, pending, result in zip(texts, uncached.values(), results):
+        if result is None:
+            failed.extend(pending)
+            continue
+        sentiment_results.put(text, result)
+        for record in pending:
+            record['ComprehendSentimentResult'] = dict(result)
+    return failed
+
+
+def lambda_handler(event, context):
+    """
+    Enrich a batch of raw feedback records and forward them to the output stream.
+    """
+    structured_logging.start_request()
+    instrumentation.start_request(Function='SentimentEnricher')
+    try:
+        return enrich_batch(event)
+    finally:
+        instrumentation.finish_request()
+
+
+def enrich_batch(event):
+    """
+    Score and forward the records in a Kinesis event; returns the batchItemFailures response.
+    """
+    decoded = list(decode_records(event))
+    logger.debug('sentiment_enricher received %d records in %d kinesis records',
+                 len(decoded), len(event.get('Records', [])))
+
+    failed_sequence_numbers = set()
+
+    # poison records can never succeed; log and skip them rather than block the shard
+    records = []
+    for sequence_number, record in decoded:
+        if record is None:
+            logger.error('Skipping undecodable record at sequence number %s', sequence_number)
+            continue
+        records.append((sequence_number, record))
+
+    try:
+        unscored = enrich([record for _, record in records])
+    except Exception:
+        logger.exception('batch_detect_sentiment failed for the whole batch')
+        unscored = [record for _, record in records]
+    unscored_ids = set(id(record) for record in unscored)
+
+    # remember which input record each output payload came from
+    payload_sequence_numbers = {}
+
+    def record_write_failures(error):
+        for entry in error.failed_records:
+            sequence_number = payload_sequence_numbers.get(id(entry['Data']))
+            if sequence_number is None:
+                # aggregated output can't be traced back; retry from the first record
+                failed_sequence_numbers.add(records[0][0])
+            else:
+                failed_sequence_numbers.add(sequence_number)
+
+    for sequence_number, record in records:
+        if id(record) in unscored_ids:
+            failed_sequence_numbers.add(sequence_number)
+            continue
+        payload = record_format.encode(record, record_encoding)
+        payload_sequence_numbers[id(payload)] = sequence_number
+        partition_key, explicit_hash_key = partitioner.key_for(record)
+        try:
+            stream_writer.put(payload, partition_key, explicit_hash_key)
+        except RecordWriterError as e:
+            record_write_failures(e)
+
+    try:
+        with instrumentation.span('kinesis_flush'):
+            stream_writer.flush()
+    except RecordWriterError as e:
+        record_write_failures(e)
+
+    logger.debug('sentiment_enricher writer stats=%s cache stats=%s failed=%d',
+                 stream_writer.stats, sentiment_results.stats, len(failed_sequence_numbers))
+
+    return {
+        'batchItemFailures': [
+            {'itemIdentifier': sequence_number} for sequence_number in sorted(failed_sequence_numbers, key=int)
+        ]
+    }
@@ -0,0 +1,176 @@
+"""
+Local, rule-based sentiment scoring for feedback comments.
+
+A small stand-in for Comprehend with no dependencies and no network calls,
+used by the 'local', 'local-first' and 'comprehend-fallback' policies in
+sentiment.py. It returns the same shape:
+
+    {'Sentiment': 'POSITIVE', 'Confidence': 0.87}
+
+Each word is looked up in LEXICON (a precompiled word -> valence dict tuned
+for talk feedback) and adjusted by the words around it, in the spirit of
+VADER:
+
+  * a negation within the three words before flips and damps it ("not useful")
+  * a booster just before strengthens it ("really good")
+  * "too" marks the next word as a complaint ("too fast", "too long")
+  * after "but", words count for more than before it ("good but rushed")
+  * each "!" (up to three) strengthens the whole comment
+
+The summed valence is normalized to a compound score in (-1, 1). Comments
+with strong positive and negative parts are MIXED, comments with no scored
+words NEUTRAL. score_batch() scores many comments in one pass over a single
+token stream, so a batch costs one regex scan rather than one per comment.
+
+"""
+
+import math
+import re
+
+_tokens = re.compile(r"[a-z]+(?:'[a-z]+)?|!|\x00")
+
+LEXICON = {
+    # positive
+    'amazing': 2.8, 'awesome': 3.0, 'best': 3.0, 'brilliant': 2.8, 'clear': 1.6, 'clearly': 1.4, 'concise': 1.5,
+    'cool': 1.3, 'engaging': 2.2, 'enjoy': 2.1, 'enjoyable': 2.2, 'enjoyed': 2.2, 'entertaining': 2.0,
+    'excellent': 3.0, 'excited': 1.8, 'exciting': 2.0, 'fantastic': 3.0, 'fascinating': 2.4, 'fun': 2.1,
+    'good': 1.9, 'great': 2.8, 'happy': 2.2, 'helpful': 2.1, 'impressed': 2.2, 'impressive': 2.4,
+    'informative': 2.0, 'insightful': 2.4, 'inspiring': 2.5, 'interesting': 1.9, 'knowledgeable': 2.0,
+    'learned': 1.3, 'learnt': 1.3, 'like': 1.5, 'liked': 1.8, 'love': 3.0, 'loved': 3.0, 'nice': 1.8,
+    'perfect': 2.9, 'practical': 1.5, 'recommend': 2.0, 'relevant': 1.4, 'solid': 1.6,
+    'superb': 3.0, 'thank': 1.5, 'thanks': 1.6, 'thorough': 1.5, 'useful': 2.0, 'valuable': 2.2,
+    'well': 1.1, 'wonderful': 3.0, 'wow': 2.3,
+    # negative
+    'annoying': -2.2, 'awful': -3.0, 'bad': -2.5, 'basic': -1.0, 'bored': -2.0, 'boring': -2.4,
+    'broken': -2.0, 'confused': -1.8, 'confusing': -2.1, 'difficult': -1.3, 'disappointed': -2.4,
+    'disappointing': -2.5, 'dislike': -2.0, 'dull': -2.0, 'fail': -2.0, 'failed': -2.0, 'hard': -1.0,
+    'hate': -3.0, 'hated': -3.0, 'irrelevant': -1.8, 'lacking': -1.6, 'lacks': -1.5, 'mediocre': -1.9,
+    'meh': -1.4, 'messy': -1.7, 'missing': -1.2, 'poor': -2.4, 'poorly': -2.2, 'problem': -1.4,
+    'problems': -1.5, 'repetitive': -1.7, 'rushed': -1.9, 'shallow': -1.8, 'slow': -1.3, 'sorry': -0.8,
+    'terrible': -3.0, 'unclear': -2.0, 'unprepared': -2.2, 'useless': -2.8, 'waste': -2.6, 'weak': -1.8,
+    'worse': -2.4, 'worst': -3.0, 'wrong': -1.8,
+}
+
+NEGATIONS = frozenset([
+    'not', 'no', 'never', 'nothing', 'none', 'neither', 'nor', 'without', 'hardly', 'barely', "don't", "didn't",
+    "doesn't", "isn't", "wasn't", "aren't", "weren't", "won't", "wouldn't", "couldn't", "shouldn't", "can't",
+    'cannot', 'dont', 'didnt', 'doesnt', 'isnt', 'wasnt'
+])
+
+BOOSTERS = {
+    'very': 0.3, 'really': 0.3, 'extremely': 0.4, 'super': 0.3, 'so': 0.25, 'incredibly': 0.4, 'truly': 0.3,
+    'absolutely': 0.4, 'totally': 0.3, 'quite': 0.15, 'most': 0.2, 'particularly': 0.2,
+    'slightly': -0.3, 'somewhat': -0.3, 'bit': -0.3, 'little': -0.2, 'kinda': -0.3, 'fairly': -0.15
+}
+
+# "too <word>" is a complaint whatever the word ("too fast", "too much detail")
+TOO_VALENCE = -1.6
+# "good too and fun": before these "too" means "also"
+NOT_AFTER_TOO = frozenset([
+    'a', 'an', 'and', 'as', 'at', 'but', 'for', 'i', 'in', 'is', 'it', 'of', 'on', 'or', 'so', 'that', 'the',
+    'this', 'to', 'was', 'we', 'with', 'you'
+])
+
+NEGATION_SCALAR = -0.74
+NEGATION_WINDOW = 3
+BUT_BEFORE = 0.5
+BUT_AFTER = 1.5
+EXCLAMATION_BOOST = 0.292
+MAX_EXCLAMATIONS = 3
+# normalizes the summed valence into (-1, 1)
+ALPHA = 15.0
+
+# compound score needed to call a comment positive or negative
+THRESHOLD = 0.05
+# both sides must reach this, and the weaker be at least MIXED_RATIO of the stronger, for MIXED
+MIXED_MINIMUM = 1.0
+MIXED_RATIO = 0.5
+NEUTRAL_CONFIDENCE = 0.6
+
+
+class LexiconScorer(object):
+
+    def __init__(self, lexicon=LEXICON):
+        self.lexicon = lexicon
+
+    def score(self, text):
+        """
+        Return the sentiment result for one comment.
+        """
+        return self.score_batch([text])[0]
+
+    def score_batch(self, texts):
+        """
+        Return a sentiment result for each of texts, in order.
+        """
+        if not texts:
+            return []
+        # one scan over all the comments, separated by \x00 (which tokenizes as its own token)
+        stream = _tokens.findall('\x00'.join(text.replace('\x00', ' ') for text in texts).lower())
+        results = []
+        start = 0
+        for end in _boundaries(stream):
+            results.append(self._classify(stream[start:end]))
+            start = end + 1
+        return results
+
+    def _classify(self, tokens):
+        lexicon = self.lexicon
+        positive = negative = 0.0
+        exclamations = 0
+        but_at = None
+        valences = []
+        for i, token in enumerate(tokens):
+            if token == '!':
+                exclamations += 1
+                continue
+            if token == 'but':
+                but_at = len(valences)
+                continue
+            previous = tokens[i - 1] if i else None
+            valence = lexicon.get(token)
+            if previous == 'too' and token not in NOT_AFTER_TOO and (valence is None or valence < 0):
+                # "too fast" is a complaint; "too good to miss" stays positive
+                valence = TOO_VALENCE
+            if valence is None:
+                continue
+            if previous in BOOSTERS:
+                boost = BOOSTERS[previous]
+                valence += boost if valence > 0 else -boost
+            if any(word in NEGATIONS for word in tokens[max(i - NEGATION_WINDOW, 0):i]):
+                valence *= NEGATION_SCALAR
+            valences.append(valence)
+
+        if not valences:
+            return {'Sentiment': 'NEUTRAL', 'Confidence': NEUTRAL_CONFIDENCE}
+        for valence in valences:
+            if valence > 0:
+                positive += valence
+            else:
+                negative -= valence
+
+        # "but" shifts the overall lean, not whether both sides are there
+        if but_at is not None:
+            valences = ([v * BUT_BEFORE for v in valences[:but_at]] +
+                        [v * BUT_AFTER for v in valences[but_at:]])
+        total = sum(valences)
+        if total:
+            total += math.copysign(EXCLAMATION_BOOST * min(exclamations, MAX_EXCLAMATIONS), total)
+        compound = total / math.sqrt(total * total + ALPHA)
+
+        weaker, stronger = sorted((positive, negative))
+        if weaker >= MIXED_MINIMUM and weaker >= MIXED_RATIO * stronger:
+            return {'Sentiment': 'MIXED', 'Confidence': round(0.5 + 0.4 * weaker / stronger, 4)}
+        if compound >= THRESHOLD:
+            return {'Sentiment': 'POSITIVE', 'Confidence': round(0.5 + 0.5 * compound, 4)}
+        if compound <= -THRESHOLD:
+            return {'Sentiment': 'NEGATIVE', 'Confidence': round(0.5 - 0.5 * compound, 4)}
+        return {'Sentiment': 'NEUTRAL', 'Confidence': round(NEUTRAL_CONFIDENCE + 0.3 * (1 - abs(compound) / THRESHOLD), 4)}
+
+
+def _boundaries(stream):
+    # index of each comment separator, plus the end of the stream
+    for i, token in enumerate(stream):
+        if token == '\x00':
+            yield i
+    yield len(stream)
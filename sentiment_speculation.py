@@ -0,0 +1,226 @@
+"""
+Speculative sentiment scoring for ProvideFeedback.
+
+The comments are known, and valid, on the DialogCodeHook turn that fills
+SessionComments, but the fulfillment turn that needs their sentiment only
+comes after Lex has asked the user to confirm. SentimentSpeculator starts
+scoring the comments on a background thread as soon as they pass
+validation, so fulfillment normally finds the result waiting:
+
+  * in the speculativeSentiment session attribute, which settle() sets at
+    the end of any dialog turn whose speculation has finished, so whichever
+    container runs fulfillment can use it, or
+  * in this container, still in flight (fulfillment waits for it rather
+    than calling Comprehend a second time) or, once finished, in the
+    sentiment cache that fulfillment checks before calling Comprehend.
+
+Results are matched by the comments' cache key (a hash of the normalized
+text), so comments changed after the speculation simply miss and
+fulfillment scores them itself, as it did before.
+
+Session attributes come back from the client, which can change them, so
+the attribute carries an HMAC of the key and result. lookup() ignores a
+value whose signature, label or confidence doesn't check out, and
+fulfillment then scores the comments itself. The signing secret is
+SPECULATIVE_SENTIMENT_SECRET; without one each container makes up its own,
+and only values settled by the same container are used.
+
+Lambda freezes the container once the handler returns, so settle() waits
+for a speculation still in flight at most SPECULATIVE_SENTIMENT_WAIT_MS
+(default 100), and neither it nor lookup() ever waits into the last
+SPECULATIVE_SENTIMENT_MARGIN_MS (default 500) of the invocation.
+
+    SPECULATIVE_SENTIMENT           'true' or 'false' (default: true when SENTIMENT_MODE is inline)
+    SPECULATIVE_SENTIMENT_SECRET    key signing the session attribute, shared by all containers
+
+"""
+
+import binascii
+import concurrent.futures
+import hashlib
+import hmac
+import logging
+import math
+import os
+import threading
+import time
+
+import instrumentation
+from sentiment_cache import cache_key
+
+logger = logging.getLogger()
+
+ATTRIBUTE = 'speculativeSentiment'
+
+# enough of the cache key to tell one user's comments apart
+KEY_CHARS = 16
+
+SENTIMENTS = frozenset(['POSITIVE', 'NEGATIVE', 'NEUTRAL', 'MIXED'])
+
+
+def _signature(secret, payload):
+    return hmac.new(secret, payload.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+
+def encode(key, result, secret):
+    payload = '{}:{}:{!r}'.format(key[:KEY_CHARS], result['Sentiment'], float(result['Confidence']))
+    return '{}:{}'.format(payload, _signature(secret, payload))
+
+
+def decode(value, secret):
+    """
+    Return (key, result) for an encoded attribute value, or None unless it is
+    signed with secret and holds a known label and a confidence in [0, 1].
+    """
+    try:
+        payload, signature = value.rsplit(':', 1)
+        key, sentiment, confidence = payload.split(':')
+        confidence = float(confidence)
+    except (AttributeError, ValueError):
+        return None
+    if not hmac.compare_digest(signature, _signature(secret, payload)):
+        return None
+    if sentiment not in SENTIMENTS or math.isnan(confidence) or not 0 <= confidence <= 1:
+        return None
+    return key, {'Sentiment': sentiment, 'Confidence': confidence}
+
+
+class SentimentSpeculator(object):
+
+    def __init__(self, cache, compute, enabled=True, max_wait=0.1, margin=0.5, workers=2, secret=None):
+        self.cache = cache
+        self.compute = compute
+        self.enabled = enabled
+        self.max_wait = max_wait
+        self.margin = margin
+        self.workers = workers
+        self._secret = secret.encode('utf-8') if secret else binascii.hexlify(os.urandom(32))
+        self._executor = None
+        # reentrant: a future that is already done runs its callback inside start()
+        self._lock = threading.RLock()
+        # cache key -> future, while the speculation is running
+        self._pending = {}
+        # deadline, key and future of the current turn, per thread for concurrent requests (http_server.py)
+        self._turn = threading.local()
+        self.stats = {
+            'started': 0,
+            'settled': 0,
+            'session_hits': 0,
+            'local_hits': 0,
+            'misses': 0,
+            'invalid': 0,
+            'timeouts': 0,
+            'errors': 0
+        }
+
+    def _remaining(self):
+        deadline = getattr(self._turn, 'deadline', None)
+        if deadline is None:
+            return None
+        return max(deadline - time.monotonic(), 0)
+
+    def start_turn(self, context):
+        """
+        Note the invocation's deadline; call at the start of every request.
+        """
+        turn = self._turn
+        turn.key = turn.future = turn.deadline = None
+        if context is not None:
+            turn.deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000.0 - self.margin
+
+    def start(self, text):
+        """
+        Start scoring text in the background, unless it is already being scored.
+        """
+        if not self.enabled or not text:
+            return
+        key = cache_key(text)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+                future = self._executor.submit(self.cache.get_or_compute, text, self.compute)
+                self._pending[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+                self.stats['started'] += 1
+        self._turn.key, self._turn.future = key, future
+
+    def _forget(self, key):
+        # once finished, the result is in the cache
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _wait(self, future, limit=None):
+        """
+        Return future's result, waiting at most limit seconds (and never past
+        the deadline), or None if it isn't ready or failed.
+        """
+        timeout = self._remaining()
+        if limit is not None:
+            timeout = limit if timeout is None else min(timeout, limit)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            self.stats['timeouts'] += 1
+        except Exception:
+            logger.exception('Speculative sentiment scoring failed')
+            self.stats['errors'] += 1
+        return None
+
+    def settle(self, session_attributes):
+        """
+        At the end of a dialog turn, put a finished speculation in session_attributes.
+        """
+        turn = self._turn
+        future = getattr(turn, 'future', None)
+        if future is None or session_attributes is None:
+            return
+        result = self._wait(future, self.max_wait)
+        if result is not None:
+            session_attributes[ATTRIBUTE] = encode(turn.key, result, self._secret)
+            self.stats['settled'] += 1
+        turn.key = turn.future = None
+
+    def lookup(self, session_attributes, text):
+        """
+        Return the speculated sentiment for text, or None if there isn't one.
+        Removes the session attribute either way.
+        """
+        value = session_attributes.pop(ATTRIBUTE, None) if session_attributes else None
+        if not self.enabled or not text:
+            return None
+        stored = decode(value, self._secret) if value else None
+        if value and stored is None:
+            logger.warning('Ignoring an invalid %s session attribute', ATTRIBUTE)
+            self.stats['invalid'] += 1
+        key = cache_key(text)
+        if stored and stored[0] == key[:KEY_CHARS]:
+            self.stats['session_hits'] += 1
+            instrumentation.count('SpeculativeSentimentHit')
+            return stored[1]
+        with self._lock:
+            future = self._pending.get(key)
+        result = self._wait(future) if future is not None else None
+        if result is not None:
+            self.stats['local_hits'] += 1
+            instrumentation.count('SpeculativeSentimentHit')
+            return dict(result)
+        self.stats['misses'] += 1
+        instrumentation.count('SpeculativeSentimentMiss')
+        return None
+
+
+def from_environment(cache, compute, sentiment_mode='inline'):
+    """
+    Build a SentimentSpeculator configured from the SPECULATIVE_SENTIMENT_* variables.
+    """
+    default = 'true' if sentiment_mode == 'inline' else 'false'
+    return SentimentSpeculator(
+        cache,
+        compute,
+        enabled=os.environ.get('SPECULATIVE_SENTIMENT', default).lower() == 'true',
+        max_wait=float(os.environ.get('SPECULATIVE_SENTIMENT_WAIT_MS', 100)) / 1000,
+        margin=float(os.environ.get('SPECULATIVE_SENTIMENT_MARGIN_MS', 500)) / 1000,
+        secret=os.environ.get('SPECULATIVE_SENTIMENT_SECRET')
+    )
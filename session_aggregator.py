@@ -0,0 +1,293 @@
+"""
+Running per-session aggregates, kept in RatingBotSessionsTable.
+
+Consumes the ratings stream (the same records Firehose delivers to
+Elasticsearch) and keeps one item per (Location, Date, SessionID):
+
+    FullDate='STATS#<Date>', Title='<Location>#<SessionID>'
+
+    RatingCount, RatingSum, RatingSumOfSquares     over SessionRating scores
+    Score1 .. Score5                               histogram of scores
+    FeedbackCount, Positive, Negative, Neutral, Mixed
+                                                   SessionFeedback sentiment classes
+
+Each batch is folded in memory first and then applied with one UpdateItem
+per session, using ADD so concurrent shards never overwrite each other. A
+question about one talk is then a single GetItem (see read_stats()) rather
+than a scan over the raw ratingindex documents.
+
+ADD isn't idempotent, so each item also records the highest sequence number
+applied from each shard, and an update is conditional on all of the batch's
+records for the session being newer than that. If any update fails the
+handler raises and Lambda retries the batch, which may by then hold more
+records after the ones it had. A session whose condition fails is read back
+and only its records newer than the stored sequence numbers are applied, so
+a retry counts every record exactly once, whether it repeats the batch or
+extends it.
+
+For local runs see tools/aggregator_harness.py.
+
+"""
+
+import base64
+import collections
+import math
+import os
+
+import clients
+import instrumentation
+import record_format
+import startup
+import structured_logging
+from record_writer import deaggregate
+
+TABLE_KEY_PREFIX = 'STATS#'
+
+SCORES = (1, 2, 3, 4, 5)
+SENTIMENT_COUNTERS = {'POSITIVE': 'Positive', 'NEGATIVE': 'Negative', 'NEUTRAL': 'Neutral', 'MIXED': 'Mixed'}
+
+# Kinesis sequence numbers are decimal strings of varying length; padded, they compare as strings
+SEQUENCE_WIDTH = 64
+
+# patch botocore (or XRAY_PATCH) for instrumentation and tracing via xray
+startup.patch_xray()
+
+# set up logging; LOG_LEVEL and LOG_DEBUG_SAMPLE_RATE control what is emitted
+logger = structured_logging.configure()
+
+# per-phase timings as X-Ray subsegments and EMF metrics; see instrumentation.py
+instrumentation.configure()
+
+table_name = os.environ.get('TABLE_NAME')
+
+# create the clients this function uses while the container initialises
+startup.prewarm_clients(['dynamodb'])
+
+
+def stats_key(location, date, session_id):
+    return {'FullDate': {'S': TABLE_KEY_PREFIX + date}, 'Title': {'S': '{}#{}'.format(location, session_id)}}
+
+
+def sequence_attribute(shard_id):
+    return 'Sequence#' + shard_id
+
+
+def decode_records(event):
+    """
+    Yield (shard_id, sequence_number, record) for every logical record in a
+    Kinesis event; undecodable payloads are yielded with record set to None.
+    """
+    for event_record in event.get('Records', []):
+        shard_id = event_record.get('eventID', 'shardId-000000000000').split(':')[0]
+        sequence_number = event_record['kinesis']['sequenceNumber']
+        data = base64.b64decode(event_record['kinesis']['data'])
+        for payload in deaggregate(data):
+            try:
+                record = record_format.decode(payload)
+            except ValueError:
+                record = None
+            yield shard_id, sequence_number, record if isinstance(record, dict) else None
+
+
+class SessionTotals(object):
+    """
+    The increments one batch contributes to one session's item.
+    """
+
+    __slots__ = ('counters', 'sequences', 'earliest', 'records')
+
+    def __init__(self):
+        self.counters = collections.Counter()
+        # shard id -> highest and lowest (padded) sequence number folded in
+        self.sequences = {}
+        self.earliest = {}
+        # (shard id, sequence number, record) folded in, to re-fold after a partial apply
+        self.records = []
+
+    def add(self, shard_id, sequence_number, record):
+        if record['RecordType'] == 'SessionRating':
+            score = record.get('Score')
+            if score not in SCORES:
+                return False
+            self.counters['RatingCount'] += 1
+            self.counters['RatingSum'] += score
+            self.counters['RatingSumOfSquares'] += score * score
+            self.counters['Score{}'.format(score)] += 1
+        elif record['RecordType'] == 'SessionFeedback':
+            self.counters['FeedbackCount'] += 1
+            sentiment = (record.get('ComprehendSentimentResult') or {}).get('Sentiment')
+            if sentiment in SENTIMENT_COUNTERS:
+                self.counters[SENTIMENT_COUNTERS[sentiment]] += 1
+        else:
+            return False
+        padded = sequence_number.zfill(SEQUENCE_WIDTH)
+        if padded > self.sequences.get(shard_id, ''):
+            self.sequences[shard_id] = padded
+        if padded < self.earliest.get(shard_id, padded + '0'):
+            self.earliest[shard_id] = padded
+        self.records.append((shard_id, sequence_number, record))
+        return True
+
+    def after(self, applied):
+        """
+        Return the totals of just the records newer than applied (shard id -> padded sequence number).
+        """
+        remaining = SessionTotals()
+        for shard_id, sequence_number, record in self.records:
+            if sequence_number.zfill(SEQUENCE_WIDTH) > applied.get(shard_id, ''):
+                remaining.add(shard_id, sequence_number, record)
+        return remaining
+
+
+def fold(decoded):
+    """
+    Fold (shard_id, sequence_number, record) tuples into a dict of
+    (location, date, session_id) -> SessionTotals. Returns (totals, skipped).
+    """
+    totals = collections.OrderedDict()
+    skipped = 0
+    for shard_id, sequence_number, record in decoded:
+        if record is None:
+            logger.error('Skipping undecodable record at sequence number %s', sequence_number)
+            skipped += 1
+            continue
+        key = (record.get('Location'), record.get('Date'), record.get('ID'))
+        if not all(key):
+            skipped += 1
+            continue
+        session = totals.get(key)
+        if session is None:
+            session = totals[key] = SessionTotals()
+        if not session.add(shard_id, sequence_number, record):
+            skipped += 1
+    for key in [key for key, session in totals.items() if not session.counters]:
+        del totals[key]
+    return totals, skipped
+
+
+def build_update(key, session):
+    """
+    Return the UpdateItem arguments that apply session's totals to the item for key.
+    """
+    location, date, session_id = key
+    names = {'#loc': 'Location', '#date': 'Date', '#id': 'SessionID'}
+    values = {':loc': {'S': location}, ':date': {'S': date}, ':id': {'S': session_id}}
+    adds = []
+    for index, (name, value) in enumerate(sorted(session.counters.items())):
+        names['#c{}'.format(index)] = name
+        values[':c{}'.format(index)] = {'N': str(value)}
+        adds.append('#c{0} :c{0}'.format(index))
+    sets = ['#loc = :loc', '#date = :date', '#id = :id']
+    conditions = []
+    for index, (shard_id, sequence) in enumerate(sorted(session.sequences.items())):
+        names['#s{}'.format(index)] = sequence_attribute(shard_id)
+        values[':s{}'.format(index)] = {'S': sequence}
+        values[':e{}'.format(index)] = {'S': session.earliest[shard_id]}
+        sets.append('#s{0} = :s{0}'.format(index))
+        conditions.append('(attribute_not_exists(#s{0}) OR #s{0} < :e{0})'.format(index))
+    return {
+        'TableName': table_name,
+        'Key': stats_key(location, date, session_id),
+        'UpdateExpression': 'ADD {} SET {}'.format(', '.join(adds), ', '.join(sets)),
+        'ConditionExpression': ' AND '.join(conditions),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
+
+
+def applied_sequences(key, shard_ids):
+    """
+    Return shard id -> padded sequence number last applied to the item for key.
+    """
+    item = clients.get_client('dynamodb').get_item(
+        TableName=table_name,
+        Key=stats_key(*key),
+        ConsistentRead=True
+    ).get('Item') or {}
+    return dict((shard_id, item[sequence_attribute(shard_id)]['S']) for shard_id in shard_ids
+                if sequence_attribute(shard_id) in item)
+
+
+def apply(totals, attempts=3):
+    """
+    Write every session's totals with one conditional UpdateItem each.
+    Returns a dict of counts: updated, partial (some records already applied),
+    duplicates (all records already applied) and failed.
+    """
+    dynamodb = clients.get_client('dynamodb')
+    result = {'updated': 0, 'partial': 0, 'duplicates': 0, 'failed': 0}
+    for key, session in totals.items():
+        outcome = 'updated'
+        try:
+            for _ in range(attempts):
+                try:
+                    dynamodb.update_item(**build_update(key, session))
+                    break
+                except dynamodb.exceptions.ConditionalCheckFailedException:
+                    # some of the records were applied by an earlier attempt at this batch
+                    session = session.after(applied_sequences(key, session.sequences))
+                    if not session.counters:
+                        outcome = 'duplicates'
+                        break
+                    outcome = 'partial'
+            else:
+                raise RuntimeError('Sequence condition kept failing')
+            result[outcome] += 1
+        except Exception:
+            logger.exception('Updating session stats for %s failed', key)
+            result['failed'] += 1
+    return result
+
+
+def read_stats(location, date, session_id):
+    """
+    Return the aggregates for one session as a dict (count, mean, stddev,
+    histogram, feedback, sentiments), or None if nothing has been recorded.
+    """
+    item = clients.get_client('dynamodb').get_item(
+        TableName=table_name,
+        Key=stats_key(location, date, session_id)
+    ).get('Item')
+    if not item:
+        return None
+
+    def number(name):
+        return int(item[name]['N']) if name in item else 0
+
+    count = number('RatingCount')
+    mean = number('RatingSum') / float(count) if count else None
+    variance = number('RatingSumOfSquares') / float(count) - mean * mean if count else None
+    return {
+        'count': count,
+        'mean': mean,
+        'stddev': math.sqrt(max(variance, 0.0)) if count else None,
+        'histogram': dict((score, number('Score{}'.format(score))) for score in SCORES),
+        'feedback': number('FeedbackCount'),
+        'sentiments': dict((sentiment, number(name)) for sentiment, name in SENTIMENT_COUNTERS.items())
+    }
+
+
+def lambda_handler(event, context):
+    """
+    Fold a batch of ratings stream records into the per-session aggregates.
+    """
+    structured_logging.start_request()
+    instrumentation.start_request(Function='SessionAggregator')
+    try:
+        return aggregate_batch(event)
+    finally:
+        instrumentation.finish_request()
+
+
+def aggregate_batch(event):
+    with instrumentation.span('fold'):
+        totals, skipped = fold(decode_records(event))
+    with instrumentation.span('dynamodb_update'):
+        result = apply(totals)
+    instrumentation.count('StatsUpdates', result['updated'])
+    logger.debug('session_aggregator folded %d kinesis records into %d sessions: %s, skipped=%d',
+                 len(event.get('Records', [])), len(totals), result, skipped)
+    if result['failed']:
+        # records already applied are skipped on the retry by their sequence numbers
+        raise RuntimeError('{} of {} session updates failed'.format(result['failed'], len(totals)))
+    return result
@@ -0,0 +1,166 @@
+"""
+Session catalog backed by RatingBotSessionsTable (hash FullDate, range Title).
+
+SessionID is captured as free text, so "intro to lex" and "An Introduction to
+Amazon Lex" would otherwise be recorded as different talks. resolve() matches
+what the user typed against the titles scheduled on that day:
+
+    ('match', title)           one session clearly matches
+    ('ambiguous', [titles])    several sessions match about equally well
+    ('unknown', [titles])      nothing matches; titles lists the day's sessions
+    ('uncatalogued', None)     the catalog has no sessions for that day
+
+Each day's sessions are fetched with a single Query the first time that day is
+needed and then served from a per-container cache for SESSION_CATALOG_TTL
+seconds (default 300), which matters with the table at 1 RCU. Matching uses
+a character trigram index over the titles, scoring candidates by Dice
+similarity or by how much of the query they contain.
+
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+
+import clients
+
+logger = logging.getLogger()
+
+_non_alphanumeric = re.compile(r'[^a-z0-9]+')
+
+# a candidate must share at least this share of trigrams (Dice coefficient) to match at all
+MATCH_THRESHOLD = 0.45
+# containment of the whole query in a title counts a little less than a full title match
+CONTAINMENT_WEIGHT = 0.9
+# candidates scoring within this margin of the best are treated as ambiguous
+AMBIGUITY_MARGIN = 0.1
+
+
+def normalize_title(title):
+    return _non_alphanumeric.sub(' ', title.lower()).strip()
+
+
+def trigrams(text):
+    padded = '  {} '.format(normalize_title(text))
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class DayIndex(object):
+    """
+    The sessions scheduled on one day, with a trigram index over their titles.
+    """
+
+    def __init__(self, sessions):
+        # sessions is a list of (title, location) tuples
+        self.sessions = sessions
+        self._by_name = dict((normalize_title(title), title) for title, _ in sessions)
+        self._grams = [trigrams(title) for title, _ in sessions]
+        self._postings = {}
+        for position, grams in enumerate(self._grams):
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(position)
+
+    def titles(self, location=None):
+        if location:
+            in_location = [title for title, city in self.sessions if city and city.lower() == location.lower()]
+            if in_location:
+                return in_location
+        return [title for title, _ in self.sessions]
+
+    def resolve(self, session_id, location=None):
+        if not self.sessions:
+            return 'uncatalogued', None
+
+        allowed = set(self.titles(location))
+        exact = self._by_name.get(normalize_title(session_id))
+        if exact and exact in allowed:
+            return 'match', exact
+
+        grams = trigrams(session_id)
+        shared = {}
+        for gram in grams:
+            for position in self._postings.get(gram, ()):
+                shared[position] = shared.get(position, 0) + 1
+
+        scored = []
+        for position, count in shared.items():
+            title = self.sessions[position][0]
+            if title not in allowed:
+                continue
+            # Dice similarity, or how much of the query the title contains for short queries like 'DEV405'
+            dice = 2.0 * count / (len(grams) + len(self._grams[position]))
+            containment = float(count) / len(grams)
+            score = max(dice, CONTAINMENT_WEIGHT * containment)
+            if score >= MATCH_THRESHOLD:
+                scored.append((score, title))
+        if not scored:
+            return 'unknown', sorted(allowed)
+
+        scored.sort(reverse=True)
+        best = scored[0][0]
+        close = [title for score, title in scored if best - score <= AMBIGUITY_MARGIN]
+        if len(close) == 1:
+            return 'match', close[0]
+        return 'ambiguous', close
+
+
+class SessionCatalog(object):
+
+    def __init__(self, table_name, ttl=300):
+        self.table_name = table_name
+        self.ttl = ttl
+        self._days = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'queries': 0, 'query_errors': 0}
+
+    def _query_day(self, full_date):
+        dynamodb = clients.get_client('dynamodb')
+        sessions = []
+        kwargs = {
+            'TableName': self.table_name,
+            'KeyConditionExpression': 'FullDate = :full_date',
+            'ExpressionAttributeValues': {':full_date': {'S': full_date}},
+            'ProjectionExpression': 'Title, LocationCity'
+        }
+        while True:
+            resp = dynamodb.query(**kwargs)
+            self.stats['queries'] += 1
+            for item in resp.get('Items', []):
+                sessions.append((item['Title']['S'], item.get('LocationCity', {}).get('S')))
+            if 'LastEvaluatedKey' not in resp:
+                return sessions
+            kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    def day(self, date):
+        """
+        Return the DayIndex for date (a datetime.date), querying the table on a cache miss.
+        """
+        full_date = date.isoformat()
+        cached = self._days.get(full_date)
+        if cached is not None and time.time() - cached[0] <= self.ttl:
+            self.stats['hits'] += 1
+            return cached[1]
+
+        try:
+            index = DayIndex(self._query_day(full_date))
+        except Exception:
+            logger.exception('Could not load sessions for %s from %s', full_date, self.table_name)
+            self.stats['query_errors'] += 1
+            # keep serving what we had (or nothing) until the TTL passes rather than retry every turn
+            index = cached[1] if cached is not None else DayIndex([])
+        with self._lock:
+            self._days[full_date] = (time.time(), index)
+        return index
+
+    def prefetch(self, dates):
+        for date in dates:
+            self.day(date)
+
+    def resolve(self, session_id, date, location=None):
+        return self.day(date).resolve(session_id, location)
+
+
+def from_environment(table_name):
+    return SessionCatalog(table_name, ttl=int(os.environ.get('SESSION_CATALOG_TTL', 300)))
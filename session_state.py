@@ -0,0 +1,151 @@
+"""
+Compact encoding for the rating and feedback records kept in Lex session attributes.
+
+Session attributes round-trip through Lex on every turn of a conversation, so
+what the bot stores there is paid for (in bytes on the wire and in
+serialization time) on every later turn. SessionStateCodec keeps only what
+later turns need - the session the user is talking about and, once
+confirmed, the score or sentiment label - never the comment text or the user
+id (Lex already sends userId with each request).
+
+Encoded values are versioned strings:
+
+    1:{"r":"R","i":"Dev405","d":"2026-10-17","l":"London","s":5}
+    1z:<base64 of zlib compressed JSON>   (when that is shorter and the JSON is over compress_threshold)
+
+Every value fits in max_bytes: optional fields are dropped (last first) until
+it does, and a record that still doesn't fit isn't stored at all. decode()
+also accepts the plain JSON strings earlier versions of the bot stored, so
+conversations in flight during a deployment keep working.
+
+"""
+
+import base64
+import json
+import os
+import zlib
+
+VERSION = '1'
+
+# long field name -> short key
+SHORT_KEYS = {
+    'RecordType': 'r',
+    'ID': 'i',
+    'Date': 'd',
+    'Location': 'l',
+    'Score': 's',
+    'Sentiment': 'm'
+}
+LONG_KEYS = dict((short, long) for long, short in SHORT_KEYS.items())
+
+RECORD_TYPES = {'SessionRating': 'R', 'SessionFeedback': 'F'}
+RECORD_TYPE_NAMES = dict((short, long) for long, short in RECORD_TYPES.items())
+
+# fields kept per record type, most important first; RecordType and ID are never dropped
+KEPT_FIELDS = {
+    'SessionRating': ('RecordType', 'ID', 'Date', 'Location', 'Score'),
+    'SessionFeedback': ('RecordType', 'ID', 'Date', 'Location', 'Sentiment')
+}
+REQUIRED_FIELDS = 2
+
+# json.dumps() builds a new encoder whenever it is given options; build it once
+_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+
+def summarize(record):
+    """
+    Return the fields of record that later turns need, in KEPT_FIELDS order.
+    """
+    fields = []
+    for name in KEPT_FIELDS.get(record.get('RecordType'), ('RecordType', 'ID')):
+        if name == 'Sentiment':
+            value = (record.get('ComprehendSentimentResult') or {}).get('Sentiment')
+        else:
+            value = record.get(name)
+        if value is not None:
+            fields.append((name, value))
+    return fields
+
+
+class SessionStateCodec(object):
+
+    def __init__(self, compress_threshold=256, max_bytes=1024):
+        self.compress_threshold = compress_threshold
+        self.max_bytes = max_bytes
+
+    def _pack(self, fields):
+        compact = {}
+        for name, value in fields:
+            compact[SHORT_KEYS[name]] = RECORD_TYPES.get(value, value) if name == 'RecordType' else value
+        text = _encoder.encode(compact)
+        encoded = VERSION + ':' + text
+        if len(text) > self.compress_threshold:
+            compressed = VERSION + 'z:' + base64.b64encode(zlib.compress(text.encode('utf-8'), 9)).decode('ascii')
+            if len(compressed) < len(encoded.encode('utf-8')):
+                return compressed
+        return encoded
+
+    def encode(self, record):
+        """
+        Encode the parts of record later turns need, or return None if even
+        the required fields don't fit in max_bytes.
+        """
+        fields = summarize(record)
+        while True:
+            encoded = self._pack(fields)
+            if len(encoded.encode('utf-8')) <= self.max_bytes:
+                return encoded
+            if len(fields) <= REQUIRED_FIELDS:
+                return None
+            fields = fields[:-1]
+
+    @staticmethod
+    def decode(value):
+        """
+        Return the record held in an encoded value (with long field names),
+        or None if value is empty or can't be decoded.
+        """
+        if not value:
+            return None
+        if isinstance(value, dict):
+            return value
+        try:
+            if value.startswith('{'):
+                # stored by an earlier version of the bot
+                return json.loads(value)
+            version, _, body = value.partition(':')
+            if version == VERSION + 'z':
+                body = zlib.decompress(base64.b64decode(body)).decode('utf-8')
+            elif version != VERSION:
+                return None
+            compact = json.loads(body)
+        except (ValueError, zlib.error):
+            return None
+        record = dict((LONG_KEYS.get(key, key), item) for key, item in compact.items())
+        if 'RecordType' in record:
+            record['RecordType'] = RECORD_TYPE_NAMES.get(record['RecordType'], record['RecordType'])
+        return record
+
+    def store(self, session_attributes, name, record):
+        """
+        Put the encoded record in session_attributes[name], or remove name if it doesn't fit.
+        """
+        encoded = self.encode(record)
+        if encoded is None:
+            session_attributes.pop(name, None)
+        else:
+            session_attributes[name] = encoded
+        return encoded
+
+    def load(self, session_attributes, name):
+        return self.decode((session_attributes or {}).get(name))
+
+
+def from_environment():
+    """
+    Build a SessionStateCodec configured from the SESSION_STATE_* variables.
+    """
+    return SessionStateCodec(
+        compress_threshold=int(os.environ.get('SESSION_STATE_COMPRESS_THRESHOLD', 256)),
+        max_bytes=int(os.environ.get('SESSION_STATE_MAX_BYTES', 1024))
+    )
@@ -0,0 +1,146 @@
+"""
+Parse-once handling of the date slots used by the rating-bot validators.
+
+Lex resolves AMAZON.DATE slots to ISO-8601 'YYYY-MM-DD' strings, so
+parse_date() tries a strict ISO fast path first and only falls back to
+dateutil for anything else. dateutil fills in a missing year, month or day
+('June 5', '1st') from today, which the bot passes in from BotCalendar so it
+is the date in the bot's timezone; fallback results are memoized per day.
+ParsedSlots parses each date slot of a turn exactly once however
+many checks use it.
+
+BotCalendar caches "today" and the start of the rating window for the bot's
+timezone (BOT_TIMEZONE, default Europe/London) and only recomputes them when
+the date rolls over in that timezone, instead of setting TZ and calling
+time.tzset() on every invocation.
+
+"""
+
+import datetime
+import functools
+import re
+import time
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    # python < 3.9
+    from dateutil.tz import gettz as ZoneInfo
+
+_iso_date = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+
+
+def _parse_iso(text):
+    match = _iso_date.match(text)
+    if not match:
+        return None
+    try:
+        return datetime.date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    except ValueError:
+        # e.g. 2018-02-30
+        return None
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_fallback(text, today):
+    import dateutil.parser
+
+    try:
+        return dateutil.parser.parse(text, default=datetime.datetime.combine(today, datetime.time(0))).date()
+    except (ValueError, OverflowError):
+        return None
+
+
+def parse_date(text, today=None):
+    """
+    Return text as a datetime.date, or None if it isn't a valid date. Parts
+    of the date that text leaves out are taken from today (the process's
+    local date unless given).
+    """
+    if isinstance(text, datetime.datetime):
+        return text.date()
+    if isinstance(text, datetime.date):
+        return text
+    if not text:
+        return None
+    text = text.strip()
+    parsed = _parse_iso(text)
+    if parsed is None and not _iso_date.match(text):
+        parsed = _parse_fallback(text, today or datetime.date.today())
+    return parsed
+
+
+def require_date(text, today=None):
+    """
+    Like parse_date, but raise ValueError for text that isn't a valid date.
+    """
+    parsed = parse_date(text, today)
+    if parsed is None:
+        raise ValueError('{} is not a valid date'.format(text))
+    return parsed
+
+
+class BotCalendar(object):
+    """
+    "Today" and the rating window in a fixed timezone, refreshed only when
+    the date rolls over there.
+    """
+
+    def __init__(self, timezone_name='Europe/London', window_days=30):
+        self.timezone = ZoneInfo(timezone_name)
+        if self.timezone is None:
+            raise ValueError('Unknown timezone {}'.format(timezone_name))
+        self.window_days = window_days
+        self._today = None
+        self._window_start = None
+        self._rollover_at = 0
+
+    def _refresh(self):
+        now = datetime.datetime.now(self.timezone)
+        today = now.date()
+        tomorrow = datetime.datetime.combine(today + datetime.timedelta(days=1), datetime.time(0))
+        self._today = today
+        self._window_start = today - datetime.timedelta(days=self.window_days)
+        self._rollover_at = tomorrow.replace(tzinfo=self.timezone).timestamp()
+
+    def today(self):
+        if time.time() >= self._rollover_at:
+            self._refresh()
+        return self._today
+
+    def window_start(self):
+        """
+        Dates must be after this to be within the rating window.
+        """
+        if time.time() >= self._rollover_at:
+            self._refresh()
+        return self._window_start
+
+    def is_future(self, date):
+        return date > self.today()
+
+    def within_window(self, date):
+        return date > self.window_start()
+
+
+class ParsedSlots(object):
+    """
+    Wraps a turn's slots and parses each date slot at most once, filling in
+    missing parts of a date from today.
+    """
+
+    def __init__(self, slots, today=None):
+        self.slots = slots or {}
+        self.today = today
+        self._dates = {}
+
+    def get(self, name):
+        return self.slots.get(name)
+
+    def date(self, name):
+        """
+        Return the named slot as a datetime.date, or None if it is empty or invalid.
+        """
+        if name not in self._dates:
+            self._dates[name] = parse_date(self.slots.get(name), self.today)
+        return self._dates[name]
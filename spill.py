@@ -0,0 +1,106 @@
+"""
+Local spill file for Kinesis records that could not be delivered in time.
+
+When a stream is throttled for longer than a request's delivery budget,
+RecordWriter appends the undelivered records here (one JSON line each,
+fsync'd) and the user still gets their confirmation. Later invocations
+replay the file in bulk; see RecordWriter.replay().
+
+The file lives in the container's /tmp, so it survives between invocations
+of a warm container but not the container itself: records still spilled
+when Lambda reclaims the container are lost. Spilled records are delivered
+out of order with respect to newer records, and a record can be delivered
+twice if the container dies between sending and rewriting the file.
+
+Writers and replays take an exclusive flock, so processes sharing a
+directory (as tools/loadsim.py does) don't interleave lines or replay the
+same records twice.
+
+"""
+
+import base64
+import fcntl
+import json
+import os
+import re
+import time
+
+
+class SpillFile(object):
+
+    def __init__(self, directory, stream_name, max_bytes=64 * 1024 * 1024):
+        self.path = os.path.join(directory, 'kinesis-spill-{}.jsonl'.format(re.sub(r'[^A-Za-z0-9_.-]', '_', stream_name)))
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def _encode(entry):
+        return json.dumps({
+            'k': entry['PartitionKey'],
+            'h': entry.get('ExplicitHashKey'),
+            'd': base64.b64encode(entry['Data']).decode('ascii'),
+            't': int(time.time())
+        }, separators=(',', ':')) + '\n'
+
+    @staticmethod
+    def _decode(line):
+        try:
+            item = json.loads(line)
+            entry = {'Data': base64.b64decode(item['d']), 'PartitionKey': item['k']}
+        except (ValueError, KeyError, TypeError):
+            # a line cut short by a crash mid-write
+            return None
+        if item.get('h') is not None:
+            entry['ExplicitHashKey'] = item['h']
+        return entry
+
+    def _open(self, mode):
+        f = open(self.path, mode)
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def append(self, entries):
+        """
+        Durably append entries. Returns the entries that did not fit under max_bytes.
+        """
+        lines = [self._encode(entry) for entry in entries]
+        with self._open('a') as f:
+            f.seek(0, os.SEEK_END)
+            available = self.max_bytes - f.tell()
+            accepted = 0
+            for line in lines:
+                if len(line) > available:
+                    break
+                available -= len(line)
+                accepted += 1
+            if accepted:
+                f.write(''.join(lines[:accepted]))
+                f.flush()
+                os.fsync(f.fileno())
+        return entries[accepted:]
+
+    def replay(self, send, limit=None):
+        """
+        Pass up to limit spilled entries (oldest first) to send(entries), which
+        returns the entries it could not deliver, and keep only those and the
+        entries not yet attempted. Returns (replayed, still_failing).
+        """
+        if not self.size():
+            return 0, 0
+        with self._open('r+') as f:
+            lines = f.readlines()
+            attempted = lines[:limit] if limit else lines
+            entries = [entry for entry in (self._decode(line) for line in attempted) if entry is not None]
+            failed = send(entries) if entries else []
+
+            f.seek(0)
+            f.truncate()
+            f.write(''.join([self._encode(entry) for entry in failed] + lines[len(attempted):]))
+            f.flush()
+            os.fsync(f.fileno())
+        return len(entries) - len(failed), len(failed)
@@ -0,0 +1,54 @@
+"""
+Cold start helpers shared by the rating-bot Lambda functions.
+
+patch_xray() instruments only the libraries named in XRAY_PATCH (default
+'botocore', which covers every AWS call the functions make) instead of
+patch_all(), which imports and patches every library the X-Ray SDK supports.
+XRAY_PATCH=all restores the old behaviour and XRAY_PATCH=none skips the SDK
+entirely, e.g. for local tools.
+
+prewarm_clients() creates the boto3 clients a function needs while Lambda is
+still initialising the container, so the first request doesn't pay for it.
+PREWARM_CLIENTS (a comma separated list of services) overrides the list a
+function asks for; set it to an empty string to disable pre-warming.
+
+Run tools/importtime_report.py to see what initialisation costs per module.
+
+"""
+
+import logging
+import os
+
+import clients
+
+logger = logging.getLogger()
+
+
+def patch_xray(mode=None):
+    """
+    Patch the libraries named by mode (or XRAY_PATCH) for X-Ray tracing.
+    """
+    mode = (mode or os.environ.get('XRAY_PATCH', 'botocore')).strip().lower()
+    if mode == 'none':
+        return
+    if mode == 'all':
+        from aws_xray_sdk.core import patch_all
+        patch_all()
+        return
+    from aws_xray_sdk.core import patch
+    patch([module.strip() for module in mode.split(',') if module.strip()])
+
+
+def prewarm_clients(services):
+    """
+    Create the clients for services (unless PREWARM_CLIENTS overrides them) now.
+    """
+    configured = os.environ.get('PREWARM_CLIENTS')
+    if configured is not None:
+        services = [service.strip() for service in configured.split(',') if service.strip()]
+    for service in services:
+        try:
+            clients.get_client(service)
+        except Exception:
+            # a client that can't be built now will be retried (and fail loudly) on first use
+            logger.exception('Could not pre-warm %s client', service)
@@ -0,0 +1,119 @@
+"""
+Low-overhead structured logging for the rating-bot Lambda functions.
+
+configure() sets the root logger level from LOG_LEVEL (default INFO) and
+installs a formatter that writes each log line as one JSON object, which
+CloudWatch Logs Insights can query without parsing.
+
+Log payloads lazily: pass them as %-style arguments wrapped in payload(), e.g.
+
+    logger.debug('event=%s', structured_logging.payload(event))
+
+Nothing is serialized unless the line is actually emitted, and when it is,
+comment text (SessionComments) is replaced by its length.
+
+To keep some debug detail in production without paying for it on every
+request, start_request() turns DEBUG on for a sample of requests
+(LOG_DEBUG_SAMPLE_RATE, e.g. 0.01 for 1%) and back off for the rest.
+
+"""
+
+import json
+import logging
+import os
+import random
+import time
+
+REDACTED_KEYS = frozenset(['SessionComments', 'sessionComments', 'inputTranscript'])
+
+_configured_level = logging.INFO
+_sample_rate = 0.0
+
+
+def redact(value):
+    """
+    Return a copy of value with comment text replaced by a length marker.
+    Strings holding JSON documents (as session attributes do) are redacted too.
+    """
+    if isinstance(value, dict):
+        return dict(
+            (key, '<redacted {} chars>'.format(len(item)) if key in REDACTED_KEYS and isinstance(item, str)
+             else redact(item))
+            for key, item in value.items()
+        )
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    if isinstance(value, str) and value.startswith('{') and any(key in value for key in REDACTED_KEYS):
+        try:
+            return json.dumps(redact(json.loads(value)))
+        except ValueError:
+            return value
+    return value
+
+
+class payload(object):
+    """
+    Defers JSON serialization (and redaction) of obj until the log line is emitted.
+    """
+
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return json.dumps(redact(self.obj), default=str, separators=(',', ':'))
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as a single line JSON object.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + '.{:03d}Z'.format(
+                int(record.msecs)),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        request_id = getattr(record, 'aws_request_id', None)
+        if request_id:
+            entry['requestId'] = request_id
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure(level=None, sample_rate=None):
+    """
+    Set the root logger level and JSON formatter. Safe to call more than once.
+    """
+    global _configured_level, _sample_rate
+    level_name = (level or os.environ.get('LOG_LEVEL', 'INFO')).upper()
+    _configured_level = logging.getLevelName(level_name)
+    if not isinstance(_configured_level, int):
+        _configured_level = logging.INFO
+    _sample_rate = float(sample_rate if sample_rate is not None else os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0))
+
+    root = logging.getLogger()
+    root.setLevel(_configured_level)
+    if not root.handlers:
+        root.addHandler(logging.StreamHandler())
+    for handler in root.handlers:
+        handler.setFormatter(JsonFormatter())
+    # library loggers stay at the configured level, even for requests sampled at DEBUG
+    for name in ('boto3', 'botocore', 'urllib3', 'aws_xray_sdk'):
+        logging.getLogger(name).setLevel(_configured_level)
+    return root
+
+
+def start_request():
+    """
+    Pick the log level for this request: DEBUG for a sampled request,
+    otherwise the configured level. Returns True if the request is sampled.
+    """
+    sampled = _sample_rate > 0 and random.random() < _sample_rate
+    logging.getLogger().setLevel(logging.DEBUG if sampled else _configured_level)
+    return sampled
@@ -0,0 +1,152 @@
+"""
+Local harness for session_aggregator.
+
+Builds synthetic ratings stream batches (ratings and scored feedback across a
+few sessions), runs session_aggregator.lambda_handler against an in-process
+DynamoDB stand-in and checks the stored aggregates against totals computed
+directly from the records. With --update-failures, that many updates fail in
+each batch and the batch is retried the way Lambda would, which must not
+count any record twice. With --grow-retries, each retry also carries that
+many more records, as a Lambda retry does when records arrived meanwhile.
+
+    python tools/aggregator_harness.py --records 1000 --batch-size 100 --update-failures 2
+    python tools/aggregator_harness.py --records 1000 --batch-size 100 --update-failures 2 --grow-retries 25
+
+"""
+
+import argparse
+import base64
+import collections
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('TABLE_NAME', 'harness-sessions-table')
+os.environ.setdefault('AWS_XRAY_SDK_ENABLED', 'false')
+os.environ.setdefault('METRICS_MODE', 'off')
+os.environ.setdefault('PREWARM_CLIENTS', '')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import clients  # noqa: E402
+import record_format  # noqa: E402
+import session_aggregator  # noqa: E402
+from tools.stubs import FakeDynamoDB  # noqa: E402
+
+SESSIONS = [('London', '2026-10-17', 'Dev405'), ('London', '2026-10-17', 'Key101'), ('Berlin', '2026-10-18', 'Arc301')]
+SENTIMENTS = ('POSITIVE', 'NEGATIVE', 'NEUTRAL', 'MIXED')
+
+
+class FlakyDynamoDB(FakeDynamoDB):
+    """
+    Fails the first `failures` update_item calls after each arm().
+    """
+
+    def __init__(self, failures):
+        super(FlakyDynamoDB, self).__init__()
+        self.failures = failures
+        self.remaining = 0
+
+    def arm(self):
+        self.remaining = self.failures
+
+    def update_item(self, **kwargs):
+        if self.remaining:
+            self.remaining -= 1
+            self._count('update_item_errors')
+            raise RuntimeError('ProvisionedThroughputExceededException')
+        return super(FlakyDynamoDB, self).update_item(**kwargs)
+
+
+def synthetic_records(count, rng):
+    for i in range(count):
+        location, date, session_id = rng.choice(SESSIONS)
+        record = {'UserId': 'user-{}'.format(i), 'Location': location, 'Date': date, 'ID': session_id}
+        if rng.random() < 0.7:
+            record.update(RecordType='SessionRating', Score=rng.randint(1, 5))
+        else:
+            record.update(RecordType='SessionFeedback', SessionComments='comment {}'.format(i),
+                          ComprehendSentimentResult={'Sentiment': rng.choice(SENTIMENTS), 'Confidence': 0.9})
+        yield record
+
+
+def kinesis_event(records, start, end, record_encoding):
+    return {'Records': [
+        {
+            'eventSource': 'aws:kinesis',
+            'eventID': 'shardId-000000000000:{}'.format(1000 + i),
+            'kinesis': {
+                'partitionKey': 'harness',
+                'sequenceNumber': str(1000 + i),
+                'data': base64.b64encode(record_format.encode(record, record_encoding)).decode('ascii')
+            }
+        }
+        for i, record in enumerate(records[start:end], start)
+    ]}
+
+
+def expected_stats(records):
+    stats = collections.defaultdict(lambda: {'count': 0, 'sum': 0, 'feedback': 0})
+    for record in records:
+        session = stats[(record['Location'], record['Date'], record['ID'])]
+        if record['RecordType'] == 'SessionRating':
+            session['count'] += 1
+            session['sum'] += record['Score']
+        else:
+            session['feedback'] += 1
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Feed synthetic stream batches to session_aggregator.')
+    parser.add_argument('--records', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--update-failures', type=int, default=0)
+    parser.add_argument('--grow-retries', type=int, default=0, help='records added to each retried batch')
+    parser.add_argument('--record-format', choices=record_format.FORMATS, default='json')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    records = list(synthetic_records(args.records, rng))
+    dynamodb = FlakyDynamoDB(args.update_failures)
+    clients.set_client('dynamodb', dynamodb)
+
+    batches = retries = 0
+    start = 0
+    while start < len(records):
+        batches += 1
+        dynamodb.arm()
+        end = start + args.batch_size
+        while True:
+            try:
+                session_aggregator.lambda_handler(kinesis_event(records, start, end, args.record_format), None)
+                break
+            except RuntimeError:
+                retries += 1
+                end += args.grow_retries
+        start = end
+
+    mismatched = []
+    for key, expected in sorted(expected_stats(records).items()):
+        stored = session_aggregator.read_stats(*key)
+        if (stored['count'], stored['feedback']) != (expected['count'], expected['feedback']) or \
+                abs(stored['mean'] - expected['sum'] / float(expected['count'])) > 1e-9:
+            mismatched.append((key, stored, expected))
+        print('{:<36} ratings={:<5} mean={:.2f} stddev={:.2f} feedback={:<5} {}'.format(
+            '/'.join(key), stored['count'], stored['mean'], stored['stddev'], stored['feedback'],
+            stored['sentiments']))
+
+    print('records:                {} in {} batches ({} retried)'.format(len(records), batches, retries))
+    print('update_item calls:      {} ({} failed)'.format(
+        dynamodb.calls.get('update_item', 0), dynamodb.calls.get('update_item_errors', 0)))
+    print('aggregates match:       {}'.format(not mismatched))
+    if mismatched:
+        for key, stored, expected in mismatched:
+            print('mismatch {}: stored {} expected {}'.format(key, stored, expected))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+"""
+Bulk import of historical ratings and feedback, e.g. from paper scorecards.
+
+Reads a CSV file with a header row, or JSON Lines, with the bot's slot names
+as columns:
+
+    SessionID, SessionDate, SessionLocation, SessionScore, SessionComments, UserId (optional)
+
+A row with a SessionScore becomes a SessionRating record and a row with
+SessionComments a SessionFeedback record; a row may have both. Rows are
+validated by the bot's own validate_rating/validate_feedback (locations,
+dates and the session catalog), with the rating window set by --window-days,
+and the records are built by the same functions as rate_session and
+provide_feedback. Feedback is scored with batch_detect_sentiment and records
+are written to the ratings stream with put_records, --workers chunks at a
+time.
+
+The input is read one chunk at a time, with at most two chunks per worker in
+flight, so memory stays flat however large the file is. After each chunk is
+written, the byte offset up to which every row has been written is saved to
+--checkpoint (default <input>.checkpoint) and rerunning the same command
+resumes from there. Chunks that were in flight when a run stopped are
+written again on resume, so a resumed import can contain a few duplicate
+records. Rejected rows go to --rejects as JSON lines with the reason.
+
+    python tools/backfill.py scorecards.csv --stream <ratings stream> --table <sessions table> --window-days 3650
+    python tools/backfill.py scorecards.jsonl --local --window-days 3650
+
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import csv
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import record_format  # noqa: E402
+import sentiment  # noqa: E402
+from record_writer import RecordWriter  # noqa: E402
+from slot_parsing import parse_date  # noqa: E402
+from tools.handler import install_stubs, load_handler  # noqa: E402
+from tools.stubs import FakeKinesis  # noqa: E402
+
+SLOT_NAMES = ('SessionID', 'SessionDate', 'SessionLocation', 'SessionScore', 'SessionComments')
+REQUIRED_SLOTS = ('SessionID', 'SessionDate', 'SessionLocation')
+
+
+class InputReader(object):
+    """
+    Yields (row_number, row) from a CSV or JSON Lines file, starting at a byte
+    offset; self.offset is the end of the last row yielded.
+    """
+
+    def __init__(self, path, input_format, offset=0, row_number=0):
+        self.path = path
+        self.input_format = input_format
+        self.offset = offset
+        self.row_number = row_number
+
+    def _lines(self, handle):
+        for line in handle:
+            self.offset += len(line)
+            yield line.decode('utf-8')
+
+    def rows(self):
+        with open(self.path, 'rb') as handle:
+            if self.input_format == 'csv':
+                header_line = handle.readline()
+                header = next(csv.reader([header_line.decode('utf-8-sig')]))
+                self.offset = max(self.offset, len(header_line))
+                handle.seek(self.offset)
+                for values in csv.reader(self._lines(handle)):
+                    self.row_number += 1
+                    if values:
+                        yield self.row_number, dict(zip(header, values))
+                return
+            handle.seek(self.offset)
+            for line in self._lines(handle):
+                self.row_number += 1
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = 'invalid JSON: {}'.format(e)
+                yield self.row_number, row
+
+
+def clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def prepare_row(bot, row, user_id):
+    """
+    Validate one input row; returns (records, None) or (None, reason).
+    """
+    if not isinstance(row, dict):
+        return None, row if isinstance(row, str) else 'row is not an object'
+    slots = dict((name, clean(row.get(name))) for name in SLOT_NAMES)
+    missing = [name for name in REQUIRED_SLOTS if not slots[name]]
+    if missing:
+        return None, 'missing {}'.format(', '.join(missing))
+    if not slots['SessionScore'] and not slots['SessionComments']:
+        return None, 'no SessionScore or SessionComments'
+    if slots['SessionScore']:
+        try:
+            bot.safe_int(slots['SessionScore'])
+        except ValueError:
+            return None, '{} is not a valid session score'.format(slots['SessionScore'])
+
+    resolved_slots = {}
+    for present, validate in ((slots['SessionScore'], bot.validate_rating),
+                              (slots['SessionComments'], bot.validate_feedback)):
+        if not present:
+            continue
+        validation_result = validate(slots)
+        if not validation_result['isValid']:
+            return None, validation_result['message']['content']
+        resolved_slots.update(validation_result['resolvedSlots'])
+    slots.update(resolved_slots)
+    # Lex hands the fulfillment ISO dates; scorecards may not use them
+    slots['SessionDate'] = parse_date(slots['SessionDate'], bot.calendar.today()).isoformat()
+
+    records = []
+    if slots['SessionScore']:
+        records.append(bot.build_rating_record(slots, user_id))
+    if slots['SessionComments']:
+        records.append(bot.build_feedback_record(slots, user_id))
+    return records, None
+
+
+class Backfill(object):
+
+    def __init__(self, bot, args):
+        self.bot = bot
+        self.args = args
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=args.workers)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.totals = collections.Counter()
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.input_size = os.path.getsize(args.input)
+
+    def writer(self):
+        # RecordWriter isn't thread safe; each worker thread has its own
+        writer = getattr(self._local, 'writer', None)
+        if writer is None:
+            writer = self._local.writer = RecordWriter(
+                self.args.stream, aggregate_records=self.args.aggregate, max_attempts=10, max_retry_delay=5.0)
+        return writer
+
+    def write_chunk(self, records):
+        """
+        Score the chunk's feedback and write all its records; returns the
+        rows whose feedback Comprehend couldn't score, as (row_number, reason).
+        Raises RecordWriterError if records can't be written.
+        """
+        feedback = [(row_number, record) for row_number, record in records
+                    if record['RecordType'] == 'SessionFeedback']
+        results = sentiment.batch_detect_sentiment([record['SessionComments'] for _, record in feedback])
+        unscored = set()
+        for (row_number, record), result in zip(feedback, results):
+            if result is None:
+                unscored.add(row_number)
+            else:
+                record['ComprehendSentimentResult'] = result
+
+        writer = self.writer()
+        written = 0
+        for row_number, record in records:
+            if row_number in unscored:
+                continue
+            partition_key, explicit_hash_key = self.bot.partitioner.key_for(record)
+            writer.put(record_format.encode(record, self.bot.record_encoding), partition_key, explicit_hash_key)
+            written += 1
+        writer.flush()
+        with self._lock:
+            self.totals['records'] += written
+        return [(row_number, 'Comprehend could not score the comments') for row_number in sorted(unscored)]
+
+    def report(self, reader, final=False):
+        now = time.monotonic()
+        if not final and now - self.last_report < self.args.progress_interval:
+            return
+        self.last_report = now
+        elapsed = max(now - self.started, 1e-9)
+        done = reader.offset / float(self.input_size) if self.input_size else 1.0
+        eta = elapsed / done * (1 - done) if 0 < done < 1 else 0
+        sys.stderr.write('{:>10} rows {:>10} records {:>8} rejected {:>9.0f} rows/s {:>9.0f} records/s '
+                         '{:>6.1f}% eta {:.0f}s max rss {:.0f}MB\n'.format(
+                             self.totals['rows'], self.totals['records'], self.totals['rejected'],
+                             self.totals['rows'] / elapsed, self.totals['records'] / elapsed, done * 100, eta,
+                             resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+
+    def run(self, reader, checkpoint, rejects):
+        user_prefix = 'backfill-{}'.format(os.path.basename(self.args.input))
+        in_flight = collections.deque()
+
+        def complete(wait):
+            # advance the checkpoint over the chunks that finished in input order
+            if wait:
+                concurrent.futures.wait([future for _, _, future in in_flight],
+                                        return_when=concurrent.futures.FIRST_COMPLETED)
+            advanced = None
+            while in_flight and in_flight[0][2].done():
+                offset, row_number, future = in_flight.popleft()
+                for rejected in future.result():
+                    reject(*rejected)
+                advanced = (offset, row_number)
+            if advanced and checkpoint:
+                save_checkpoint(checkpoint, self.args.input, advanced[0], advanced[1])
+
+        def reject(row_number, reason, row=None):
+            self.totals['rejected'] += 1
+            if rejects:
+                rejects.write(json.dumps({'row': row_number, 'reason': reason, 'input': row}) + '\n')
+
+        chunk = []
+        try:
+            for row_number, row in reader.rows():
+                self.totals['rows'] += 1
+                user_id = clean(row.get('UserId')) if isinstance(row, dict) else None
+                records, reason = prepare_row(self.bot, row, user_id or '{}-{}'.format(user_prefix, row_number))
+                if reason:
+                    reject(row_number, reason, row)
+                else:
+                    chunk.extend((row_number, record) for record in records)
+                if len(chunk) >= self.args.chunk_size:
+                    self.submit(chunk, reader, in_flight)
+                    chunk = []
+                    while len(in_flight) >= self.args.workers * 2:
+                        complete(wait=True)
+                    complete(wait=False)
+                self.report(reader)
+            if chunk:
+                self.submit(chunk, reader, in_flight)
+            while in_flight:
+                complete(wait=True)
+        finally:
+            self.pool.shutdown(wait=True)
+            self.report(reader, final=True)
+
+    def submit(self, chunk, reader, in_flight):
+        if self.args.dry_run:
+            future = concurrent.futures.Future()
+            future.set_result([])
+        else:
+            future = self.pool.submit(self.write_chunk, chunk)
+        in_flight.append((reader.offset, reader.row_number, future))
+
+
+def load_checkpoint(path, input_path):
+    if not path or not os.path.exists(path):
+        return 0, 0
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('input') != os.path.abspath(input_path):
+        raise SystemExit('{} is a checkpoint for {}; use --restart to ignore it'.format(path, checkpoint.get('input')))
+    return checkpoint['offset'], checkpoint['rows']
+
+
+def save_checkpoint(path, input_path, offset, row_number):
+    # written to a temporary file and renamed, so an interrupted run never leaves a torn checkpoint
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump({'input': os.path.abspath(input_path), 'offset': offset, 'rows': row_number,
+                   'saved_at': time.time()}, f)
+    os.replace(temporary, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import historical ratings and feedback.')
+    parser.add_argument('input')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='default: from the file extension')
+    parser.add_argument('--stream', default=os.environ.get('STREAM_NAME'), help='ratings stream (STREAM_NAME)')
+    parser.add_argument('--table', default=os.environ.get('TABLE_NAME'), help='sessions table (TABLE_NAME)')
+    parser.add_argument('--window-days', type=int, default=30, help='accept sessions up to this many days ago')
+    parser.add_argument('--record-format', choices=record_format.FORMATS, default=os.environ.get('RECORD_FORMAT', 'json'))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--chunk-size', type=int, default=500, help='records per put_records chunk')
+    parser.add_argument('--aggregate', action='store_true', help='write KPL aggregated records')
+    parser.add_argument('--checkpoint', help='default: <input>.checkpoint')
+    parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint')
+    parser.add_argument('--rejects', help='write rejected rows here as JSON lines')
+    parser.add_argument('--progress-interval', type=float, default=5.0)
+    parser.add_argument('--dry-run', action='store_true', help='validate only; nothing is written')
+    parser.add_argument('--local', action='store_true', help='use the in-process AWS stand-ins')
+    args = parser.parse_args()
+
+    input_format = args.format or ('csv' if args.input.lower().endswith('.csv') else 'jsonl')
+    checkpoint = None if args.dry_run else (args.checkpoint or args.input + '.checkpoint')
+    if not args.local and not (args.stream and args.table):
+        parser.error('--stream and --table (or STREAM_NAME and TABLE_NAME) are required unless --local')
+
+    environment = {'RATING_WINDOW_DAYS': str(args.window_days), 'RECORD_FORMAT': args.record_format}
+    if args.stream:
+        environment['STREAM_NAME'] = args.stream
+    if args.table:
+        environment['TABLE_NAME'] = args.table
+    if args.local:
+        install_stubs(kinesis=FakeKinesis(keep_records=False))
+    bot = load_handler(environment)
+    args.stream = bot.kinesis_stream_name
+
+    offset, row_number = (0, 0) if args.restart else load_checkpoint(checkpoint, args.input)
+    if offset:
+        sys.stderr.write('resuming {} after row {} (byte {})\n'.format(args.input, row_number, offset))
+    reader = InputReader(args.input, input_format, offset, row_number)
+
+    backfill = Backfill(bot, args)
+    rejects = open(args.rejects, 'a') if args.rejects else None
+    try:
+        backfill.run(reader, checkpoint, rejects)
+    except KeyboardInterrupt:
+        sys.stderr.write('interrupted; run the same command again to resume from {}\n'.format(checkpoint))
+        sys.exit(130)
+    finally:
+        if rejects:
+            rejects.close()
+    print(json.dumps(dict(backfill.totals, seconds=round(time.monotonic() - backfill.started, 2))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,418 @@
+"""
+Offline reporting over the Firehose S3 backup of the ratings stream.
+
+Firehose copies every document it sends to Elasticsearch to the backup
+bucket under firehose-es-backup/YYYY/MM/DD/HH/, uncompressed and with the
+documents concatenated (no newline between them). This reads those objects
+back without touching the ES cluster, as a pipeline of generators:
+
+    list_objects -> read_chunks -> iter_documents -> to_row -> batches
+
+Objects are streamed in chunks and parsed incrementally, so memory depends
+on --batch-size and the number of sessions, not on the amount of data. A
+local directory with the same layout can stand in for the bucket. Documents
+Firehose failed to deliver (elasticsearch-failed/, wrapped with rawData) are
+decoded too.
+
+Each batch can be written as a compressed columnar file (--columnar parquet,
+which needs pyarrow, or npz), and the report is computed with NumPy:
+per-session count, mean and standard deviation of scores, score
+distributions, sentiment class counts, and the correlation across sessions
+between the mean score and the mean sentiment (POSITIVE +1, NEGATIVE -1,
+NEUTRAL and MIXED 0, weighted by confidence). Ratings and feedback are
+separate records, so sentiment and score are compared per session.
+
+    pip install -r tools/requirements.txt
+    python tools/backup_reader.py s3://<backup bucket>/firehose-es-backup/ --start 2026-10-01 --end 2026-10-14
+    python tools/backup_reader.py ./backup --columnar parquet --output ./columnar --json
+
+"""
+
+import argparse
+import base64
+import codecs
+import collections
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import clients  # noqa: E402
+import record_format  # noqa: E402
+
+CHUNK_SIZE = 1024 * 1024
+# a Kinesis record is at most 1 MB, so no document is longer than this
+MAX_DOCUMENT_CHARS = 1024 * 1024
+
+SENTIMENT_POLARITY = {'POSITIVE': 1.0, 'NEGATIVE': -1.0, 'NEUTRAL': 0.0, 'MIXED': 0.0}
+SCORES = (1, 2, 3, 4, 5)
+RECORD_TYPES = {'SessionRating': 0, 'SessionFeedback': 1}
+SENTIMENT_CODES = dict((name, code) for code, name in enumerate(record_format.SENTIMENTS))
+
+_key_date = re.compile(r'(?:^|/)(\d{4})/(\d{2})/(\d{2})/')
+_whitespace = re.compile(r'\s*')
+
+
+# --- Pipeline stages ---
+
+def list_objects(source, start=None, end=None):
+    """
+    Yield the object keys (or file paths) under source, an s3://bucket/prefix
+    URL or a local directory, in order. start and end (YYYY-MM-DD) select
+    objects by the date in their Firehose key prefix.
+    """
+    if source.startswith('s3://'):
+        bucket, _, prefix = source[5:].partition('/')
+        paginator = clients.get_client('s3').get_paginator('list_objects_v2')
+        keys = (item['Key'] for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+                for item in page.get('Contents', []))
+    else:
+        keys = (os.path.join(directory, name) for directory, _, names in sorted(os.walk(source))
+                for name in sorted(names))
+    for key in keys:
+        match = _key_date.search(key.replace(os.sep, '/'))
+        day = '-'.join(match.groups()) if match else None
+        if day and ((start and day < start) or (end and day > end)):
+            continue
+        yield key
+
+
+def read_chunks(source, key, chunk_size=CHUNK_SIZE):
+    """
+    Yield the bytes of one object in chunks of at most chunk_size.
+    """
+    if source.startswith('s3://'):
+        body = clients.get_client('s3').get_object(Bucket=source[5:].partition('/')[0], Key=key)['Body']
+        for chunk in body.iter_chunks(chunk_size):
+            yield chunk
+        return
+    with open(key, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def iter_documents(chunks, errors=None):
+    """
+    Yield the JSON documents in a stream of byte chunks, whether they are
+    separated by newlines or simply concatenated. Malformed text is skipped
+    up to the next '{' and counted in errors['documents'].
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')('replace')
+    buffer = ''
+    for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        pos = yield from _decode_buffer(decoder, buffer, False, errors)
+        buffer = buffer[pos:]
+    buffer += utf8.decode(b'', final=True)
+    yield from _decode_buffer(decoder, buffer, True, errors)
+
+
+def _decode_buffer(decoder, buffer, final, errors):
+    # yields the complete documents in buffer and returns where the undecoded text starts
+    pos = 0
+    while True:
+        pos = _whitespace.match(buffer, pos).end()
+        if pos == len(buffer):
+            return pos
+        try:
+            document, end = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            if not final and len(buffer) - pos <= MAX_DOCUMENT_CHARS:
+                # probably cut off at the chunk boundary; wait for more
+                return pos
+            if errors is not None:
+                errors['documents'] += 1
+            following = buffer.find('{', pos + 1)
+            pos = following if following >= 0 else len(buffer)
+            continue
+        yield document
+        pos = end
+
+
+def to_rows(documents, errors):
+    """
+    Yield a row tuple (record_type, location, date, session_id, user_id,
+    score, sentiment, confidence, comments) per rating or feedback document.
+    """
+    for document in documents:
+        if isinstance(document, dict) and 'rawData' in document:
+            # a document Firehose failed to deliver, as stored under elasticsearch-failed/
+            try:
+                document = record_format.decode(base64.b64decode(document['rawData']))
+            except ValueError:
+                errors['documents'] += 1
+                continue
+        if not isinstance(document, dict) or document.get('RecordType') not in RECORD_TYPES:
+            errors['records'] += 1
+            continue
+        location, date, session_id = document.get('Location'), document.get('Date'), document.get('ID')
+        if not (location and date and session_id):
+            errors['records'] += 1
+            continue
+        result = document.get('ComprehendSentimentResult') or {}
+        score = document.get('Score')
+        yield (
+            RECORD_TYPES[document['RecordType']],
+            location,
+            date,
+            session_id,
+            document.get('UserId') or '',
+            score if score in SCORES else 0,
+            SENTIMENT_CODES.get(result.get('Sentiment'), -1),
+            float(result.get('Confidence') or 'nan'),
+            document.get('SessionComments') or ''
+        )
+
+
+def batches(rows, size):
+    """
+    Group rows into Batch objects of up to size rows.
+    """
+    pending = []
+    for row in rows:
+        pending.append(row)
+        if len(pending) >= size:
+            yield Batch(pending)
+            pending = []
+    if pending:
+        yield Batch(pending)
+
+
+# --- Columnar batches ---
+
+STRING_COLUMNS = ('location', 'date', 'session_id', 'user_id', 'comments')
+# low-cardinality strings are dictionary encoded; the rest are stored as offsets into one buffer
+DICTIONARY_COLUMNS = ('location', 'date', 'session_id')
+
+
+class Batch(object):
+    """
+    A batch of rows held column by column: strings as lists, numbers as NumPy arrays.
+    """
+
+    def __init__(self, rows):
+        (record_type, self.location, self.date, self.session_id, self.user_id,
+         score, sentiment, confidence, self.comments) = zip(*rows)
+        self.record_type = numpy.array(record_type, dtype=numpy.int8)
+        self.score = numpy.array(score, dtype=numpy.int8)
+        self.sentiment = numpy.array(sentiment, dtype=numpy.int8)
+        self.confidence = numpy.array(confidence, dtype=numpy.float32)
+
+    def __len__(self):
+        return len(self.record_type)
+
+    def write_parquet(self, path):
+        import pyarrow
+        import pyarrow.parquet
+
+        columns = dict((name, pyarrow.array(getattr(self, name))) for name in STRING_COLUMNS)
+        for name in DICTIONARY_COLUMNS:
+            columns[name] = columns[name].dictionary_encode()
+        columns.update(
+            record_type=pyarrow.array(self.record_type), score=pyarrow.array(self.score),
+            sentiment=pyarrow.array(self.sentiment), confidence=pyarrow.array(self.confidence))
+        pyarrow.parquet.write_table(pyarrow.table(columns), path, compression='zstd')
+
+    def write_npz(self, path):
+        arrays = {'record_type': self.record_type, 'score': self.score, 'sentiment': self.sentiment,
+                  'confidence': self.confidence}
+        for name in STRING_COLUMNS:
+            values = getattr(self, name)
+            if name in DICTIONARY_COLUMNS:
+                uniques, codes = numpy.unique(numpy.array(values), return_inverse=True)
+                arrays[name + '.values'] = uniques
+                arrays[name + '.codes'] = codes.astype(numpy.int32)
+            else:
+                encoded = [value.encode('utf-8') for value in values]
+                arrays[name + '.offsets'] = numpy.cumsum([0] + [len(value) for value in encoded], dtype=numpy.int64)
+                arrays[name + '.data'] = numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8)
+        numpy.savez_compressed(path, **arrays)
+
+
+# --- Aggregates ---
+
+class SessionAggregates(object):
+    """
+    Running per-session sums, updated a batch at a time with numpy.bincount.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.count = numpy.zeros(0)
+        self.score_sum = numpy.zeros(0)
+        self.score_sum_of_squares = numpy.zeros(0)
+        self.histogram = numpy.zeros((0, len(SCORES)))
+        self.feedback = numpy.zeros(0)
+        self.sentiments = numpy.zeros((0, len(record_format.SENTIMENTS)))
+        self.polarity_sum = numpy.zeros(0)
+        self._polarity = numpy.array([SENTIMENT_POLARITY[name] for name in record_format.SENTIMENTS])
+
+    def _grow(self, size):
+        extra = size - len(self.count)
+        if extra <= 0:
+            return
+        for name in ('count', 'score_sum', 'score_sum_of_squares', 'feedback', 'polarity_sum'):
+            setattr(self, name, numpy.concatenate([getattr(self, name), numpy.zeros(extra)]))
+        for name in ('histogram', 'sentiments'):
+            current = getattr(self, name)
+            setattr(self, name, numpy.vstack([current, numpy.zeros((extra, current.shape[1]))]))
+
+    def add(self, batch):
+        sessions = self.sessions
+        codes = numpy.fromiter(
+            (sessions.setdefault(key, len(sessions)) for key in zip(batch.location, batch.date, batch.session_id)),
+            dtype=numpy.int64, count=len(batch))
+        size = len(sessions)
+        self._grow(size)
+
+        rated = (batch.record_type == 0) & (batch.score > 0)
+        rated_codes = codes[rated]
+        scores = batch.score[rated].astype(numpy.float64)
+        self.count += numpy.bincount(rated_codes, minlength=size)
+        self.score_sum += numpy.bincount(rated_codes, weights=scores, minlength=size)
+        self.score_sum_of_squares += numpy.bincount(rated_codes, weights=scores * scores, minlength=size)
+        self.histogram += numpy.bincount(
+            rated_codes * len(SCORES) + scores.astype(numpy.int64) - 1,
+            minlength=size * len(SCORES)).reshape(size, len(SCORES))
+
+        scored = (batch.record_type == 1) & (batch.sentiment >= 0)
+        scored_codes = codes[scored]
+        sentiments = batch.sentiment[scored].astype(numpy.int64)
+        self.feedback += numpy.bincount(codes[batch.record_type == 1], minlength=size)
+        self.sentiments += numpy.bincount(
+            scored_codes * len(record_format.SENTIMENTS) + sentiments,
+            minlength=size * len(record_format.SENTIMENTS)).reshape(size, len(record_format.SENTIMENTS))
+        self.polarity_sum += numpy.bincount(
+            scored_codes, weights=self._polarity[sentiments] * numpy.nan_to_num(batch.confidence[scored]),
+            minlength=size)
+
+    def report(self, top=None):
+        """
+        Return the report as a dict: overall distribution, correlation and per-session statistics.
+        """
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            mean = self.score_sum / self.count
+            stddev = numpy.sqrt(numpy.maximum(self.score_sum_of_squares / self.count - mean * mean, 0))
+            scored = self.sentiments.sum(axis=1)
+            mean_polarity = self.polarity_sum / scored
+
+        both = (self.count > 0) & (scored > 0)
+        correlation = None
+        if both.sum() >= 2 and mean[both].std() > 0 and mean_polarity[both].std() > 0:
+            correlation = float(numpy.corrcoef(mean[both], mean_polarity[both])[0, 1])
+
+        keys = sorted(self.sessions, key=self.sessions.get)
+        order = numpy.argsort(-self.count, kind='stable')
+        if top:
+            order = order[:top]
+        return {
+            'sessions': len(keys),
+            'ratings': int(self.count.sum()),
+            'feedback': int(self.feedback.sum()),
+            'score_distribution': dict(zip(SCORES, self.histogram.sum(axis=0).astype(int).tolist())),
+            'sentiment_distribution': dict(zip(record_format.SENTIMENTS, self.sentiments.sum(axis=0).astype(int).tolist())),
+            'score_sentiment_correlation': correlation,
+            'per_session': [
+                {
+                    'location': keys[i][0], 'date': keys[i][1], 'session_id': keys[i][2],
+                    'ratings': int(self.count[i]),
+                    'mean': None if not self.count[i] else round(float(mean[i]), 3),
+                    'stddev': None if not self.count[i] else round(float(stddev[i]), 3),
+                    'histogram': self.histogram[i].astype(int).tolist(),
+                    'feedback': int(self.feedback[i]),
+                    'sentiments': dict(zip(record_format.SENTIMENTS, self.sentiments[i].astype(int).tolist())),
+                    'mean_sentiment': None if not scored[i] else round(float(mean_polarity[i]), 3)
+                }
+                for i in order
+            ]
+        }
+
+
+def print_report(report):
+    print('{} sessions, {} ratings, {} feedback'.format(report['sessions'], report['ratings'], report['feedback']))
+    print('score distribution:     {}'.format(report['score_distribution']))
+    print('sentiment distribution: {}'.format(report['sentiment_distribution']))
+    print('score/sentiment correlation across sessions: {}'.format(
+        'n/a' if report['score_sentiment_correlation'] is None else '{:.3f}'.format(report['score_sentiment_correlation'])))
+    print()
+    print('{:<14} {:<10} {:<32} {:>7} {:>5} {:>6} {:<22} {:>8} {:>9}'.format(
+        'location', 'date', 'session', 'ratings', 'mean', 'stddev', 'histogram 1-5', 'feedback', 'sentiment'))
+    for session in report['per_session']:
+        print('{:<14} {:<10} {:<32} {:>7} {:>5} {:>6} {:<22} {:>8} {:>9}'.format(
+            session['location'][:14], session['date'], session['session_id'][:32], session['ratings'],
+            '-' if session['mean'] is None else '{:.2f}'.format(session['mean']),
+            '-' if session['stddev'] is None else '{:.2f}'.format(session['stddev']),
+            ' '.join(str(n) for n in session['histogram']), session['feedback'],
+            '-' if session['mean_sentiment'] is None else '{:+.2f}'.format(session['mean_sentiment'])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report on the Firehose S3 backup of the ratings stream.')
+    parser.add_argument('source', help='s3://bucket/prefix or a local directory')
+    parser.add_argument('--start', help='first day (YYYY-MM-DD) to read')
+    parser.add_argument('--end', help='last day (YYYY-MM-DD) to read')
+    parser.add_argument('--batch-size', type=int, default=100000, help='rows per columnar batch')
+    parser.add_argument('--columnar', choices=['parquet', 'npz'], help='also write each batch as a columnar file')
+    parser.add_argument('--output', default='columnar', help='directory for columnar files')
+    parser.add_argument('--top', type=int, default=20, help='sessions to show, by number of ratings (0 for all)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    if numpy is None:
+        raise SystemExit('numpy is required: pip install -r tools/requirements.txt')
+    if args.columnar:
+        os.makedirs(args.output, exist_ok=True)
+
+    started = time.monotonic()
+    errors = collections.Counter()
+    totals = collections.Counter()
+
+    def counted(chunks):
+        for chunk in chunks:
+            totals['bytes'] += len(chunk)
+            yield chunk
+
+    def documents():
+        for key in list_objects(args.source, args.start, args.end):
+            totals['objects'] += 1
+            for document in iter_documents(counted(read_chunks(args.source, key)), errors):
+                totals['documents'] += 1
+                yield document
+
+    aggregates = SessionAggregates()
+    for index, batch in enumerate(batches(to_rows(documents(), errors), args.batch_size)):
+        totals['rows'] += len(batch)
+        aggregates.add(batch)
+        if args.columnar:
+            path = os.path.join(args.output, 'part-{:05d}.{}'.format(index, args.columnar))
+            getattr(batch, 'write_' + args.columnar)(path)
+            totals['columnar_files'] += 1
+
+    report = aggregates.report(args.top)
+    elapsed = time.monotonic() - started
+    report['read'] = dict(totals, errors=dict(errors), seconds=round(elapsed, 2),
+                          documents_per_second=round(totals['documents'] / max(elapsed, 1e-9)))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print_report(report)
+    print()
+    print('read {} objects, {} bytes, {} documents in {:.2f}s ({:.0f} documents/s), errors {}'.format(
+        totals['objects'], totals['bytes'], totals['documents'], elapsed, totals['documents'] / max(elapsed, 1e-9),
+        dict(errors)))
+
+
+if __name__ == '__main__':
+    main()
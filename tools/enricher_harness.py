@@ -0,0 +1,135 @@
+"""
+Local harness for sentiment_enricher.
+
+Builds a synthetic Kinesis event of raw SessionFeedback (and SessionRating)
+records, runs sentiment_enricher.lambda_handler against in-process Kinesis
+and Comprehend stand-ins, and checks the result is checkpoint safe: every
+input record is either in the output stream or at/after a sequence number
+reported in batchItemFailures.
+
+    python tools/enricher_harness.py --records 200 --comprehend-failures 3 --kinesis-fail-rate 0.05
+
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('OUTPUT_STREAM_NAME', 'harness-output-stream')
+os.environ.setdefault('AWS_XRAY_SDK_ENABLED', 'false')
+os.environ.setdefault('METRICS_MODE', 'off')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import clients  # noqa: E402
+import record_format  # noqa: E402
+import record_writer  # noqa: E402
+import sentiment_enricher  # noqa: E402
+from tools.stubs import FakeComprehend, FakeKinesis  # noqa: E402
+
+FAIL_MARKER = '[comprehend-error]'
+
+COMMENTS = [
+    "I didn't like it",
+    'Lots of great details',
+    'You spoke too fast',
+    'Should have included a demo',
+    'This was really good',
+    'Very useful session, thanks'
+]
+
+
+def synthetic_records(count, comprehend_failures, rng):
+    failing = set(rng.sample(range(count), min(comprehend_failures, count)))
+    for i in range(count):
+        if i % 5 == 4:
+            yield {'RecordType': 'SessionRating', 'UserId': 'user-{}'.format(i), 'Location': 'London',
+                   'Date': '2018-06-01', 'Score': 1 + i % 5, 'ID': 'Dev405'}
+            continue
+        comment = rng.choice(COMMENTS)
+        if i in failing:
+            comment = '{} {}'.format(comment, FAIL_MARKER)
+        yield {'RecordType': 'SessionFeedback', 'UserId': 'user-{}'.format(i), 'Location': 'London',
+               'Date': '2018-06-01', 'SessionComments': comment, 'ID': 'Dev405'}
+
+
+def kinesis_event(records, aggregate_every=0):
+    """
+    Wrap records in a Kinesis event. With aggregate_every=n, every n records
+    are packed into one KPL aggregated record.
+    """
+    payloads = [json.dumps(record).encode('utf-8') for record in records]
+    if aggregate_every:
+        chunks = [payloads[i:i + aggregate_every] for i in range(0, len(payloads), aggregate_every)]
+        datas = [record_writer.aggregate('harness', chunk) if len(chunk) > 1 else chunk[0] for chunk in chunks]
+    else:
+        datas = payloads
+    return {'Records': [
+        {
+            'eventSource': 'aws:kinesis',
+            'kinesis': {
+                'partitionKey': 'harness',
+                'sequenceNumber': str(1000 + i),
+                'data': base64.b64encode(data).decode('ascii')
+            }
+        }
+        for i, data in enumerate(datas)
+    ]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Feed synthetic stream batches to sentiment_enricher.')
+    parser.add_argument('--records', type=int, default=100)
+    parser.add_argument('--comprehend-failures', type=int, default=0)
+    parser.add_argument('--kinesis-fail-rate', type=float, default=0.0)
+    parser.add_argument('--aggregate-every', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    records = list(synthetic_records(args.records, args.comprehend_failures, rng))
+    event = kinesis_event(records, args.aggregate_every)
+
+    kinesis = FakeKinesis(fail_rate=args.kinesis_fail_rate, seed=args.seed)
+    comprehend = FakeComprehend(fail_marker=FAIL_MARKER)
+    clients.set_client('kinesis', kinesis)
+    clients.set_client('comprehend', comprehend)
+    # keep the harness fast when simulating throttling
+    sentiment_enricher.stream_writer.retry_base_delay = 0
+
+    result = sentiment_enricher.lambda_handler(event, None)
+
+    failures = [int(item['itemIdentifier']) for item in result['batchItemFailures']]
+    checkpoint = min(failures) if failures else None
+    delivered = [record_format.decode(entry['Data']) for entry in kinesis.records]
+    delivered_users = set(record['UserId'] for record in delivered)
+
+    # every record before the checkpoint must have been delivered, enriched if it is feedback
+    records_per_sequence = args.aggregate_every or 1
+    lost = []
+    for i, record in enumerate(records):
+        sequence_number = 1000 + i // records_per_sequence
+        if checkpoint is not None and sequence_number >= checkpoint:
+            continue
+        if record['UserId'] not in delivered_users:
+            lost.append(record['UserId'])
+    unenriched = [record['UserId'] for record in delivered
+                  if record['RecordType'] == 'SessionFeedback' and 'ComprehendSentimentResult' not in record]
+
+    print('input records:          {} in {} kinesis records'.format(len(records), len(event['Records'])))
+    print('delivered records:      {}'.format(len(delivered)))
+    print('comprehend calls:       {} for {} texts'.format(comprehend.calls, comprehend.texts))
+    print('kinesis put_records:    {}'.format(kinesis.calls))
+    print('batchItemFailures:      {}'.format(failures))
+    print('checkpoint safe:        {}'.format(not lost and not unenriched))
+    if lost or unenriched:
+        print('lost before checkpoint: {} unenriched: {}'.format(lost, unenriched))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
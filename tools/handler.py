@@ -0,0 +1,59 @@
+"""
+Load rating-bot.py (whose name isn't a valid module name) for local tools,
+with placeholder environment variables and in-process AWS stand-ins.
+"""
+
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+LOCAL_ENVIRONMENT = {
+    'STREAM_NAME': 'local-ratings-stream',
+    'TABLE_NAME': 'local-sessions-table',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_XRAY_SDK_ENABLED': 'false',
+    'XRAY_PATCH': 'none',
+    'PREWARM_CLIENTS': '',
+    'METRICS_MODE': 'off',
+    # the benchmarks replay identical fulfillments, which dedupe would suppress after the first
+    'DEDUPE_MODE': 'off',
+    'LOG_LEVEL': 'WARNING'
+}
+
+
+def install_stubs(kinesis=None, comprehend=None, dynamodb=None):
+    """
+    Point the shared client registry at stand-ins (new ones unless given) and return them.
+    """
+    import clients
+    from tools.stubs import FakeComprehend, FakeDynamoDB, FakeKinesis
+
+    stubs = {
+        'kinesis': kinesis or FakeKinesis(),
+        'comprehend': comprehend or FakeComprehend(),
+        'dynamodb': dynamodb or FakeDynamoDB()
+    }
+    for service, client in stubs.items():
+        clients.set_client(service, client)
+    return stubs
+
+
+def load_handler(environment=None, module_name='rating_bot'):
+    """
+    Import rating-bot.py as module_name. Variables in environment override the
+    local defaults; variables already set in os.environ are kept.
+    """
+    for name, value in LOCAL_ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    os.environ.update(environment or {})
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, 'rating-bot.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,108 @@
+"""
+Cold start report for the rating-bot functions.
+
+Imports a handler module in a fresh interpreter under `python -X importtime`
+and breaks the cost down per top-level package (self time, so nothing is
+counted twice), together with the total wall-clock time of module
+initialisation including X-Ray patching and client pre-warming.
+
+    python tools/importtime_report.py
+    python tools/importtime_report.py --handler sentiment_enricher --json report.json
+    python tools/importtime_report.py --budget-ms 400     # exit 1 if init is slower
+
+Run it with the same XRAY_PATCH / PREWARM_CLIENTS settings as the function to
+compare configurations, e.g. XRAY_PATCH=all.
+
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs in the child interpreter; prints the init wall time on its last line
+CHILD_SCRIPT = """
+import os, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+if {handler!r} == 'rating-bot':
+    import importlib.util
+    spec = importlib.util.spec_from_file_location('rating_bot', os.path.join({root!r}, 'rating-bot.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+else:
+    __import__({handler!r})
+print('INIT_SECONDS', time.perf_counter() - start)
+"""
+
+CHILD_ENVIRONMENT = {
+    'STREAM_NAME': 'importtime-stream',
+    'OUTPUT_STREAM_NAME': 'importtime-stream',
+    'TABLE_NAME': 'importtime-table',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'importtime',
+    'AWS_SECRET_ACCESS_KEY': 'importtime',
+    'AWS_XRAY_SDK_ENABLED': 'false',
+    'LOG_LEVEL': 'WARNING'
+}
+
+
+def measure(handler):
+    env = dict(CHILD_ENVIRONMENT)
+    env.update(os.environ)
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT.format(root=ROOT, handler=handler)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, cwd=ROOT, universal_newlines=True)
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit('importing {} failed'.format(handler))
+
+    packages = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+
+    init_seconds = float([line for line in proc.stdout.splitlines() if line.startswith('INIT_SECONDS')][-1].split()[1])
+    return packages, init_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Break down handler cold start cost per module.')
+    parser.add_argument('--handler', default='rating-bot', help="'rating-bot' or an importable module name")
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--json', help='also write the report to this file')
+    parser.add_argument('--budget-ms', type=float, help='exit with status 1 if init takes longer than this')
+    args = parser.parse_args()
+
+    packages, init_seconds = measure(args.handler)
+    import_ms = sum(packages.values()) / 1000.0
+    init_ms = init_seconds * 1000
+
+    print('{} cold start: {:.1f} ms init, {:.1f} ms of it importing'.format(args.handler, init_ms, import_ms))
+    print('{:<24} {:>10} {:>7}'.format('package', 'self ms', 'share'))
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print('{:<24} {:>10.1f} {:>6.1f}%'.format(package, self_us / 1000.0, 100.0 * self_us / 1000.0 / import_ms))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'handler': args.handler,
+                'init_ms': init_ms,
+                'import_ms': import_ms,
+                'packages_ms': dict((package, self_us / 1000.0) for package, self_us in packages.items()),
+                'settings': dict((name, os.environ.get(name)) for name in ('XRAY_PATCH', 'PREWARM_CLIENTS'))
+            }, f, indent=2, sort_keys=True)
+
+    if args.budget_ms is not None and init_ms > args.budget_ms:
+        print('init took {:.1f} ms, over the {:.1f} ms budget'.format(init_ms, args.budget_ms))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+"""
+Multi-turn conversation load simulator for the rating-bot fulfillment function.
+
+Simulates attendees rating (and leaving feedback on) a session in a burst,
+e.g. 3,000 people rating the keynote within five minutes. Each attendee runs
+a whole Lex dialog through lambda_handler: DialogCodeHook turns that fill
+the slots one at a time, carrying sessionAttributes from each response into
+the next request, re-eliciting when an answer is invalid (a score of 9, a
+date in the future, an unknown city, a session title the catalog doesn't
+recognise), and finally the FulfillmentCodeHook that writes to Kinesis.
+
+Conversations run across a process pool, each process standing in for one
+warm Lambda container. Comprehend and DynamoDB are in-process stand-ins per
+process; Kinesis is a single ThrottledKinesis (tools/stubs.py) shared by all
+processes through a multiprocessing manager, which enforces the per-shard
+limits of 1 MB/s and 1,000 records/s and throttles writes over them.
+
+Every combination of --shards and --strategies is simulated in turn and
+reported with achieved throughput, throttle rate and turn latency:
+
+    python tools/loadsim.py
+    python tools/loadsim.py --attendees 20000 --window 60 --shards 1,2,4 --strategies session,random
+    python tools/loadsim.py --time-scale 1 --json loadsim.json
+
+--time-scale compresses the simulated window (and speeds up the stand-in's
+clock to match), so a five minute burst doesn't take five minutes to replay.
+Start lag shows how far behind schedule conversations started; if it grows,
+add --processes. Records that stay throttled past the delivery budget are
+spilled (to a temporary directory shared by the workers) and replayed by
+later turns; the report counts them, and any still spilled at the end.
+
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing.managers import BaseManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks import events  # noqa: E402
+from tools.stubs import ThrottledKinesis  # noqa: E402
+
+KEYNOTE = 'KEY101 Opening keynote'
+CATALOG = [(KEYNOTE, 'London')] + events.CATALOG
+
+# the order Lex elicits each intent's slots in
+SLOT_ORDER = {
+    'RateSession': ['SessionLocation', 'SessionDate', 'SessionID', 'SessionScore'],
+    'ProvideFeedback': ['SessionLocation', 'SessionDate', 'SessionID', 'SessionComments']
+}
+
+COMMENTS = [
+    'Really good overview, loved the demos',
+    'Too fast for me, but useful slides',
+    'Great speaker and great examples',
+    'A bit boring in the middle section',
+    'Excellent, I learned a lot about the new services'
+]
+
+# a conversation that hasn't finished after this many turns is abandoned
+MAX_TURNS = 12
+
+
+class LoadSimManager(BaseManager):
+    pass
+
+
+LoadSimManager.register('ThrottledKinesis', ThrottledKinesis)
+
+# per worker process state, set by init_worker
+_worker = {}
+
+DELIVERY_COUNTERS = ('spilled_records', 'replayed_records', 'dropped_records')
+
+
+def valid_answer(slot, rng):
+    today = datetime.date.today()
+    if slot == 'SessionLocation':
+        return 'London'
+    if slot == 'SessionDate':
+        return today.isoformat()
+    if slot == 'SessionID':
+        # nearly everyone is rating the keynote
+        return 'KEY101' if rng.random() < 0.9 else rng.choice(events.CATALOG)[0].split()[0]
+    if slot == 'SessionScore':
+        return str(rng.choice([3, 4, 4, 5, 5, 5]))
+    return rng.choice(COMMENTS)
+
+
+def invalid_answer(slot, rng):
+    if slot == 'SessionLocation':
+        return 'Atlantis'
+    if slot == 'SessionDate':
+        return (datetime.date.today() + datetime.timedelta(days=3)).isoformat()
+    if slot == 'SessionID':
+        return 'the one about containers'
+    if slot == 'SessionScore':
+        return '9'
+    return 'ok'
+
+
+def init_worker(kinesis, environment, started, time_scale, think_time):
+    os.environ.update(environment)
+
+    import clients
+    from tools.handler import install_stubs, load_handler
+
+    handler = load_handler()
+    stubs = install_stubs()
+    events.seed_catalog(stubs['dynamodb'], os.environ['TABLE_NAME'], catalog=CATALOG)
+    clients.set_client('kinesis', kinesis)
+    _worker.update(handler=handler, started=started, time_scale=time_scale, think_time=think_time)
+
+
+def run_conversation(task):
+    """
+    Run one attendee's dialog. Returns a summary with per-turn latencies.
+    """
+    index, offset, intent, invalid_rate = task
+    handler = _worker['handler']
+    time_scale = _worker['time_scale']
+    rng = random.Random(index)
+
+    # wait for the attendee's (scaled) arrival time
+    due = _worker['started'] + offset / time_scale
+    lag = max(0.0, time.time() - due)
+    if not lag:
+        time.sleep(due - time.time())
+
+    writer_stats = handler.stream_writer.stats
+    delivery_before = [writer_stats[counter] for counter in DELIVERY_COUNTERS]
+
+    slots = dict((slot, None) for slot in SLOT_ORDER[intent])
+    session_attributes = {}
+    latencies = []
+    elicitations = 0
+    source = 'DialogCodeHook'
+    next_slot = SLOT_ORDER[intent][0]
+
+    def summary(completed, error):
+        delivery = dict((counter, writer_stats[counter] - before)
+                        for counter, before in zip(DELIVERY_COUNTERS, delivery_before))
+        return dict(delivery, latencies=latencies, elicitations=elicitations, lag=lag, completed=completed, error=error)
+
+    for _ in range(MAX_TURNS):
+        if next_slot:
+            answer = invalid_answer(next_slot, rng) if rng.random() < invalid_rate else valid_answer(next_slot, rng)
+            slots[next_slot] = answer
+        event = events.lex_event(intent, source, slots, session_attributes)
+        event['userId'] = 'attendee-{}'.format(index)
+
+        started = time.perf_counter()
+        try:
+            response = handler.lambda_handler(event, None)
+        except Exception as e:
+            latencies.append(time.perf_counter() - started)
+            return summary(False, type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+        session_attributes = response.get('sessionAttributes') or {}
+        action = response['dialogAction']
+        if action['type'] == 'Close':
+            return summary(source == 'FulfillmentCodeHook', None)
+
+        slots = dict(action.get('slots') or slots)
+        if action['type'] == 'ElicitSlot':
+            elicitations += 1
+            next_slot = action['slotToElicit']
+            card = action.get('responseCard')
+            if card:
+                # pick a button, as most users do when offered a card
+                slots[next_slot] = card['genericAttachments'][0]['buttons'][0]['value']
+                next_slot = None
+            continue
+
+        # Delegate: Lex elicits the next empty slot, or fulfills once all are filled
+        next_slot = next((slot for slot in SLOT_ORDER[intent] if not slots.get(slot)), None)
+        if next_slot is None:
+            source = 'FulfillmentCodeHook'
+        if _worker['think_time']:
+            time.sleep(_worker['think_time'] / time_scale)
+
+    return summary(False, 'TooManyTurns')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def simulate(args, shard_count, strategy):
+    rng = random.Random(args.seed)
+    tasks = sorted(
+        ((i, rng.uniform(0, args.window), 'ProvideFeedback' if rng.random() < args.feedback_share else 'RateSession',
+          args.invalid_rate) for i in range(args.attendees)),
+        key=lambda task: task[1])
+
+    spill_directory = tempfile.mkdtemp(prefix='loadsim-spill-')
+    manager = LoadSimManager()
+    manager.start()
+    try:
+        kinesis = manager.ThrottledKinesis(shard_count, records_per_second=args.shard_records_per_second,
+                                           time_scale=args.time_scale)
+        environment = {
+            'SHARD_COUNT': str(shard_count),
+            'PARTITION_STRATEGY': strategy,
+            'SENTIMENT_MODE': 'inline',
+            'KINESIS_AGGREGATE': 'true' if args.aggregate else 'false',
+            'KINESIS_SPILL_DIR': spill_directory
+        }
+        started = time.time() + 1.0
+        pool = multiprocessing.Pool(args.processes, init_worker,
+                                    (kinesis, environment, started, args.time_scale, args.think_time))
+        try:
+            results = list(pool.imap_unordered(run_conversation, tasks, chunksize=1))
+        finally:
+            pool.close()
+            pool.join()
+        elapsed = time.time() - started
+        kinesis_stats = kinesis.stats()
+        still_spilled = 0
+        for name in os.listdir(spill_directory):
+            with open(os.path.join(spill_directory, name)) as f:
+                still_spilled += sum(1 for _ in f)
+    finally:
+        manager.shutdown()
+        shutil.rmtree(spill_directory, ignore_errors=True)
+
+    latencies = sorted(latency for result in results for latency in result['latencies'])
+    accepted = sum(kinesis_stats['accepted'])
+    throttled = sum(kinesis_stats['throttled'])
+    simulated_seconds = elapsed * args.time_scale
+    errors = {}
+    for result in results:
+        if result['error']:
+            errors[result['error']] = errors.get(result['error'], 0) + 1
+    return {
+        'shards': shard_count,
+        'strategy': strategy,
+        'conversations': len(results),
+        'completed': sum(1 for result in results if result['completed']),
+        'errors': errors,
+        'turns': len(latencies),
+        'elicitations': sum(result['elicitations'] for result in results),
+        'spilled': sum(result['spilled_records'] for result in results),
+        'replayed': sum(result['replayed_records'] for result in results),
+        'dropped': sum(result['dropped_records'] for result in results),
+        'still_spilled': still_spilled,
+        'records_accepted': accepted,
+        'throttled_attempts': throttled,
+        'throttle_rate': throttled / float(accepted + throttled) if accepted + throttled else 0.0,
+        'records_per_second': accepted / simulated_seconds if simulated_seconds else 0.0,
+        'hot_shard_share': max(kinesis_stats['accepted']) / float(accepted) if accepted else 0.0,
+        'peak_shard_records_per_second': max(kinesis_stats['peak_records_per_second']),
+        'turn_p50_ms': percentile(latencies, 0.5) * 1000,
+        'turn_p95_ms': percentile(latencies, 0.95) * 1000,
+        'turn_p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_start_lag_s': max(result['lag'] for result in results) * args.time_scale if results else 0.0,
+        'kinesis': kinesis_stats
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate a burst of multi-turn rating conversations.')
+    parser.add_argument('--attendees', type=int, default=3000)
+    parser.add_argument('--window', type=float, default=300, help='seconds over which attendees arrive')
+    parser.add_argument('--time-scale', type=float, default=30, help='replay the window this many times faster')
+    parser.add_argument('--shards', default='1,2,4', help='comma separated shard counts')
+    parser.add_argument('--strategies', default='session,user,random', help='comma separated partition strategies')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--invalid-rate', type=float, default=0.1, help='chance each answer is invalid')
+    parser.add_argument('--feedback-share', type=float, default=0.3, help='share of attendees leaving feedback')
+    parser.add_argument('--think-time', type=float, default=0.0, help='simulated seconds between turns')
+    parser.add_argument('--shard-records-per-second', type=int, default=1000,
+                        help='per-shard record limit of the Kinesis stand-in (Kinesis allows 1,000)')
+    parser.add_argument('--aggregate', action='store_true', help='run with KINESIS_AGGREGATE=true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    reports = []
+    print('{:>6} {:<8} {:>6} {:>6} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+        'shards', 'strategy', 'convs', 'done', 'rec/s', 'throttle', 'hot', 'peak/s', 'p50 ms', 'p95 ms', 'p99 ms', 'lag s'))
+    for shard_count in [int(value) for value in args.shards.split(',')]:
+        for strategy in args.strategies.split(','):
+            report = simulate(args, shard_count, strategy)
+            reports.append(report)
+            print('{:>6} {:<8} {:>6} {:>6} {:>8.1f} {:>7.1%} {:>7.0%} {:>8} {:>8.2f} {:>8.2f} {:>8.2f} {:>8.1f}'.format(
+                shard_count, strategy, report['conversations'], report['completed'], report['records_per_second'],
+                report['throttle_rate'], report['hot_shard_share'], report['peak_shard_records_per_second'],
+                report['turn_p50_ms'], report['turn_p95_ms'], report['turn_p99_ms'], report['max_start_lag_s']))
+            if report['errors']:
+                print('       errors: {}'.format(report['errors']))
+            if report['spilled']:
+                print('       spilled {spilled}, replayed {replayed}, dropped {dropped}, '
+                      'still spilled at the end {still_spilled}'.format(**report))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'settings': vars(args), 'results': reports}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""
+In-process stand-ins for the AWS clients used by the rating-bot functions.
+
+They implement just the calls the functions make, with the same request and
+response shapes, so handlers can be exercised locally without AWS. Install
+them with clients.set_client(), e.g.
+
+    clients.set_client('kinesis', FakeKinesis())
+
+"""
+
+import random
+import re
+import time
+
+from partitioning import md5_hash_key, shard_for_hash
+
+
+class FakeKinesis(object):
+    """
+    Records every put_records call. fail_rate makes that fraction of records
+    fail with ProvisionedThroughputExceededException; keep_records=False only
+    counts them, for long local runs.
+    """
+
+    def __init__(self, fail_rate=0.0, seed=0, keep_records=True):
+        self.fail_rate = fail_rate
+        self.keep_records = keep_records
+        self.accepted = 0
+        self.random = random.Random(seed)
+        self.records = []
+        self.calls = 0
+        self._sequence = 0
+
+    def put_records(self, StreamName, Records):
+        self.calls += 1
+        results = []
+        for entry in Records:
+            if self.fail_rate and self.random.random() < self.fail_rate:
+                results.append({
+                    'ErrorCode': 'ProvisionedThroughputExceededException',
+                    'ErrorMessage': 'Rate exceeded for shard shardId-000000000000'
+                })
+                continue
+            self._sequence += 1
+            self.accepted += 1
+            if self.keep_records:
+                self.records.append(dict(entry, StreamName=StreamName))
+            results.append({'ShardId': 'shardId-000000000000', 'SequenceNumber': str(self._sequence)})
+        return {
+            'FailedRecordCount': sum(1 for result in results if 'ErrorCode' in result),
+            'Records': results
+        }
+
+
+class ThrottledKinesis(object):
+    """
+    Kinesis stand-in that enforces the per-shard write limits (1 MB/s and
+    1,000 records/s by default) on a stream of shard_count evenly split
+    shards, failing records over the limit with
+    ProvisionedThroughputExceededException as Kinesis does.
+
+    time_scale > 1 speeds the clock up, e.g. a 5 minute burst replayed in 30
+    seconds uses time_scale=10 and still sees the real per-shard limits.
+    Only counters are kept, not the records themselves.
+    """
+
+    MAX_RECORDS_PER_CALL = 500
+
+    def __init__(self, shard_count=1, records_per_second=1000, bytes_per_second=1024 * 1024, time_scale=1.0):
+        self.shard_count = shard_count
+        self.records_per_second = records_per_second
+        self.bytes_per_second = bytes_per_second
+        self.time_scale = time_scale
+        self._started = time.monotonic()
+        # shard -> [second, records, bytes] for the current (scaled) second
+        self._windows = [[0, 0, 0] for _ in range(shard_count)]
+        self.calls = 0
+        self.accepted = [0] * shard_count
+        self.throttled = [0] * shard_count
+        self.accepted_bytes = [0] * shard_count
+        self.peak_records_per_second = [0] * shard_count
+        self.peak_bytes_per_second = [0] * shard_count
+
+    def _now(self):
+        return (time.monotonic() - self._started) * self.time_scale
+
+    def put_records(self, StreamName, Records):
+        if len(Records) > self.MAX_RECORDS_PER_CALL:
+            raise ValueError('put_records accepts at most 500 records')
+        self.calls += 1
+        second = int(self._now())
+        results = []
+        for entry in Records:
+            hash_key = int(entry['ExplicitHashKey']) if entry.get('ExplicitHashKey') else md5_hash_key(entry['PartitionKey'])
+            shard = shard_for_hash(hash_key, self.shard_count)
+            size = len(entry['Data']) + len(entry['PartitionKey'].encode('utf-8'))
+            window = self._windows[shard]
+            if window[0] != second:
+                window[:] = [second, 0, 0]
+            if window[1] + 1 > self.records_per_second or window[2] + size > self.bytes_per_second:
+                self.throttled[shard] += 1
+                results.append({
+                    'ErrorCode': 'ProvisionedThroughputExceededException',
+                    'ErrorMessage': 'Rate exceeded for shard shardId-{:012d}'.format(shard)
+                })
+                continue
+            window[1] += 1
+            window[2] += size
+            self.peak_records_per_second[shard] = max(self.peak_records_per_second[shard], window[1])
+            self.peak_bytes_per_second[shard] = max(self.peak_bytes_per_second[shard], window[2])
+            self.accepted[shard] += 1
+            self.accepted_bytes[shard] += size
+            results.append({'ShardId': 'shardId-{:012d}'.format(shard), 'SequenceNumber': str(sum(self.accepted))})
+        return {
+            'FailedRecordCount': sum(1 for result in results if 'ErrorCode' in result),
+            'Records': results
+        }
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'elapsed_seconds': self._now(),
+            'accepted': list(self.accepted),
+            'throttled': list(self.throttled),
+            'accepted_bytes': list(self.accepted_bytes),
+            'peak_records_per_second': list(self.peak_records_per_second),
+            'peak_bytes_per_second': list(self.peak_bytes_per_second)
+        }
+
+
+class FakeComprehend(object):
+    """
+    Scores text with a tiny keyword rule. Texts containing fail_marker are
+    reported in the ErrorList of batch_detect_sentiment.
+    """
+
+    NEGATIVE_WORDS = ('bad', 'boring', 'too fast', 'too long', "didn't like", 'poor')
+    POSITIVE_WORDS = ('great', 'good', 'useful', 'excellent', 'loved', 'really good')
+
+    def __init__(self, fail_marker=None):
+        self.fail_marker = fail_marker
+        self.calls = 0
+        self.texts = 0
+
+    def _score(self, text):
+        lowered = text.lower()
+        if any(word in lowered for word in self.NEGATIVE_WORDS):
+            return 'NEGATIVE', {'Positive': 0.05, 'Negative': 0.85, 'Neutral': 0.05, 'Mixed': 0.05}
+        if any(word in lowered for word in self.POSITIVE_WORDS):
+            return 'POSITIVE', {'Positive': 0.92, 'Negative': 0.02, 'Neutral': 0.04, 'Mixed': 0.02}
+        return 'NEUTRAL', {'Positive': 0.1, 'Negative': 0.1, 'Neutral': 0.75, 'Mixed': 0.05}
+
+    def detect_sentiment(self, Text, LanguageCode):
+        self.calls += 1
+        self.texts += 1
+        sentiment, score = self._score(Text)
+        return {'Sentiment': sentiment, 'SentimentScore': score, 'ResponseMetadata': {}}
+
+    def batch_detect_sentiment(self, TextList, LanguageCode):
+        if len(TextList) > 25:
+            raise ValueError('batch_detect_sentiment accepts at most 25 documents')
+        self.calls += 1
+        self.texts += len(TextList)
+        results = []
+        errors = []
+        for index, text in enumerate(TextList):
+            if self.fail_marker and self.fail_marker in text:
+                errors.append({'Index': index, 'ErrorCode': 'InternalServerException', 'ErrorMessage': 'stub failure'})
+                continue
+            sentiment, score = self._score(text)
+            results.append({'Index': index, 'Sentiment': sentiment, 'SentimentScore': score})
+        return {'ResultList': results, 'ErrorList': errors, 'ResponseMetadata': {}}
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class _DynamoDBExceptions(object):
+    ConditionalCheckFailedException = ConditionalCheckFailedException
+
+
+_condition_token = re.compile(r'\s*(\(|\)|,|<=|>=|<>|<|>|=|[#:]?[A-Za-z_][A-Za-z0-9_]*)')
+
+
+class _Condition(object):
+    """
+    Evaluates the subset of condition expressions the functions use:
+    attribute_exists/attribute_not_exists, comparisons, AND, OR, NOT and parentheses.
+    """
+
+    def __init__(self, expression, names, values):
+        self.tokens = _condition_token.findall(expression)
+        self.names = names or {}
+        self.values = values or {}
+
+    def evaluate(self, item):
+        self.item = item
+        self.pos = 0
+        return self._or()
+
+    def _next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _or(self):
+        result = self._and()
+        while self._peek() == 'OR':
+            self._next()
+            result = self._and() or result
+        return result
+
+    def _and(self):
+        result = self._not()
+        while self._peek() == 'AND':
+            self._next()
+            result = self._not() and result
+        return result
+
+    def _not(self):
+        if self._peek() == 'NOT':
+            self._next()
+            return not self._not()
+        return self._comparison()
+
+    def _operand(self):
+        token = self._next()
+        if token.startswith(':'):
+            return self.values[token]
+        return self.item.get(self.names.get(token, token))
+
+    def _comparison(self):
+        token = self._peek()
+        if token == '(':
+            self._next()
+            result = self._or()
+            self._next()
+            return result
+        if token in ('attribute_exists', 'attribute_not_exists'):
+            self._next()
+            self._next()
+            name = self._next()
+            self._next()
+            exists = self.names.get(name, name) in self.item
+            return exists if token == 'attribute_exists' else not exists
+        left = self._operand()
+        operator = self._next()
+        right = self._operand()
+        if left is None or right is None:
+            return operator == '<>'
+        if 'N' in left and 'N' in right:
+            left, right = float(left['N']), float(right['N'])
+        else:
+            left, right = list(left.values())[0], list(right.values())[0]
+        return {
+            '=': left == right, '<>': left != right, '<': left < right,
+            '<=': left <= right, '>': left > right, '>=': left >= right
+        }[operator]
+
+
+class FakeDynamoDB(object):
+    """
+    Low-level client stand-in holding items in memory, keyed by table and
+    (FullDate, Title). Updates support ADD and SET (including if_not_exists)
+    and condition expressions raise exceptions.ConditionalCheckFailedException
+    like the real client.
+    """
+
+    exceptions = _DynamoDBExceptions
+
+    def __init__(self):
+        self.tables = {}
+        self.calls = {}
+
+    def _count(self, operation):
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+
+    def _table(self, name):
+        return self.tables.setdefault(name, {})
+
+    @staticmethod
+    def _key(key):
+        return key['FullDate']['S'], key['Title']['S']
+
+    def get_item(self, TableName, Key, **kwargs):
+        self._count('get_item')
+        item = self._table(TableName).get(self._key(Key))
+        return {'Item': dict(item)} if item else {}
+
+    def _check(self, item, ConditionExpression=None, ExpressionAttributeNames=None,
+               ExpressionAttributeValues=None, **kwargs):
+        if ConditionExpression and not _Condition(
+                ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues).evaluate(item):
+            raise ConditionalCheckFailedException('The conditional request failed')
+
+    def put_item(self, TableName, Item, **kwargs):
+        self._count('put_item')
+        table = self._table(TableName)
+        self._check(table.get(self._key(Item), {}), **kwargs)
+        table[self._key(Item)] = dict(Item)
+        return {}
+
+    def delete_item(self, TableName, Key, **kwargs):
+        self._count('delete_item')
+        table = self._table(TableName)
+        self._check(table.get(self._key(Key), {}), **kwargs)
+        table.pop(self._key(Key), None)
+        return {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, **kwargs):
+        # ADD of numbers and SET (optionally with if_not_exists) only
+        self._count('update_item')
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        table = self._table(TableName)
+        item = dict(table.get(self._key(Key), Key))
+        self._check(item, ExpressionAttributeNames=names, ExpressionAttributeValues=values, **kwargs)
+        for clause, actions in re.findall(r'(ADD|SET)\s+(.*?)(?=\s+(?:ADD|SET)\s|$)', UpdateExpression):
+            for action in re.split(r',\s*(?![^(]*\))', actions):
+                if clause == 'ADD':
+                    name, value = action.split()
+                    name = names.get(name, name)
+                    total = float(item[name]['N']) if name in item else 0
+                    total += float(values[value]['N'])
+                    item[name] = {'N': str(int(total)) if total == int(total) else repr(total)}
+                    continue
+                name, value = [part.strip() for part in action.split('=', 1)]
+                name = names.get(name, name)
+                default = re.match(r'if_not_exists\(\s*([#:\w]+)\s*,\s*([#:\w]+)\s*\)', value)
+                if default:
+                    if name in item:
+                        continue
+                    value = default.group(2)
+                item[name] = values[value]
+        table[self._key(Key)] = item
+        return {}
+
+    def scan(self, TableName, IndexName=None, ProjectionExpression=None, ExclusiveStartKey=None, **kwargs):
+        self._count('scan')
+        items = list(self._table(TableName).values())
+        if IndexName == 'Cities':
+            items = [{'LocationCity': item['LocationCity']} for item in items if 'LocationCity' in item]
+        return {'Items': items, 'Count': len(items)}
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues, **kwargs):
+        # only the 'FullDate = :value' condition used by the catalog is supported
+        self._count('query')
+        full_date = list(ExpressionAttributeValues.values())[0]['S']
+        items = [dict(item) for (hash_key, _), item in sorted(self._table(TableName).items()) if hash_key == full_date]
+        return {'Items': items, 'Count': len(items)}